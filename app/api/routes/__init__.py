@@ -1,2 +1,3 @@
 from app.api.routes.message_routes import router as message_router
-from app.api.routes.conversation_routes import router as conversation_router 
\ No newline at end of file
+from app.api.routes.conversation_routes import router as conversation_router
+from app.api.routes.realtime_routes import router as realtime_router
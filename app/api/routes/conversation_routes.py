@@ -1,10 +1,13 @@
-from fastapi import APIRouter, Depends, Query, Path
+from fastapi import APIRouter, Body, Depends, Query, Path
 from typing import Optional
 
 from app.controllers.conversation_controller import ConversationController
+from app.util.json_response import FastJSONResponse
 from app.schemas.conversation import (
     ConversationResponse,
-    PaginatedConversationResponse
+    PaginatedConversationResponse,
+    ReadMarkerRequest,
+    ReadMarkerResponse
 )
 
 router = APIRouter(prefix="/api/conversations", tags=["Conversations"])
@@ -12,19 +15,32 @@ router = APIRouter(prefix="/api/conversations", tags=["Conversations"])
 @router.get("/user/{user_id}", response_model=PaginatedConversationResponse)
 async def get_user_conversations(
     user_id: str = Path(..., description="ID of the user (uuid)"),
-    limit: int = Query(20, description="Number of conversations per page"),
-    before_conversation_id: Optional[str] = Query(None, description="Get conversations before this conversation_id (uuid)"),
+    limit: int = Query(20, ge=1, le=100, description="Number of conversations per page (at most 100)"),
+    before_conversation_id: Optional[str] = Query(None, description="Get conversations after this conversation_id (uuid) in recency order"),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
     conversation_controller: ConversationController = Depends()
-) -> PaginatedConversationResponse:
+) -> FastJSONResponse:
     """
-    Get all conversations for a user with cursor-based pagination
+    Get all conversations for a user, most recent first, with cursor-based pagination
     """
     return await conversation_controller.get_user_conversations(
         user_id=user_id,
         limit=limit,
-        before_conversation_id=before_conversation_id
+        before_conversation_id=before_conversation_id,
+        cursor=cursor
     )
 
+@router.post("/{conversation_id}/read", response_model=ReadMarkerResponse)
+async def mark_conversation_read(
+    conversation_id: str = Path(..., description="ID of the conversation (uuid)"),
+    request: ReadMarkerRequest = Body(...),
+    conversation_controller: ConversationController = Depends()
+) -> ReadMarkerResponse:
+    """
+    Mark a conversation read by a user up to a message; unread counts in the user's conversation list restart from there
+    """
+    return await conversation_controller.mark_read(conversation_id, request)
+
 @router.get("/{conversation_id}", response_model=ConversationResponse)
 async def get_conversation(
     conversation_id: str = Path(..., description="ID of the conversation (uuid)"),
@@ -1,12 +1,18 @@
-from fastapi import APIRouter, Depends, Query, Path, Body
-from typing import Optional
+from fastapi import APIRouter, Depends, Query, Path, Body, Header
+from fastapi.responses import StreamingResponse
+from typing import List, Optional
 from datetime import datetime
 
 from app.controllers.message_controller import MessageController
+from app.util.json_response import FastJSONResponse
 from app.schemas.message import (
     MessageCreate, 
     MessageResponse, 
-    PaginatedMessageResponse
+    PaginatedMessageResponse,
+    BulkMessageResponse,
+    BatchGetMessagesRequest,
+    BatchGetMessagesResponse,
+    SearchMessagesResponse
 )
 
 router = APIRouter(prefix="/api/messages", tags=["Messages"])
@@ -21,13 +27,52 @@ async def send_message(
     """
     return await message_controller.send_message(message)
 
+@router.post("/bulk", response_model=BulkMessageResponse)
+async def send_messages(
+    messages: List[MessageCreate] = Body(..., description="Messages to send (at most 1000)"),
+    message_controller: MessageController = Depends()
+) -> BulkMessageResponse:
+    """
+    Send many messages in one request, with a result per message
+    """
+    return await message_controller.send_messages(messages)
+
+@router.post("/conversations:batchGet", response_model=BatchGetMessagesResponse)
+async def batch_get_conversation_messages(
+    request: BatchGetMessagesRequest = Body(...),
+    message_controller: MessageController = Depends()
+) -> FastJSONResponse:
+    """
+    Get a page of messages for each of several conversations (e.g. inbox previews) in one request
+    """
+    return await message_controller.batch_get_conversation_messages(request)
+
+@router.get("/search", response_model=SearchMessagesResponse)
+async def search_messages(
+    user_id: str = Query(..., description="ID of the user whose messages are searched (uuid)"),
+    q: str = Query(..., description="Search terms; a message matches when it contains all of them"),
+    limit: int = Query(20, ge=1, le=100, description="Number of hits per page (at most 100)"),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    message_controller: MessageController = Depends()
+) -> FastJSONResponse:
+    """
+    Search the messages a user sent or received, latest first
+
+    Hits are in recency order, not ranked by relevance. Every hit contains
+    all the terms, and messages are short, so term-frequency scores would
+    barely tell them apart. Newest first also lets a page stop after limit
+    hits and resume from a stable cursor, where ranking would score every
+    matching message on every page.
+    """
+    return await message_controller.search_messages(user_id=user_id, q=q, limit=limit, cursor=cursor)
+
 @router.get("/conversation/{conversation_id}", response_model=PaginatedMessageResponse)
 async def get_conversation_messages(
     conversation_id: str = Path(..., description="ID of the conversation (uuid)"),
-    limit: int = Query(20, description="Number of messages per page"),
+    limit: int = Query(20, ge=1, le=100, description="Number of messages per page (at most 100)"),
     before_message_id: Optional[str] = Query(None, description="Get messages before this message_id (timeuuid)"),
     message_controller: MessageController = Depends()
-) -> PaginatedMessageResponse:
+) -> FastJSONResponse:
     """
     Get all messages in a conversation with cursor-based pagination
     """
@@ -37,18 +82,40 @@ async def get_conversation_messages(
         last_message_id=before_message_id
     )
 
+@router.get(
+    "/conversation/{conversation_id}/export",
+    response_class=StreamingResponse,
+    responses={200: {"content": {"application/x-ndjson": {}}, "description": "One MessageResponse per line, latest first"}}
+)
+async def export_conversation(
+    conversation_id: str = Path(..., description="ID of the conversation (uuid)"),
+    before_message_id: Optional[str] = Query(None, description="Resume after an interrupted export: only messages before this message_id (timeuuid)"),
+    accept_encoding: Optional[str] = Header(None),
+    message_controller: MessageController = Depends()
+) -> StreamingResponse:
+    """
+    Stream a whole conversation as NDJSON (gzip-encoded when accepted), for backup and compliance exports
+    """
+    return await message_controller.export_conversation(
+        conversation_id=conversation_id,
+        before_message_id=before_message_id,
+        accept_encoding=accept_encoding
+    )
+
 @router.get("/conversation/{conversation_id}/before", response_model=PaginatedMessageResponse)
 async def get_messages_before_timestamp(
     conversation_id: str = Path(..., description="ID of the conversation (uuid)"),
     before_message_id: Optional[str] = Query(None, description="Get messages before this message_id (timeuuid)"),
-    limit: int = Query(20, description="Number of messages per page"),
+    limit: int = Query(20, ge=1, le=100, description="Number of messages per page (at most 100)"),
+    page_token: Optional[str] = Query(None, description="next_page_token from the previous page (same before_message_id and limit)"),
     message_controller: MessageController = Depends()
-) -> PaginatedMessageResponse:
+) -> FastJSONResponse:
     """
     Get messages in a conversation before a specific message_id with cursor-based pagination
     """
     return await message_controller.get_messages_before_timestamp(
         conversation_id=conversation_id,
         before_message_id=before_message_id,
-        limit=limit
+        limit=limit,
+        page_token=page_token
     )
\ No newline at end of file
@@ -0,0 +1,42 @@
+from fastapi import APIRouter, Depends, Header, Query, WebSocket
+from fastapi.responses import Response
+from typing import Optional
+
+from app.controllers.realtime_controller import RealtimeController
+
+router = APIRouter(prefix="/api/realtime", tags=["Realtime"])
+
+@router.get("/events", response_class=Response)
+async def stream_events(
+    user_id: Optional[str] = Query(None, description="Receive every message sent or received by this user (uuid)"),
+    conversation_id: Optional[str] = Query(None, description="Receive every message in this conversation (uuid)"),
+    after_message_id: Optional[str] = Query(None, description="Replay messages stored after this message_id (timeuuid) first"),
+    last_event_id: Optional[str] = Header(None, description="Set by EventSource on reconnect; same as after_message_id"),
+    realtime_controller: RealtimeController = Depends()
+) -> Response:
+    """
+    Server-Sent Events stream of new messages, for one user or one conversation
+    """
+    return await realtime_controller.sse(
+        user_id=user_id,
+        conversation_id=conversation_id,
+        after_message_id=after_message_id or last_event_id
+    )
+
+@router.websocket("/ws")
+async def websocket_events(
+    websocket: WebSocket,
+    user_id: Optional[str] = Query(None, description="Receive every message sent or received by this user (uuid)"),
+    conversation_id: Optional[str] = Query(None, description="Receive every message in this conversation (uuid)"),
+    after_message_id: Optional[str] = Query(None, description="Replay messages stored after this message_id (timeuuid) first"),
+    realtime_controller: RealtimeController = Depends()
+):
+    """
+    WebSocket stream of new messages, for one user or one conversation
+    """
+    await realtime_controller.websocket(
+        websocket,
+        user_id=user_id,
+        conversation_id=conversation_id,
+        after_message_id=after_message_id
+    )
@@ -1,9 +1,25 @@
 from fastapi import HTTPException, status
 from typing import Optional
+import asyncio
+import logging
 import uuid
 
-from app.schemas.conversation import ConversationResponse, PaginatedConversationResponse
+from app.schemas.conversation import ConversationResponse, ReadMarkerRequest, ReadMarkerResponse
 from app.models.cassandra_models import ConversationModel, MessageModel
+from app.util.json_response import FastJSONResponse, projector, schema_fields
+from app.util.util import encode_inbox_cursor
+
+logger = logging.getLogger(__name__)
+
+# Inbox pages are rendered straight from the model's ConversationRows (see
+# app.util.json_response); unread_count is added from the read states
+_conversation_json = projector([f for f in schema_fields(ConversationResponse) if f != 'unread_count'], {
+    'user1_id': 'user_id',
+    'user2_id': 'other_user_id',
+    'last_message_at': 'last_updated',
+    'last_message_content': 'last_message',
+})
+
 class ConversationController:
     """
     Controller for handling conversation operations
@@ -14,32 +30,65 @@ class ConversationController:
         self, 
         user_id: str, 
         limit: int = 20, 
-        before_conversation_id: Optional[str] = None
-    ) -> PaginatedConversationResponse:
+        before_conversation_id: Optional[str] = None,
+        cursor: Optional[str] = None
+    ) -> FastJSONResponse:
         """
-        Get all conversations for a user with stateless pagination (using before_conversation_id as token)
+        Get all conversations for a user, most recent first, with stateless pagination
+        (using cursor, or the legacy before_conversation_id, as token)
         """
 
-        conversations = await ConversationModel.get_user_conversations(
-            user_id=user_id,
-            limit=limit,
-            before_conversation_id=before_conversation_id
-        )
-        data = [
-            ConversationResponse(
-                conversation_id=conv['conversation_id'],
-                user1_id=conv['user_id'],
-                user2_id=conv['other_user_id'],
-                last_message_at=conv['last_updated'],
-                last_message_content=conv['last_message']
-            ) for conv in conversations
-        ]
-        next_cursor = data[-1].conversation_id if data else None
-        return PaginatedConversationResponse(
-            total=len(data),
-            limit=limit,
-            data=data,
-            next_cursor=next_cursor
+        async def page_with_read_states():
+            conversations = await ConversationModel.get_user_conversations(
+                user_id=user_id,
+                limit=limit,
+                before_conversation_id=before_conversation_id,
+                cursor=cursor
+            )
+            return conversations, await ConversationModel.get_read_states(user_id, [c.conversation_id for c in conversations])
+
+        try:
+            # The total is one counter read, made while the page and its read states are read
+            (conversations, read_states), total = await asyncio.gather(
+                page_with_read_states(),
+                ConversationModel.get_conversation_count(user_id)
+            )
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid user_id, before_conversation_id or cursor")
+        data = []
+        for c in conversations:
+            item = _conversation_json(c)
+            item['unread_count'] = read_states[c.conversation_id][1]
+            data.append(item)
+        next_cursor = encode_inbox_cursor(conversations[-1].last_updated, conversations[-1].conversation_id) if conversations else None
+        # Shape and field order of PaginatedConversationResponse
+        return FastJSONResponse({
+            'total': total,
+            'limit': limit,
+            'data': data,
+            'next_cursor': next_cursor,
+        })
+
+    async def mark_read(self, conversation_id: str, request: ReadMarkerRequest) -> ReadMarkerResponse:
+        """
+        Mark a conversation read by a user up to a message
+        """
+        try:
+            last_read_message_id, unread_count = await ConversationModel.mark_read(
+                conversation_id=conversation_id,
+                user_id=request.user_id,
+                message_id=request.message_id
+            )
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid conversation_id, user_id or message_id")
+        except Exception as e:
+            logger.exception("[Controller] Exception occurred in mark_read")
+            raise HTTPException(status_code=500, detail=str(e))
+        return ReadMarkerResponse(
+            conversation_id=conversation_id,
+            user_id=request.user_id,
+            last_read_message_id=str(last_read_message_id),
+            unread_count=unread_count
         )
     
     async def get_conversation(self, conversation_id: str, enrich_users: bool = False) -> ConversationResponse:
@@ -59,8 +108,8 @@ class ConversationController:
             # Try to fetch the first message in the conversation to infer user IDs
             messages = await MessageModel.get_conversation_messages(conversation_id, limit=1)
             if messages:
-                user1_id = str(messages[0]['sender_id'])
-                user2_id = str(messages[0]['receiver_id'])
+                user1_id = str(messages[0].sender_id)
+                user2_id = str(messages[0].receiver_id)
         return ConversationResponse(
             conversation_id=conversation['conversation_id'],
             user1_id=user1_id,
@@ -1,112 +1,292 @@
-from typing import Optional
+from typing import List, Optional
 from datetime import datetime
+from contextlib import aclosing
+import asyncio
 from fastapi import HTTPException, status
+from fastapi.responses import StreamingResponse
 import logging
+import os
 import uuid
+import zlib
 
-from app.schemas.message import MessageCreate, MessageResponse, PaginatedMessageResponse
-from app.models.cassandra_models import MessageModel, ConversationModel
-from app.util.util import generate_conversation_id
+from app.schemas.message import (
+    MessageCreate, MessageResponse, BulkMessageResult, BulkMessageResponse, BatchGetMessagesRequest
+)
+from app.models.cassandra_models import MessageModel, ConversationModel, SearchModel
+from app.util.json_response import FastJSONResponse, projector, render_ndjson, schema_fields
+from app.util.conversation_ids import (
+    conversation_id as derive_conversation_id, conversation_ids as derive_conversation_ids, is_canonical, raw_conversation_id,
+)
 
 logger = logging.getLogger(__name__)
 
+MAX_BULK_MESSAGES = 1000
+MAX_BATCH_GET_CONVERSATIONS = 100
+# zlib level of gzip-encoded conversation exports
+EXPORT_GZIP_LEVEL = int(os.getenv("EXPORT_GZIP_LEVEL", "6"))
+
+# Message reads are rendered straight from the model's MessageRows (see app.util.json_response)
+_message_json = projector(schema_fields(MessageResponse))
+
+def _message_response(message) -> MessageResponse:
+    return MessageResponse(
+        message_id=str(message.message_id),
+        sender_id=str(message.sender_id),
+        receiver_id=str(message.receiver_id),
+        content=message.content,
+        created_at=message.created_at,
+        conversation_id=str(message.conversation_id)
+    )
+
+def _accepts_gzip(accept_encoding: Optional[str]) -> bool:
+    """Whether an Accept-Encoding header allows gzip (present and not q=0)."""
+    for coding in (accept_encoding or "").split(","):
+        name, _, params = coding.partition(";")
+        if name.strip().lower() in ("gzip", "*"):
+            q = params.strip().lower().replace(" ", "")
+            if not q.startswith("q="):
+                return True
+            try:
+                return float(q[2:]) > 0
+            except ValueError:
+                return False
+    return False
+
 class MessageController:
     """
     Controller for handling message operations
     """
     
-    def parse_messages(self, messages):
-        messages = list(messages)
-        return [
-            MessageResponse(
-                message_id=m['message_id'],
-                sender_id=m['sender_id'],
-                receiver_id=m['receiver_id'],
-                content=m['content'],
-                created_at=m['created_at'],
-                conversation_id=m['conversation_id']
-            )
-            for m in messages
-        ]
+    @staticmethod
+    def page_json(messages, limit: int, total: int, next_page_token: Optional[str] = None) -> dict:
+        """PaginatedMessageResponse as plain JSON-ready data, without per-row validation."""
+        return {
+            'total': total,
+            'limit': limit,
+            'data': [_message_json(m) for m in messages],
+            'next_cursor': str(messages[-1].message_id) if messages else None,
+            'next_page_token': next_page_token,
+        }
 
     async def send_message(self, message_data: MessageCreate) -> MessageResponse:
         """
         Send a message from one user to another
         """
         try:
-            # Use deterministic conversation id
-            conversation_id = generate_conversation_id(str(message_data.sender_id), str(message_data.receiver_id))
+            sender_id = uuid.UUID(message_data.sender_id)
+            receiver_id = uuid.UUID(message_data.receiver_id)
+            # Use deterministic conversation id; IDs not spelled canonically
+            # keep the conversation their raw strings always hashed to
+            if is_canonical(message_data.sender_id, sender_id) and is_canonical(message_data.receiver_id, receiver_id):
+                conversation_id = derive_conversation_id(sender_id, receiver_id)
+            else:
+                conversation_id = raw_conversation_id(message_data.sender_id, message_data.receiver_id)
             result = await MessageModel.create_message(
                 conversation_id=conversation_id,
-                sender_id=str(message_data.sender_id),
-                receiver_id=str(message_data.receiver_id),
+                sender_id=sender_id,
+                receiver_id=receiver_id,
                 content=message_data.content
             )
-            return MessageResponse(
-                message_id=str(result['message_id']),
-                sender_id=str(result['sender_id']),
-                receiver_id=str(result['receiver_id']),
-                content=result['content'],
-                created_at=result['created_at'],
-                conversation_id=str(result['conversation_id'])
-            )
+            return _message_response(result)
         except Exception as e:
             logger.exception("[Controller] Exception occurred in send_message")
             raise HTTPException(status_code=500, detail=str(e))
 
+    async def send_messages(self, messages_data: List[MessageCreate]) -> BulkMessageResponse:
+        """
+        Send many messages at once. Every item gets its own result; one bad
+        item does not fail the others.
+        """
+        if len(messages_data) > MAX_BULK_MESSAGES:
+            raise HTTPException(status_code=413, detail=f"At most {MAX_BULK_MESSAGES} messages per request")
+        results = [None] * len(messages_data)
+        # (index, sender_id, receiver_id, content) of the items with valid IDs
+        valid = []
+        for index, m in enumerate(messages_data):
+            try:
+                valid.append((index, uuid.UUID(m.sender_id), uuid.UUID(m.receiver_id), m.content))
+            except ValueError as e:
+                results[index] = e
+        conversation_ids = derive_conversation_ids([(sender_id, receiver_id) for _, sender_id, receiver_id, _ in valid])
+        # As in send_message, IDs not spelled canonically hash as sent
+        for position, (index, sender_id, receiver_id, _) in enumerate(valid):
+            m = messages_data[index]
+            if not (is_canonical(m.sender_id, sender_id) and is_canonical(m.receiver_id, receiver_id)):
+                conversation_ids[position] = raw_conversation_id(m.sender_id, m.receiver_id)
+        try:
+            stored = await MessageModel.create_messages([
+                (conversation_id, sender_id, receiver_id, content)
+                for conversation_id, (_, sender_id, receiver_id, content) in zip(conversation_ids, valid)
+            ])
+        except Exception as e:
+            logger.exception("[Controller] Exception occurred in send_messages")
+            raise HTTPException(status_code=500, detail=str(e))
+        for (index, _, _, _), result in zip(valid, stored):
+            results[index] = result
+        items = []
+        for index, result in enumerate(results):
+            if isinstance(result, BaseException):
+                status_code = 400 if isinstance(result, ValueError) else 500
+                items.append(BulkMessageResult(index=index, status_code=status_code, error=str(result)))
+            else:
+                items.append(BulkMessageResult(index=index, status_code=201, message=_message_response(result)))
+        created = sum(1 for item in items if item.status_code == 201)
+        return BulkMessageResponse(created=created, failed=len(items) - created, results=items)
+
     async def get_conversation_messages(
         self,
         conversation_id: str,
         limit: int = 20,
         last_message_id: Optional[str] = None
-    ) -> PaginatedMessageResponse:
+    ) -> FastJSONResponse:
         """
         Get all messages in a conversation with stateless pagination (using last_message_id as token)
         """
-        logger.info(f"[Controller] Fetching messages for conversation_id={conversation_id}, limit={limit}, last_message_id={last_message_id}")
         try:
-            messages = await MessageModel.get_conversation_messages(
-                conversation_id=conversation_id,
-                limit=limit,
-                last_message_id=last_message_id
-            )
-            logger.info(f"[Controller] Retrieved {len(messages)} messages from model")
-            data = self.parse_messages(messages)
-            next_cursor = messages[-1]['message_id'] if messages else None
-            logger.info(f"[Controller] Returning {len(data)} parsed messages, next_cursor={next_cursor}")
-            return PaginatedMessageResponse(
-                total=len(data),
-                limit=limit,
-                data=data,
-                next_cursor=next_cursor
+            # The total is one counter read, made alongside the page
+            messages, total = await asyncio.gather(
+                MessageModel.get_conversation_messages(
+                    conversation_id=conversation_id,
+                    limit=limit,
+                    last_message_id=last_message_id
+                ),
+                MessageModel.get_message_count(conversation_id)
             )
+            return FastJSONResponse(self.page_json(messages, limit, total))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
         except Exception as e:
             logger.exception("[Controller] Exception occurred in get_conversation_messages")
             raise HTTPException(status_code=500, detail=str(e))
 
+    async def search_messages(self, user_id: str, q: str, limit: int = 20, cursor: Optional[str] = None) -> FastJSONResponse:
+        """
+        Search a user's messages for every term of q, newest first, with cursor-based pagination
+        """
+        try:
+            messages, next_cursor = await SearchModel.search_messages(user_id, q, limit, cursor)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        except Exception as e:
+            logger.exception("[Controller] Exception occurred in search_messages")
+            raise HTTPException(status_code=500, detail=str(e))
+        # Shape and field order of SearchMessagesResponse
+        return FastJSONResponse({
+            'limit': limit,
+            'data': [_message_json(m) for m in messages],
+            'next_cursor': next_cursor,
+        })
+
+    async def batch_get_conversation_messages(self, request: BatchGetMessagesRequest) -> FastJSONResponse:
+        """
+        Get a page of messages for each of several conversations in one call.
+        A conversation that cannot be read gets an error result; the others are still returned.
+        """
+        if len(request.requests) > MAX_BATCH_GET_CONVERSATIONS:
+            raise HTTPException(status_code=413, detail=f"At most {MAX_BATCH_GET_CONVERSATIONS} conversations per request")
+        try:
+            pages = await MessageModel.get_many_conversation_messages([
+                (r.conversation_id, r.limit, r.before_message_id) for r in request.requests
+            ])
+        except Exception as e:
+            logger.exception("[Controller] Exception occurred in batch_get_conversation_messages")
+            raise HTTPException(status_code=500, detail=str(e))
+        results = []
+        for r, page in zip(request.requests, pages):
+            if isinstance(page, BaseException):
+                if not isinstance(page, ValueError):
+                    logger.error("[Controller] Failed to read conversation %s in batch get", r.conversation_id, exc_info=page)
+                results.append({
+                    'conversation_id': r.conversation_id,
+                    'status_code': 400 if isinstance(page, ValueError) else 500,
+                    'data': [],
+                    'next_cursor': None,
+                    'error': str(page),
+                })
+            else:
+                results.append({
+                    'conversation_id': r.conversation_id,
+                    'status_code': 200,
+                    'data': [_message_json(m) for m in page],
+                    'next_cursor': str(page[-1].message_id) if page else None,
+                    'error': None,
+                })
+        # Shape and field order of BatchGetMessagesResponse / ConversationMessagesResult
+        return FastJSONResponse({'results': results})
+
     async def get_messages_before_timestamp(
         self,
         conversation_id: str,
-        before_message_id: str,
-        limit: int = 20
-    ) -> PaginatedMessageResponse:
+        before_message_id: Optional[str],
+        limit: int = 20,
+        page_token: Optional[str] = None
+    ) -> FastJSONResponse:
         """
-        Get messages in a conversation before a specific message_id (for pagination)
+        Get messages in a conversation before a specific message_id (for pagination).
+        Follow-up pages can pass the returned next_page_token with the same
+        before_message_id and limit.
         """
         try:
-            messages = await MessageModel.get_conversation_messages(
-                conversation_id=conversation_id,
-                limit=limit,
-                last_message_id=before_message_id
-            )
-            data = self.parse_messages(messages)
-            next_cursor = messages[-1]['message_id'] if messages else None
-            return PaginatedMessageResponse(
-                total=len(data),
-                limit=limit,
-                data=data,
-                next_cursor=next_cursor
+            (messages, next_page_token), total = await asyncio.gather(
+                MessageModel.get_messages_before_message_id(
+                    conversation_id=conversation_id,
+                    before_message_id=before_message_id,
+                    limit=limit,
+                    page_token=page_token
+                ),
+                MessageModel.get_message_count(conversation_id)
             )
+            return FastJSONResponse(self.page_json(messages, limit, total, next_page_token))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
         except Exception as e:
             logger.exception("[Controller] Exception occurred in get_messages_before_timestamp")
-            raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+            raise HTTPException(status_code=500, detail=str(e))
+
+    async def export_conversation(
+        self,
+        conversation_id: str,
+        before_message_id: Optional[str] = None,
+        accept_encoding: Optional[str] = None
+    ) -> StreamingResponse:
+        """
+        Stream every message of a conversation as NDJSON, latest first, one
+        MessageResponse object per line, gzip-encoded if the client accepts it.
+
+        Rows are read page by page and written as they arrive, so memory use
+        does not depend on the conversation's size. An export that is cut
+        short can be resumed with the last exported message_id as
+        before_message_id. If a read fails after the response has started,
+        the connection is dropped rather than the body ended cleanly, so the
+        client sees an incomplete response.
+        """
+        try:
+            pages = MessageModel.iter_conversation_messages(conversation_id, before_message_id)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        gzip = _accepts_gzip(accept_encoding)
+
+        async def body():
+            # wbits=31: gzip container, so the body is a valid .ndjson.gz file
+            compressor = zlib.compressobj(EXPORT_GZIP_LEVEL, zlib.DEFLATED, 31) if gzip else None
+            async with aclosing(pages):
+                try:
+                    async for page in pages:
+                        chunk = render_ndjson(_message_json(m) for m in page)
+                        if compressor is not None:
+                            chunk = compressor.compress(chunk)
+                        if chunk:
+                            yield chunk
+                except Exception:
+                    logger.exception("[Controller] Exception occurred in export_conversation")
+                    raise
+            if compressor is not None:
+                yield compressor.flush()
+
+        headers = {
+            "Content-Disposition": f'attachment; filename="conversation-{conversation_id}.ndjson"',
+            "Vary": "Accept-Encoding",
+        }
+        if gzip:
+            headers["Content-Encoding"] = "gzip"
+        return StreamingResponse(body(), media_type="application/x-ndjson", headers=headers)
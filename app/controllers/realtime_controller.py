@@ -0,0 +1,205 @@
+from datetime import timedelta
+from typing import AsyncIterator, List, Optional, Tuple
+from contextlib import aclosing
+import asyncio
+import logging
+import os
+import uuid
+
+from fastapi import HTTPException, WebSocket, WebSocketDisconnect
+from fastapi.responses import Response
+
+from app.models.cassandra_models import MessageModel, ConversationModel
+from app.util.realtime import Event, Subscription, encode_message, hub
+from app.util.util import timeuuid_to_datetime, truncate_to_ms
+
+logger = logging.getLogger(__name__)
+
+# Seconds between keep-alives on an idle connection (also bounds how long a dead WebSocket lingers)
+REALTIME_HEARTBEAT_SECONDS = float(os.getenv("REALTIME_HEARTBEAT_SECONDS", "25"))
+# Most messages (and, for user streams, conversations) replayed on reconnect before asking the client to resync
+REALTIME_RESUME_LIMIT = int(os.getenv("REALTIME_RESUME_LIMIT", "200"))
+
+MESSAGE, HEARTBEAT, RESET = "message", "heartbeat", "reset"
+
+class EventStreamResponse(Response):
+    """
+    text/event-stream response for one hub subscription.
+
+    Lighter than StreamingResponse, which keeps a task group and two tasks
+    per connection: here a single task waits for the client to disconnect
+    and closes the subscription, which ends the stream.
+    """
+
+    media_type = "text/event-stream"
+
+    def __init__(self, frames: AsyncIterator[str], subscription: Subscription):
+        super().__init__(headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+        self.frames = frames
+        self.subscription = subscription
+
+    async def __call__(self, scope, receive, send) -> None:
+        async def wait_for_disconnect():
+            while (await receive())["type"] != "http.disconnect":
+                pass
+
+        disconnect = asyncio.ensure_future(wait_for_disconnect())
+        disconnect.add_done_callback(lambda _: self.subscription.close())
+        try:
+            await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+            async for frame in self.frames:
+                await send({"type": "http.response.body", "body": frame.encode(), "more_body": True})
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+        finally:
+            disconnect.cancel()
+            await self.frames.aclose()
+            hub.unsubscribe(self.subscription)
+
+class RealtimeController:
+    """
+    Controller for real-time delivery of new messages over SSE and WebSocket
+    """
+
+    def _validate(
+        self,
+        user_id: Optional[str],
+        conversation_id: Optional[str],
+        after_message_id: Optional[str]
+    ) -> Tuple[Optional[str], Optional[str], Optional[str]]:
+        """
+        Check the stream parameters and return them in canonical form (lowercase, hyphenated), the
+        form the hub publishes under. after_message_id must be a timeuuid, as replay reads its timestamp.
+        """
+        if (user_id is None) == (conversation_id is None):
+            raise HTTPException(status_code=400, detail="Pass exactly one of user_id or conversation_id")
+        try:
+            ids = [uuid.UUID(value) if value is not None else None for value in (user_id, conversation_id, after_message_id)]
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid user_id, conversation_id or after_message_id")
+        if ids[2] is not None and ids[2].version != 1:
+            raise HTTPException(status_code=400, detail="after_message_id must be a message_id (timeuuid)")
+        return tuple(str(value) if value is not None else None for value in ids)
+
+    async def _missed_events(self, user_id: Optional[str], conversation_id: Optional[str], after_message_id: str) -> Optional[List[Event]]:
+        """
+        Messages stored after after_message_id, oldest first, or None if there
+        are more than REALTIME_RESUME_LIMIT and the client should resync over REST.
+        """
+        if conversation_id is not None:
+            conversation_ids = [conversation_id]
+        else:
+            # Inbox rows are stamped with created_at, taken just after the message_id; allow for ms truncation
+            since = truncate_to_ms(timeuuid_to_datetime(uuid.UUID(after_message_id))) - timedelta(milliseconds=1)
+            conversations = await ConversationModel.get_conversations_updated_since(user_id, since, REALTIME_RESUME_LIMIT)
+            if len(conversations) >= REALTIME_RESUME_LIMIT:
+                return None
+            conversation_ids = [str(c.conversation_id) for c in conversations]
+        pages = await asyncio.gather(*(
+            MessageModel.get_messages_after(c, after_message_id, REALTIME_RESUME_LIMIT) for c in conversation_ids
+        ))
+        messages = [m for page in pages for m in page]
+        if len(messages) >= REALTIME_RESUME_LIMIT:
+            return None
+        messages.sort(key=lambda m: m.message_id.time)
+        return [encode_message(m) for m in messages]
+
+    async def _stream(
+        self,
+        subscription: Subscription,
+        conversation_id: Optional[str],
+        after_message_id: Optional[str]
+    ) -> AsyncIterator[Tuple[str, Optional[Event]]]:
+        """
+        Yield (kind, event) pairs: missed messages first, then live ones, with
+        heartbeats while idle. Ends when the subscription is closed (client
+        gone, or overflowed); the client is expected to reconnect with the
+        last message_id it received.
+        """
+        try:
+            replayed = set()
+            if after_message_id:
+                missed = await self._missed_events(subscription.user_id, conversation_id, after_message_id)
+                if missed is None:
+                    yield RESET, None
+                else:
+                    for event in missed:
+                        replayed.add(event.message_id)
+                        yield MESSAGE, event
+            while True:
+                event = await subscription.get(timeout=REALTIME_HEARTBEAT_SECONDS)
+                if event is None:
+                    if subscription.closed:
+                        return
+                    yield HEARTBEAT, None
+                elif event.message_id in replayed:
+                    replayed.discard(event.message_id)
+                else:
+                    yield MESSAGE, event
+        finally:
+            hub.unsubscribe(subscription)
+
+    async def sse(
+        self,
+        user_id: Optional[str],
+        conversation_id: Optional[str],
+        after_message_id: Optional[str]
+    ) -> EventStreamResponse:
+        """
+        Stream new messages as Server-Sent Events. Each event's id is its
+        message_id, so a reconnecting EventSource resumes via Last-Event-ID.
+        """
+        user_id, conversation_id, after_message_id = self._validate(user_id, conversation_id, after_message_id)
+        # Subscribe before reading any backlog so nothing published in between is lost
+        subscription = hub.subscribe(user_id=user_id, conversation_id=conversation_id)
+
+        async def frames():
+            yield "retry: 3000\n\n"
+            try:
+                async for kind, event in self._stream(subscription, conversation_id, after_message_id):
+                    if kind == MESSAGE:
+                        yield f"id: {event.message_id}\nevent: message\ndata: {event.payload}\n\n"
+                    elif kind == HEARTBEAT:
+                        yield ": heartbeat\n\n"
+                    else:
+                        yield "event: reset\ndata: {}\n\n"
+            except Exception:
+                # Headers are already sent; end the stream and let the client reconnect
+                logger.exception("[Controller] Exception occurred in sse stream")
+
+        return EventStreamResponse(frames(), subscription)
+
+    async def websocket(
+        self,
+        websocket: WebSocket,
+        user_id: Optional[str],
+        conversation_id: Optional[str],
+        after_message_id: Optional[str]
+    ) -> None:
+        """
+        Push new messages over a WebSocket as {"type": "message", "data": {...}}
+        frames, plus {"type": "heartbeat"} and {"type": "reset"}. The socket
+        is closed with 1013 (try again later) if the client falls behind.
+        """
+        try:
+            user_id, conversation_id, after_message_id = self._validate(user_id, conversation_id, after_message_id)
+        except HTTPException as e:
+            await websocket.close(code=1008, reason=e.detail)
+            return
+        await websocket.accept()
+        subscription = hub.subscribe(user_id=user_id, conversation_id=conversation_id)
+        try:
+            async with aclosing(self._stream(subscription, conversation_id, after_message_id)) as stream:
+                async for kind, event in stream:
+                    if kind == MESSAGE:
+                        await websocket.send_text('{"type":"message","data":' + event.payload + '}')
+                    else:
+                        await websocket.send_text(f'{{"type":"{kind}"}}')
+            await websocket.close(code=1013)
+        except (WebSocketDisconnect, RuntimeError, OSError):
+            # Client went away; found out on the next send
+            pass
+        except Exception:
+            logger.exception("[Controller] Exception occurred in websocket stream")
+            await websocket.close(code=1011)
+        finally:
+            hub.unsubscribe(subscription)
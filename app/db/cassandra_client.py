@@ -4,16 +4,30 @@ This provides a connection to the Cassandra database.
 """
 import os
 import uuid
-from typing import List, Dict, Any, Optional
+import asyncio
+from typing import List, Iterable, Optional, Sequence, Tuple
 from datetime import datetime
 import logging
 import time
 
-from cassandra.cluster import Cluster, Session
-from cassandra.auth import PlainTextAuthProvider
-from cassandra.query import SimpleStatement, dict_factory
+from cassandra.cluster import Session
+from cassandra import InvalidRequest
+from cassandra.query import BatchStatement, BatchType, BoundStatement
+
+from app.db.cluster_config import ClusterConfig, READ_PROFILE, WRITE_PROFILE
+from app.db.prepared_statements import PreparedStatementRegistry, is_read
+from app.db.rows import Row
+from app.util.log import get_logger, record_query
+from app.util.metrics import counter, gauge, histogram, statement_name
 
 logger = logging.getLogger(__name__)
+# Data-path events: lazily formatted and sampled (see app.util.log)
+log = get_logger(__name__)
+
+QUERY_SECONDS = histogram("messenger_db_query_seconds", "Cassandra round trip latency per statement.", ("statement",))
+QUERY_ROWS = counter("messenger_db_rows_total", "Rows returned per statement.", ("statement",))
+QUERY_ERRORS = counter("messenger_db_query_errors_total", "Failed Cassandra queries per statement.", ("statement",))
+QUERIES_IN_FLIGHT = gauge("messenger_db_queries_in_flight", "Cassandra queries currently awaiting a response.").labels()
 
 class CassandraClient:
     """Singleton Cassandra client for the application."""
@@ -27,73 +41,128 @@ class CassandraClient:
         return cls._instance
     
     def __init__(self):
-        """Initialize the Cassandra connection."""
+        """Read the configuration; nothing connects until the session is first needed."""
         if self._initialized:
             return
         
-        self.host = os.getenv("CASSANDRA_HOST", "localhost")
-        self.port = int(os.getenv("CASSANDRA_PORT", "9042"))
+        self.config = ClusterConfig()
         self.keyspace = os.getenv("CASSANDRA_KEYSPACE", "messenger")
         
         self.cluster = None
         self.session = None
-        self.connect()
+        self.statements = PreparedStatementRegistry()
+        # The in-progress aconnect(), shared by every coroutine that needs the session meanwhile
+        self._connecting: Optional[asyncio.Future] = None
         
         self._initialized = True
     
+    def _connect_once(self) -> Session:
+        """Build the cluster and open a session; blocks until the pools to every host are up."""
+        cluster = self.config.build_cluster()
+        session = cluster.connect(self.keyspace)
+        self.cluster, self.session = cluster, session
+        logger.info("Connected to Cassandra at %s, keyspace: %s", self.config.describe(), self.keyspace)
+        return session
+    
     def connect(self) -> None:
-        retries = 10
+        """Connect, blocking the calling thread. For scripts; the app uses aconnect()."""
+        retries = self.config.connect_retries
         for attempt in range(retries):
             try:
-                self.cluster = Cluster([self.host])
-                self.session = self.cluster.connect(self.keyspace)
-                self.session.row_factory = dict_factory
-                logger.info(f"Connected to Cassandra at {self.host}:{self.port}, keyspace: {self.keyspace}")
+                self._connect_once()
                 return
             except Exception as e:
-                logger.exception(f"Failed to connect to Cassandra (attempt {attempt+1}/{retries})")
-                time.sleep(5)
+                logger.exception("Failed to connect to Cassandra (attempt %d/%d)", attempt + 1, retries)
+                time.sleep(self.config.connect_retry_delay)
+        raise Exception("Failed to connect to Cassandra after multiple attempts")
+    
+    async def aconnect(self) -> Session:
+        """
+        Connect without blocking the event loop.
+
+        The driver's blocking connect runs on the default executor, and retries
+        wait with asyncio.sleep. Concurrent callers await the same attempt, so
+        requests arriving during startup queue behind it instead of each
+        opening a cluster.
+        """
+        if self.session:
+            return self.session
+        loop = asyncio.get_running_loop()
+        connecting = self._connecting
+        if connecting is None or connecting.get_loop() is not loop or (connecting.done() and connecting.exception()):
+            connecting = self._connecting = asyncio.ensure_future(self._aconnect())
+        # Shielded: one cancelled request must not abort the connect the others are waiting on
+        return await asyncio.shield(connecting)
+    
+    async def _aconnect(self) -> Session:
+        loop = asyncio.get_running_loop()
+        retries = self.config.connect_retries
+        for attempt in range(retries):
+            try:
+                return await loop.run_in_executor(None, self._connect_once)
+            except Exception:
+                logger.exception("Failed to connect to Cassandra (attempt %d/%d)", attempt + 1, retries)
+                if attempt + 1 < retries:
+                    await asyncio.sleep(self.config.connect_retry_delay)
         raise Exception("Failed to connect to Cassandra after multiple attempts")
     
     def close(self) -> None:
         """Close the Cassandra connection."""
         if self.cluster:
             self.cluster.shutdown()
+            self.cluster = self.session = None
             logger.info("Cassandra connection closed")
     
-    def execute(self, query: str, params: dict = None) -> List[Dict[str, Any]]:
+    def _bind(self, statement, params: Sequence = None, fetch_size: Optional[int] = None) -> BoundStatement:
+        bound = statement.bind(params or ())
+        if fetch_size is not None:
+            bound.fetch_size = fetch_size
+        return bound
+
+    def execute(self, query: str, params: Sequence = None) -> List[Row]:
         """
         Execute a CQL query.
         
         Args:
-            query: The CQL query string
-            params: The parameters for the query
+            query: The CQL query string, with ? bind markers
+            params: The positional parameters for the query
             
         Returns:
-            List of rows as dictionaries
+            List of rows (see app.db.rows): MessageRow / ConversationRow named
+            tuples for statements selecting exactly their fields, dicts otherwise
         """
-        logger.info(f"[DB] Executing query: {query}")
-        logger.info(f"[DB] Params: {params}")
+        log.debug("db.execute", query=query, params=params)
         if not self.session:
             self.connect()
         
+        started = time.perf_counter()
+        QUERIES_IN_FLIGHT.inc()
         try:
-            statement = SimpleStatement(query)
-            result = self.session.execute(statement, params or {})
+            try:
+                result = self.session.execute(self._bind(self.statements.get(self.session, query), params), execution_profile=_profile(query))
+            except InvalidRequest:
+                # The statement may be stale after a schema change; prepare it again and retry once
+                self.statements.invalidate(query)
+                result = self.session.execute(self._bind(self.statements.get(self.session, query), params), execution_profile=_profile(query))
             result_list = list(result)
-            logger.info(f"[DB] Query executed successfully. Returned {len(result_list)} rows")
+            _observe(query, len(result_list), time.perf_counter() - started)
             return result_list
         except Exception as e:
-            logger.exception(f"[DB] Exception during execute")
+            QUERY_ERRORS.labels(statement_name(query)).inc()
+            log.exception("db.execute_failed", query=query)
             raise
+        finally:
+            QUERIES_IN_FLIGHT.dec()
     
-    def execute_async(self, query: str, params: dict = None):
+    def execute_async(self, query: str, params: Sequence = None, fetch_size: Optional[int] = None, paging_state: Optional[bytes] = None):
         """
         Execute a CQL query asynchronously.
         
         Args:
-            query: The CQL query string
-            params: The parameters for the query
+            query: The CQL query string, with ? bind markers
+            params: The positional parameters for the query
+            fetch_size: Rows per page requested from Cassandra (driver default if None)
+            paging_state: Opaque paging state to resume a paged query from
             
         Returns:
             Async result object
@@ -102,17 +171,209 @@ class CassandraClient:
             self.connect()
         
         try:
-            statement = SimpleStatement(query)
-            return self.session.execute_async(statement, params or {})
+            statement = self._bind(self.statements.get(self.session, query), params, fetch_size)
+            started = time.perf_counter()
+            response_future = self.session.execute_async(statement, paging_state=paging_state, execution_profile=_profile(query))
         except Exception as e:
-            logger.exception("Async query execution failed")
+            QUERY_ERRORS.labels(statement_name(query)).inc()
+            log.exception("db.execute_async_failed", query=query)
             raise
-    
+        _instrument(response_future, query, started)
+        return response_future
+
+    async def aprepare(self, query: str):
+        """Return the prepared statement for query, preparing it off the event loop if needed."""
+        if not self.session:
+            await self.aconnect()
+        statement = self.statements.lookup(self.session, query)
+        if statement is None:
+            loop = asyncio.get_running_loop()
+            statement = await loop.run_in_executor(None, self.statements.get, self.session, query)
+        return statement
+
+    async def aprepare_all(self, queries: Iterable[str]) -> None:
+        """Eagerly and concurrently prepare a set of known queries."""
+        await asyncio.gather(*(self.aprepare(query) for query in queries))
+
+    async def _aexecute_prepared(self, query: str, params: Sequence, fetch_size: Optional[int],
+                                 paging_state: Optional[bytes], all_pages: bool):
+        log.debug("db.execute", query=query, params=params, fetch_size=fetch_size)
+        for attempt in range(2):
+            statement = self._bind(await self.aprepare(query), params, fetch_size)
+            started = time.perf_counter()
+            QUERIES_IN_FLIGHT.inc()
+            try:
+                response_future = self.session.execute_async(statement, paging_state=paging_state, execution_profile=_profile(query))
+                rows = await self._collect_pages(response_future, all_pages=all_pages)
+                _observe(query, len(rows), time.perf_counter() - started)
+                return rows, response_future
+            except InvalidRequest:
+                QUERY_ERRORS.labels(statement_name(query)).inc()
+                if attempt:
+                    log.exception("db.execute_failed", query=query)
+                    raise
+                # The statement may be stale after a schema change; prepare it again and retry once
+                self.statements.invalidate(query)
+            except Exception:
+                QUERY_ERRORS.labels(statement_name(query)).inc()
+                raise
+            finally:
+                QUERIES_IN_FLIGHT.dec()
+
+    async def aexecute(self, query: str, params: Sequence = None, fetch_size: Optional[int] = None) -> List[Row]:
+        """
+        Execute a CQL query without blocking the event loop.
+
+        The driver's ResponseFuture is bridged to an asyncio future, and
+        every page of the result is fetched before returning.
+
+        Args:
+            query: The CQL query string, with ? bind markers
+            params: The positional parameters for the query
+            fetch_size: Rows per page requested from Cassandra (driver default if None)
+
+        Returns:
+            List of rows (see app.db.rows): MessageRow / ConversationRow named
+            tuples for statements selecting exactly their fields, dicts otherwise
+        """
+        rows, _ = await self._aexecute_prepared(query, params, fetch_size, None, all_pages=True)
+        return rows
+
+    async def aexecute_page(
+        self,
+        query: str,
+        params: Sequence = None,
+        fetch_size: int = 100,
+        paging_state: Optional[bytes] = None
+    ) -> Tuple[List[Row], Optional[bytes]]:
+        """
+        Fetch a single page of a CQL query without blocking the event loop.
+
+        Args:
+            query: The CQL query string, with ? bind markers
+            params: The positional parameters for the query
+            fetch_size: Rows per page
+            paging_state: Opaque paging state returned by a previous call
+
+        Returns:
+            Tuple of (rows on this page, typed as for aexecute; paging state of the next page or None)
+        """
+        rows, response_future = await self._aexecute_prepared(query, params, fetch_size, paging_state, all_pages=False)
+        return rows, response_future.result().paging_state
+
+    async def aexecute_batch(self, statements: Sequence[Tuple[str, Sequence]], logged: bool = True, counter: bool = False) -> None:
+        """
+        Execute several prepared statements as one batch without blocking the event loop.
+
+        Args:
+            statements: (query, positional params) pairs
+            logged: Use a LOGGED batch (atomic across partitions) instead of UNLOGGED
+            counter: Use a COUNTER batch (counter updates only; logged is ignored)
+        """
+        log.debug("db.batch", statements=statements, logged=logged, counter=counter)
+        if counter:
+            batch_type = BatchType.COUNTER
+        else:
+            batch_type = BatchType.LOGGED if logged else BatchType.UNLOGGED
+        for attempt in range(2):
+            batch = BatchStatement(batch_type=batch_type)
+            for query, params in statements:
+                batch.add(self._bind(await self.aprepare(query), params))
+            started = time.perf_counter()
+            QUERIES_IN_FLIGHT.inc()
+            try:
+                await self._collect_pages(self.session.execute_async(batch, execution_profile=WRITE_PROFILE))
+                _observe(BATCH, 0, time.perf_counter() - started)
+                return
+            except InvalidRequest:
+                QUERY_ERRORS.labels(BATCH).inc()
+                if attempt:
+                    log.exception("db.batch_failed", size=len(statements))
+                    raise
+                # One of the statements may be stale after a schema change; prepare them again and retry once
+                for query, _ in statements:
+                    self.statements.invalidate(query)
+            except Exception:
+                QUERY_ERRORS.labels(BATCH).inc()
+                raise
+            finally:
+                QUERIES_IN_FLIGHT.dec()
+
+    @staticmethod
+    def _collect_pages(response_future, all_pages: bool = True) -> asyncio.Future:
+        """
+        Bridge a driver ResponseFuture to an asyncio future.
+
+        Driver callbacks run on the driver's IO thread, so results are handed
+        back to the event loop with call_soon_threadsafe.
+        """
+        loop = asyncio.get_running_loop()
+        aio_future = loop.create_future()
+        rows = []
+
+        def on_page(page):
+            rows.extend(page or ())
+            if all_pages and response_future.has_more_pages:
+                response_future.start_fetching_next_page()
+            else:
+                loop.call_soon_threadsafe(_resolve, aio_future, rows)
+
+        def on_error(exc):
+            loop.call_soon_threadsafe(_reject, aio_future, exc)
+
+        response_future.add_callbacks(on_page, on_error)
+        return aio_future
+
     def get_session(self) -> Session:
         """Get the Cassandra session."""
         if not self.session:
             self.connect()
         return self.session
 
-# Create a global instance
-cassandra_client = CassandraClient() 
\ No newline at end of file
+BATCH = "batch"
+
+def _profile(query: str) -> str:
+    """Execution profile for a statement: reads get their own consistency, timeout and speculative execution."""
+    return READ_PROFILE if is_read(query) else WRITE_PROFILE
+
+def _observe(query: str, rows: int, elapsed: float) -> None:
+    """Attribute one completed round trip to the current request and the statement metrics."""
+    record_query(rows, elapsed)
+    name = statement_name(query)
+    QUERY_SECONDS.labels(name).observe(elapsed)
+    QUERY_ROWS.labels(name).inc(rows)
+
+def _instrument(response_future, query: str, started: float) -> None:
+    """
+    Time a ResponseFuture handed back to the caller, up to its first page.
+
+    Callbacks stay registered across start_fetching_next_page(), so only the
+    first one to fire is counted. They run on the driver's IO thread.
+    """
+    QUERIES_IN_FLIGHT.inc()
+    pending = [True]
+
+    def on_page(page):
+        if pending and pending.pop():
+            QUERIES_IN_FLIGHT.dec()
+            name = statement_name(query)
+            QUERY_SECONDS.labels(name).observe(time.perf_counter() - started)
+            QUERY_ROWS.labels(name).inc(len(page or ()))
+
+    def on_error(exc):
+        if pending and pending.pop():
+            QUERIES_IN_FLIGHT.dec()
+            QUERY_ERRORS.labels(statement_name(query)).inc()
+
+    response_future.add_callbacks(on_page, on_error)
+
+def _resolve(aio_future: asyncio.Future, rows: List[Row]) -> None:
+    if not aio_future.done():
+        aio_future.set_result(rows)
+
+def _reject(aio_future: asyncio.Future, exc: BaseException) -> None:
+    if not aio_future.done():
+        aio_future.set_exception(exc)
+
+# Create a global instance; it connects on first use (see aconnect)
+cassandra_client = CassandraClient()
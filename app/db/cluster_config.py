@@ -0,0 +1,213 @@
+"""
+Cluster profile for the Messenger application's Cassandra client.
+
+Everything the driver is tuned with is read from the environment here, so
+a deployment can be adjusted without code changes:
+
+- CASSANDRA_HOST: comma-separated contact points; CASSANDRA_PORT
+- CASSANDRA_LOCAL_DC: datacenter to route to (default: that of the first
+  contact point); CASSANDRA_USED_HOSTS_PER_REMOTE_DC for DC failover
+- CASSANDRA_READ_CONSISTENCY / CASSANDRA_WRITE_CONSISTENCY (LOCAL_QUORUM)
+- CASSANDRA_READ_TIMEOUT / CASSANDRA_WRITE_TIMEOUT: seconds per request
+- CASSANDRA_SPECULATIVE_DELAY_MS / CASSANDRA_SPECULATIVE_ATTEMPTS:
+  speculative execution for idempotent reads (delay 0 disables it)
+- CASSANDRA_READ_RETRIES: times an idempotent read is retried on the next
+  replica after a timeout, unavailable or request error (default 1)
+- CASSANDRA_PROTOCOL_VERSION (negotiated if unset), CASSANDRA_COMPRESSION
+  (auto, lz4, snappy or none), CASSANDRA_CONNECT_TIMEOUT,
+  CASSANDRA_EXECUTOR_THREADS
+- CASSANDRA_CONNECT_RETRIES / CASSANDRA_CONNECT_RETRY_DELAY: attempts and
+  seconds between them when the cluster is unreachable
+- CASSANDRA_CONNECTIONS_PER_HOST: pool size, protocol v1/v2 only (v3+
+  multiplexes up to 32k requests over one connection per host)
+- CASSANDRA_USERNAME / CASSANDRA_PASSWORD: optional plain-text auth
+
+Requests run under one of two execution profiles: READ_PROFILE for SELECTs
+and WRITE_PROFILE (also the default) for everything else. Both route with
+token awareness over DC-aware round robin, so each request goes straight to
+a replica in the local datacenter, and both build rows with
+app.db.rows.row_factory. Each has an explicit retry policy: the driver's
+default retries request errors on the next host without limit, which would
+repeat non-idempotent writes such as counter updates.
+"""
+import logging
+import os
+from typing import Dict, List, Optional
+
+from cassandra import ConsistencyLevel
+from cassandra.auth import PlainTextAuthProvider
+from cassandra.cluster import Cluster, ExecutionProfile, EXEC_PROFILE_DEFAULT
+from cassandra.policies import (
+    ConstantSpeculativeExecutionPolicy,
+    DCAwareRoundRobinPolicy,
+    HostDistance,
+    NoSpeculativeExecutionPolicy,
+    RetryPolicy,
+    TokenAwarePolicy,
+    WriteType,
+)
+
+from app.db.rows import row_factory
+
+logger = logging.getLogger(__name__)
+
+READ_PROFILE = "read"
+WRITE_PROFILE = "write"
+
+def _consistency(name: str) -> int:
+    try:
+        return ConsistencyLevel.name_to_value[name.upper()]
+    except KeyError:
+        raise ValueError(f"Unknown consistency level: {name}")
+
+def _compression(value: str):
+    value = value.lower()
+    if value == "auto":
+        return True  # Whatever the server and installed libraries support
+    if value == "none":
+        return False
+    if value in ("lz4", "snappy"):
+        return value
+    raise ValueError(f"Unknown CASSANDRA_COMPRESSION: {value}")
+
+def _idempotent(query) -> bool:
+    return query is not None and getattr(query, "is_idempotent", False)
+
+class ReadRetryPolicy(RetryPolicy):
+    """
+    Retries an idempotent read on the next replica after a read timeout, an
+    unavailable error or a request error, up to max_retries times.
+    """
+
+    def __init__(self, max_retries: int = 1):
+        self.max_retries = max_retries
+
+    def _next_host(self, query, consistency, retry_num):
+        if retry_num < self.max_retries and _idempotent(query):
+            return self.RETRY_NEXT_HOST, consistency
+        return self.RETHROW, None
+
+    def on_read_timeout(self, query, consistency, required_responses, received_responses, data_retrieved, retry_num):
+        return self._next_host(query, consistency, retry_num)
+
+    def on_write_timeout(self, query, consistency, write_type, required_responses, received_responses, retry_num):
+        return self.RETHROW, None
+
+    def on_unavailable(self, query, consistency, required_replicas, alive_replicas, retry_num):
+        return self._next_host(query, consistency, retry_num)
+
+    def on_request_error(self, query, consistency, error, retry_num):
+        return self._next_host(query, consistency, retry_num)
+
+class WriteRetryPolicy(RetryPolicy):
+    """
+    Retries a write at most once, and only when it cannot have been applied
+    twice: a batch log write that timed out, a coordinator that rejected it
+    as unavailable (nothing was written), or a request error on an
+    idempotent statement. Counter updates and other non-idempotent writes
+    are otherwise never repeated.
+    """
+
+    def on_read_timeout(self, query, consistency, required_responses, received_responses, data_retrieved, retry_num):
+        return self.RETHROW, None
+
+    def on_write_timeout(self, query, consistency, write_type, required_responses, received_responses, retry_num):
+        if retry_num == 0 and write_type == WriteType.BATCH_LOG:
+            return self.RETRY, consistency
+        return self.RETHROW, None
+
+    def on_unavailable(self, query, consistency, required_replicas, alive_replicas, retry_num):
+        return (self.RETRY_NEXT_HOST, consistency) if retry_num == 0 else (self.RETHROW, None)
+
+    def on_request_error(self, query, consistency, error, retry_num):
+        if retry_num == 0 and _idempotent(query):
+            return self.RETRY_NEXT_HOST, consistency
+        return self.RETHROW, None
+
+class ClusterConfig:
+    """Driver settings for the application's cluster, read from the environment."""
+
+    def __init__(self):
+        self.contact_points: List[str] = [h.strip() for h in os.getenv("CASSANDRA_HOST", "localhost").split(",") if h.strip()]
+        self.port = int(os.getenv("CASSANDRA_PORT", "9042"))
+        self.local_dc: Optional[str] = os.getenv("CASSANDRA_LOCAL_DC") or None
+        self.used_hosts_per_remote_dc = int(os.getenv("CASSANDRA_USED_HOSTS_PER_REMOTE_DC", "0"))
+        self.read_consistency = _consistency(os.getenv("CASSANDRA_READ_CONSISTENCY", "LOCAL_QUORUM"))
+        self.write_consistency = _consistency(os.getenv("CASSANDRA_WRITE_CONSISTENCY", "LOCAL_QUORUM"))
+        self.read_timeout = float(os.getenv("CASSANDRA_READ_TIMEOUT", "2.0"))
+        self.write_timeout = float(os.getenv("CASSANDRA_WRITE_TIMEOUT", "5.0"))
+        self.speculative_delay = float(os.getenv("CASSANDRA_SPECULATIVE_DELAY_MS", "50")) / 1000
+        self.speculative_attempts = int(os.getenv("CASSANDRA_SPECULATIVE_ATTEMPTS", "2"))
+        self.read_retries = int(os.getenv("CASSANDRA_READ_RETRIES", "1"))
+        protocol_version = os.getenv("CASSANDRA_PROTOCOL_VERSION")
+        self.protocol_version: Optional[int] = int(protocol_version) if protocol_version else None
+        self.compression = _compression(os.getenv("CASSANDRA_COMPRESSION", "auto"))
+        self.connect_timeout = float(os.getenv("CASSANDRA_CONNECT_TIMEOUT", "5"))
+        self.executor_threads = int(os.getenv("CASSANDRA_EXECUTOR_THREADS", "2"))
+        self.connect_retries = int(os.getenv("CASSANDRA_CONNECT_RETRIES", "10"))
+        self.connect_retry_delay = float(os.getenv("CASSANDRA_CONNECT_RETRY_DELAY", "5"))
+        connections = os.getenv("CASSANDRA_CONNECTIONS_PER_HOST")
+        self.connections_per_host: Optional[int] = int(connections) if connections else None
+        self.username = os.getenv("CASSANDRA_USERNAME")
+        self.password = os.getenv("CASSANDRA_PASSWORD")
+
+    def load_balancing_policy(self) -> TokenAwarePolicy:
+        return TokenAwarePolicy(
+            DCAwareRoundRobinPolicy(local_dc=self.local_dc, used_hosts_per_remote_dc=self.used_hosts_per_remote_dc),
+            shuffle_replicas=True,
+        )
+
+    def execution_profiles(self) -> Dict[object, ExecutionProfile]:
+        """Read and write profiles; the write profile doubles as the default."""
+        if self.speculative_delay > 0 and self.speculative_attempts > 0:
+            # Only applies to statements marked idempotent (prepared SELECTs, see PreparedStatementRegistry)
+            speculative = ConstantSpeculativeExecutionPolicy(self.speculative_delay, self.speculative_attempts)
+        else:
+            speculative = NoSpeculativeExecutionPolicy()
+        read = ExecutionProfile(
+            load_balancing_policy=self.load_balancing_policy(),
+            consistency_level=self.read_consistency,
+            request_timeout=self.read_timeout,
+            speculative_execution_policy=speculative,
+            retry_policy=ReadRetryPolicy(self.read_retries),
+            row_factory=row_factory,
+        )
+        write = ExecutionProfile(
+            load_balancing_policy=self.load_balancing_policy(),
+            consistency_level=self.write_consistency,
+            request_timeout=self.write_timeout,
+            retry_policy=WriteRetryPolicy(),
+            row_factory=row_factory,
+        )
+        return {EXEC_PROFILE_DEFAULT: write, READ_PROFILE: read, WRITE_PROFILE: write}
+
+    def build_cluster(self) -> Cluster:
+        options = dict(
+            contact_points=self.contact_points,
+            port=self.port,
+            compression=self.compression,
+            execution_profiles=self.execution_profiles(),
+            connect_timeout=self.connect_timeout,
+            executor_threads=self.executor_threads,
+        )
+        if self.protocol_version is not None:
+            options['protocol_version'] = self.protocol_version
+        if self.username:
+            options['auth_provider'] = PlainTextAuthProvider(username=self.username, password=self.password)
+        cluster = Cluster(**options)
+        if self.connections_per_host is not None:
+            if self.protocol_version is not None and self.protocol_version < 3:
+                cluster.set_core_connections_per_host(HostDistance.LOCAL, self.connections_per_host)
+                cluster.set_max_connections_per_host(HostDistance.LOCAL, self.connections_per_host)
+            else:
+                logger.warning("CASSANDRA_CONNECTIONS_PER_HOST only applies to protocol v1/v2; ignored")
+        return cluster
+
+    def describe(self) -> str:
+        return (
+            f"{','.join(self.contact_points)}:{self.port} local_dc={self.local_dc or 'auto'} "
+            f"read={ConsistencyLevel.value_to_name[self.read_consistency]}/{self.read_timeout}s "
+            f"write={ConsistencyLevel.value_to_name[self.write_consistency]}/{self.write_timeout}s "
+            f"speculative={int(self.speculative_delay * 1000)}ms x{self.speculative_attempts} "
+            f"read_retries={self.read_retries}"
+        )
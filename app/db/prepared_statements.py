@@ -0,0 +1,72 @@
+"""
+Prepared statement registry for the Messenger application.
+Each distinct CQL string is prepared once per session and then reused.
+"""
+import logging
+import threading
+from typing import Dict, Iterable, Optional
+
+from cassandra.cluster import Session
+from cassandra.query import PreparedStatement
+
+logger = logging.getLogger(__name__)
+
+def is_read(query: str) -> bool:
+    """True for SELECTs, which are safe to retry or execute speculatively."""
+    return query.lstrip()[:6].upper() == "SELECT"
+
+class PreparedStatementRegistry:
+    """
+    Cache of PreparedStatements keyed by CQL string.
+
+    SELECTs are marked idempotent when prepared. Statements are tied to the
+    session they were prepared on: when the client reconnects with a new
+    session the whole registry is dropped, and a single statement can be
+    invalidated (e.g. after a schema change) so the next use prepares it again.
+    """
+
+    def __init__(self):
+        self._session: Optional[Session] = None
+        self._statements: Dict[str, PreparedStatement] = {}
+        self._lock = threading.Lock()
+
+    def _bind_session(self, session: Session) -> None:
+        if session is not self._session:
+            self._statements = {}
+            self._session = session
+
+    def lookup(self, session: Session, query: str) -> Optional[PreparedStatement]:
+        """Return the prepared statement for query if it is already prepared on session."""
+        if session is not self._session:
+            return None
+        return self._statements.get(query)
+
+    def get(self, session: Session, query: str) -> PreparedStatement:
+        """Return the prepared statement for query, preparing it on first use."""
+        statement = self.lookup(session, query)
+        if statement is not None:
+            return statement
+        prepared = session.prepare(query)
+        # Lets the read profile's speculative execution policy apply to it
+        prepared.is_idempotent = is_read(query)
+        with self._lock:
+            self._bind_session(session)
+            statement = self._statements.setdefault(query, prepared)
+        logger.debug("Prepared statement: %s", query)
+        return statement
+
+    def prepare_all(self, session: Session, queries: Iterable[str]) -> None:
+        """Eagerly prepare a set of known queries."""
+        for query in queries:
+            self.get(session, query)
+
+    def invalidate(self, query: Optional[str] = None) -> None:
+        """Forget one prepared statement, or all of them if query is None."""
+        with self._lock:
+            if query is None:
+                self._statements = {}
+            else:
+                self._statements.pop(query, None)
+
+    def __len__(self) -> int:
+        return len(self._statements)
@@ -0,0 +1,70 @@
+"""
+Compact row types for the Messenger application's hot tables.
+
+The driver hands each page of results to a row factory. Instead of a dict
+per row (string keys repeated on every row), rows of messages_by_conversation
+and inbox_by_user become immutable named tuples. The models, caches and
+controllers consume them as they are, without copying them into dicts.
+
+A statement produces typed rows when it selects exactly a row type's
+fields in declaration order. Any other statement still gets dicts.
+Within a page, repeated UUIDs (the partition key and the two participants)
+share one object.
+"""
+import uuid
+from datetime import datetime
+from typing import Any, Callable, Dict, List, NamedTuple, Sequence, Tuple, Union
+
+from cassandra.query import dict_factory
+
+class MessageRow(NamedTuple):
+    """A row of messages_by_conversation."""
+    message_id: uuid.UUID
+    conversation_id: uuid.UUID
+    sender_id: uuid.UUID
+    receiver_id: uuid.UUID
+    content: str
+    created_at: datetime
+
+class ConversationRow(NamedTuple):
+    """A row of inbox_by_user: one conversation as it appears in user_id's inbox."""
+    conversation_id: uuid.UUID
+    user_id: uuid.UUID
+    other_user_id: uuid.UUID
+    last_message: str
+    last_updated: datetime
+
+# A row as returned by row_factory
+Row = Union[MessageRow, ConversationRow, Dict[str, Any]]
+
+def _message_rows(rows: Sequence[Tuple]) -> List[MessageRow]:
+    shared = {}
+    intern = shared.setdefault
+    new = tuple.__new__
+    return [
+        new(MessageRow, (message_id, intern(conversation_id, conversation_id), intern(sender_id, sender_id),
+                         intern(receiver_id, receiver_id), content, created_at))
+        for message_id, conversation_id, sender_id, receiver_id, content, created_at in rows
+    ]
+
+def _conversation_rows(rows: Sequence[Tuple]) -> List[ConversationRow]:
+    shared = {}
+    intern = shared.setdefault
+    new = tuple.__new__
+    return [
+        new(ConversationRow, (conversation_id, intern(user_id, user_id), other_user_id, last_message, last_updated))
+        for conversation_id, user_id, other_user_id, last_message, last_updated in rows
+    ]
+
+# Selected columns -> builder of a page of typed rows
+_ROW_BUILDERS: Dict[Tuple[str, ...], Callable[[Sequence[Tuple]], List[Any]]] = {
+    MessageRow._fields: _message_rows,
+    ConversationRow._fields: _conversation_rows,
+}
+
+def row_factory(colnames: Sequence[str], rows: Sequence[Tuple]) -> List[Row]:
+    """Driver row factory: typed rows for the known column sets, dicts for anything else."""
+    build = _ROW_BUILDERS.get(tuple(colnames))
+    if build is None:
+        return dict_factory(colnames, rows)
+    return build(rows)
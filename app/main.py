@@ -1,25 +1,108 @@
+import asyncio
 import logging
+import time
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Depends
 from fastapi.middleware.cors import CORSMiddleware
-import sys
+from fastapi.responses import JSONResponse, PlainTextResponse
 import os
 
-from app.api.routes import message_router, conversation_router
+from app.api.routes import message_router, conversation_router, realtime_router
 from app.controllers.message_controller import MessageController
 from app.controllers.conversation_controller import ConversationController
+from app.controllers.realtime_controller import RealtimeController
 from app.db.cassandra_client import cassandra_client
+from app.models.cassandra_models import COUNTER_COALESCERS, PREPARED_QUERIES, SearchModel
+from app.util.realtime import bus
+from app.util.log import get_logger, start_request_stats
+from app.util.metrics import REGISTRY, gauge, histogram
 
 # Configure logging
 logging.basicConfig(
-    level=logging.INFO,
+    level=os.getenv("LOG_LEVEL", "INFO").upper(),
     format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
 )
 logger = logging.getLogger(__name__)
+# One summary line per request instead of per-query chatter; sample with LOG_SAMPLE_RATES="app.request=0.1"
+request_log = get_logger("app.request")
+
+REQUEST_SECONDS = histogram("messenger_http_request_seconds", "Request latency per route template.", ("method", "route", "status"))
+REQUEST_QUERIES = histogram(
+    "messenger_http_request_queries", "Cassandra round trips per request.", ("method", "route"),
+    buckets=(0, 1, 2, 3, 4, 6, 8, 12, 16, 32),
+)
+REQUESTS_IN_FLIGHT = gauge("messenger_http_requests_in_flight", "Requests currently being served.").labels()
+WARMUP_SECONDS = gauge("messenger_startup_warmup_seconds", "Time from startup until the app became ready.").labels()
+
+async def warm_up(app: FastAPI) -> None:
+    """
+    Connect to Cassandra, prepare every known statement and start the fan-out bus, concurrently.
+
+    Runs in the background so the server accepts connections immediately;
+    requests that need Cassandra before it finishes wait on the same connect.
+    Retries until it succeeds, recording the last failure for /health/ready.
+    The bus is started once: a retry only repeats the part that failed.
+    """
+    started = time.perf_counter()
+    bus_started = False
+
+    async def warm_cassandra():
+        await cassandra_client.aconnect()
+        await cassandra_client.aprepare_all(PREPARED_QUERIES)
+        logger.info("Prepared %d statements", len(PREPARED_QUERIES))
+
+    async def start_bus():
+        nonlocal bus_started
+        if bus_started:
+            return
+        try:
+            await bus.start()
+        except Exception:
+            # Release whatever the failed start acquired (socket, subscription) before the next attempt
+            await bus.close()
+            raise
+        bus_started = True
+
+    while True:
+        # Both finish before a retry, so a bus start is never still running when the next one begins
+        errors = [e for e in await asyncio.gather(warm_cassandra(), start_bus(), return_exceptions=True) if e is not None]
+        if not errors:
+            break
+        for e in errors:
+            app.state.startup_error = f"{type(e).__name__}: {e}"
+            logger.error("Warmup failed; retrying", exc_info=e)
+        await asyncio.sleep(cassandra_client.config.connect_retry_delay)
+    elapsed = time.perf_counter() - started
+    WARMUP_SECONDS.set(elapsed)
+    app.state.startup_error = None
+    app.state.ready = True
+    logger.info("Application ready after %.2fs", elapsed)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Serve right away, warm up in the background, and release connections on shutdown."""
+    logger.info("Initializing application...")
+    app.state.ready = False
+    app.state.startup_error = None
+    warmup = asyncio.ensure_future(warm_up(app))
+    try:
+        yield
+    finally:
+        logger.info("Shutting down application...")
+        warmup.cancel()
+        await asyncio.gather(warmup, return_exceptions=True)
+        await bus.close()
+        await SearchModel.close()
+        # Counter increments not yet written
+        await asyncio.gather(*(coalescer.close() for coalescer in COUNTER_COALESCERS))
+        # Cluster shutdown joins the driver's threads
+        await asyncio.get_running_loop().run_in_executor(None, cassandra_client.close)
 
 app = FastAPI(
     title="FB Messenger API",
     description="Backend API for FB Messenger implementation using Cassandra",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
 )
 
 # Configure CORS
@@ -31,6 +114,54 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+class RequestObserver:
+    """
+    Record per-route metrics and log one structured line per request with the database work it caused.
+
+    A plain ASGI middleware rather than @app.middleware("http"): it adds no
+    task or memory stream per request, which matters for long-lived streams.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        stats = start_request_stats()
+        status_code = 500
+
+        async def send_observed(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        REQUESTS_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_observed)
+        finally:
+            REQUESTS_IN_FLIGHT.dec()
+            elapsed = time.perf_counter() - stats.started
+            # Label by route template (/api/messages/conversation/{conversation_id}), never the raw path
+            route = scope.get("route")
+            template = route.path if route is not None else "unmatched"
+            REQUEST_SECONDS.labels(scope["method"], template, str(status_code)).observe(elapsed)
+            REQUEST_QUERIES.labels(scope["method"], template).observe(stats.queries)
+            request_log.info(
+                "request",
+                method=scope["method"],
+                path=scope["path"],
+                status=status_code,
+                queries=stats.queries,
+                rows=stats.rows,
+                db_ms=round(stats.db_time * 1000, 2),
+                total_ms=round(elapsed * 1000, 2),
+            )
+
+app.add_middleware(RequestObserver)
+
 # Dependency injection
 def get_message_controller():
     """Dependency for message controller."""
@@ -40,34 +171,42 @@ def get_conversation_controller():
     """Dependency for conversation controller."""
     return ConversationController()
 
+def get_realtime_controller():
+    """Dependency for realtime controller."""
+    return RealtimeController()
+
 app.dependency_overrides[MessageController] = get_message_controller
 app.dependency_overrides[ConversationController] = get_conversation_controller
+app.dependency_overrides[RealtimeController] = get_realtime_controller
 
 # Include routers
 app.include_router(message_router)
 app.include_router(conversation_router)
+app.include_router(realtime_router)
 
 @app.get("/")
 async def root():
     return {"message": "FB Messenger API is running with Cassandra backend"}
 
-@app.on_event("startup")
-async def startup_event():
-    """Initialize services on startup."""
-    logger.info("Initializing application...")
-    try:
-        # Ensure Cassandra connection is established
-        cassandra_client.get_session()
-        logger.info("Cassandra connection established")
-    except Exception as e:
-        logger.exception("Failed to connect to Cassandra")
-        sys.exit(1)
-
-@app.on_event("shutdown")
-async def shutdown_event():
-    """Clean up resources on shutdown."""
-    logger.info("Shutting down application...")
-    cassandra_client.close()
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def metrics():
+    """Prometheus text exposition of request, query and cache metrics."""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/health/live", include_in_schema=False)
+async def liveness():
+    """Liveness: the process is up and serving. Never touches Cassandra."""
+    return {"status": "ok"}
+
+@app.get("/health/ready", include_in_schema=False)
+async def readiness():
+    """Readiness: Cassandra is connected and statements are prepared; 503 until then."""
+    if getattr(app.state, "ready", False) and cassandra_client.session is not None:
+        return {"status": "ready"}
+    body = {"status": "starting"}
+    if getattr(app.state, "startup_error", None):
+        body["error"] = app.state.startup_error
+    return JSONResponse(body, status_code=503)
 
 if __name__ == "__main__":
     import uvicorn
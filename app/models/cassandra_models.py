@@ -2,14 +2,459 @@
 Sample models for interacting with Cassandra tables.
 Students should implement these models based on their database schema design.
 """
+import os
+import sys
 import uuid
+import asyncio
+import functools
 from datetime import *
-import logging
-
-from app.util.util import generate_conversation_id
+from typing import Callable, Dict, Hashable, Optional, Sequence, Tuple
+from cassandra import OperationTimedOut, WriteTimeout
+from cassandra.util import max_uuid_from_time
+from app.util.log import get_logger
+from app.util.util import to_epoch_ms, to_naive_utc, truncate_to_ms, decode_inbox_cursor, message_bucket, encode_bucket_page_token, decode_bucket_page_token, timeuuid_to_micros
+from app.util.cache import LRUCache
+from app.util.counters import CounterCoalescer
+from app.util.conversation_ids import conversation_id_cache, conversation_id as derive_conversation_id
+from app.util.inbox_cache import create_inbox_cache
+from app.util.metrics import REGISTRY, counter, histogram, name_statements
+from app.util.realtime import bus
+from app.util.single_flight import SingleFlight
+from app.util.search import PostingCursor, decode_postings, encode_postings, intersect, posting_key, posting_message_id, terms as message_terms, tokenize
 from app.db.cassandra_client import cassandra_client
+from app.db.rows import ConversationRow, MessageRow
+
+logger = get_logger(__name__)
+
+# CQL used by the models. Every statement is prepared once per session by
+# CassandraClient and bound with positional parameters. Message and inbox
+# reads select exactly the fields of MessageRow / ConversationRow, in order,
+# so the driver returns those instead of dicts (see app.db.rows).
+# Messages are partitioned by (conversation_id, bucket), the month of the
+# message_id (app.util.util.message_bucket), so a long-lived conversation
+# is spread over bounded partitions. message_buckets_by_conversation lists
+# the buckets a conversation has messages in, newest first, so readers walk
+# only those.
+INSERT_MESSAGE = (
+    "INSERT INTO messages_by_conversation_bucket (conversation_id, bucket, message_id, sender_id, receiver_id, content, created_at) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?)"
+)
+INSERT_MESSAGE_BUCKET = (
+    "INSERT INTO message_buckets_by_conversation (conversation_id, bucket) VALUES (?, ?)"
+)
+SELECT_MESSAGE_BUCKETS = (
+    "SELECT bucket FROM message_buckets_by_conversation WHERE conversation_id = ?"
+)
+UPSERT_CONVERSATION_BY_USER = (
+    "INSERT INTO conversations_by_user (user_id, conversation_id, last_message, last_updated, other_user_id) "
+    "VALUES (?, ?, ?, ?, ?)"
+)
+INSERT_CONVERSATION_METADATA = (
+    "INSERT INTO conversation_metadata (conversation_id, created_at) VALUES (?, ?) IF NOT EXISTS"
+)
+SELECT_CONVERSATION_METADATA = (
+    "SELECT conversation_id, created_at FROM conversation_metadata WHERE conversation_id = ?"
+)
+SELECT_LATEST_MESSAGES = (
+    "SELECT message_id, conversation_id, sender_id, receiver_id, content, created_at FROM messages_by_conversation_bucket "
+    "WHERE conversation_id = ? AND bucket = ? ORDER BY message_id DESC LIMIT ?"
+)
+SELECT_MESSAGES_BEFORE = (
+    "SELECT message_id, conversation_id, sender_id, receiver_id, content, created_at FROM messages_by_conversation_bucket "
+    "WHERE conversation_id = ? AND bucket = ? AND message_id < ? ORDER BY message_id DESC LIMIT ?"
+)
+# Unbounded variants paged by the driver (fetch_size + paging_state) instead of LIMIT
+SELECT_MESSAGES_PAGED = (
+    "SELECT message_id, conversation_id, sender_id, receiver_id, content, created_at FROM messages_by_conversation_bucket "
+    "WHERE conversation_id = ? AND bucket = ? ORDER BY message_id DESC"
+)
+SELECT_MESSAGES_BEFORE_PAGED = (
+    "SELECT message_id, conversation_id, sender_id, receiver_id, content, created_at FROM messages_by_conversation_bucket "
+    "WHERE conversation_id = ? AND bucket = ? AND message_id < ? ORDER BY message_id DESC"
+)
+# Oldest first, for replaying what a reconnecting real-time client missed
+SELECT_MESSAGES_AFTER = (
+    "SELECT message_id, conversation_id, sender_id, receiver_id, content, created_at FROM messages_by_conversation_bucket "
+    "WHERE conversation_id = ? AND bucket = ? AND message_id > ? ORDER BY message_id ASC LIMIT ?"
+)
+# The same reads against the pre-bucketing layout (one partition per
+# conversation), for conversations the bucket index does not list yet
+SELECT_LEGACY_LATEST_MESSAGES = (
+    "SELECT message_id, conversation_id, sender_id, receiver_id, content, created_at FROM messages_by_conversation "
+    "WHERE conversation_id = ? ORDER BY message_id DESC LIMIT ?"
+)
+SELECT_LEGACY_MESSAGES_BEFORE = (
+    "SELECT message_id, conversation_id, sender_id, receiver_id, content, created_at FROM messages_by_conversation "
+    "WHERE conversation_id = ? AND message_id < ? ORDER BY message_id DESC LIMIT ?"
+)
+SELECT_LEGACY_MESSAGES_PAGED = (
+    "SELECT message_id, conversation_id, sender_id, receiver_id, content, created_at FROM messages_by_conversation "
+    "WHERE conversation_id = ? ORDER BY message_id DESC"
+)
+SELECT_LEGACY_MESSAGES_BEFORE_PAGED = (
+    "SELECT message_id, conversation_id, sender_id, receiver_id, content, created_at FROM messages_by_conversation "
+    "WHERE conversation_id = ? AND message_id < ? ORDER BY message_id DESC"
+)
+SELECT_LEGACY_MESSAGES_AFTER = (
+    "SELECT message_id, conversation_id, sender_id, receiver_id, content, created_at FROM messages_by_conversation "
+    "WHERE conversation_id = ? AND message_id > ? ORDER BY message_id ASC LIMIT ?"
+)
+# Bucketed read -> its legacy twin (see _message_select)
+LEGACY_MESSAGE_SELECTS = {
+    SELECT_LATEST_MESSAGES: SELECT_LEGACY_LATEST_MESSAGES,
+    SELECT_MESSAGES_BEFORE: SELECT_LEGACY_MESSAGES_BEFORE,
+    SELECT_MESSAGES_PAGED: SELECT_LEGACY_MESSAGES_PAGED,
+    SELECT_MESSAGES_BEFORE_PAGED: SELECT_LEGACY_MESSAGES_BEFORE_PAGED,
+    SELECT_MESSAGES_AFTER: SELECT_LEGACY_MESSAGES_AFTER,
+}
+SELECT_CONVERSATION_LAST_UPDATED = (
+    "SELECT last_updated FROM conversations_by_user WHERE user_id = ? AND conversation_id = ?"
+)
+# inbox_by_user holds one row per (user, conversation), clustered newest first;
+# moving a conversation to the top means deleting its previous row
+INSERT_INBOX_ROW = (
+    "INSERT INTO inbox_by_user (user_id, last_updated, conversation_id, other_user_id, last_message) "
+    "VALUES (?, ?, ?, ?, ?)"
+)
+DELETE_INBOX_ROW = (
+    "DELETE FROM inbox_by_user WHERE user_id = ? AND last_updated = ? AND conversation_id = ?"
+)
+SELECT_LATEST_INBOX = (
+    "SELECT conversation_id, user_id, other_user_id, last_message, last_updated FROM inbox_by_user "
+    "WHERE user_id = ? LIMIT ?"
+)
+SELECT_INBOX_BEFORE = (
+    "SELECT conversation_id, user_id, other_user_id, last_message, last_updated FROM inbox_by_user "
+    "WHERE user_id = ? AND (last_updated, conversation_id) < (?, ?) LIMIT ?"
+)
+SELECT_INBOX_SINCE = (
+    "SELECT conversation_id, user_id, other_user_id, last_message, last_updated FROM inbox_by_user "
+    "WHERE user_id = ? AND last_updated >= ? LIMIT ?"
+)
+# Unread state per (user, conversation): a counter of messages received and a
+# read marker holding that counter's value when the user last read the
+# conversation. unread = received - read_count, so badges never read messages.
+INCREMENT_UNREAD_RECEIVED = (
+    "UPDATE unread_counts_by_user SET received = received + ? WHERE user_id = ? AND conversation_id = ?"
+)
+SELECT_UNREAD_RECEIVED = (
+    "SELECT conversation_id, received FROM unread_counts_by_user WHERE user_id = ? AND conversation_id IN ?"
+)
+# Written at the read message's timestamp, so a marker never moves back to an older message
+UPSERT_READ_MARKER = (
+    "INSERT INTO read_markers_by_user (user_id, conversation_id, last_read_message_id, read_count) "
+    "VALUES (?, ?, ?, ?) USING TIMESTAMP ?"
+)
+SELECT_READ_MARKERS = (
+    "SELECT conversation_id, last_read_message_id, read_count FROM read_markers_by_user WHERE user_id = ? AND conversation_id IN ?"
+)
+# Totals for paginated responses: messages per conversation and conversations
+# per user, counted by the send path and reconciled offline by
+# scripts/recount_totals.py
+INCREMENT_MESSAGE_COUNT = (
+    "UPDATE message_counts_by_conversation SET messages = messages + ? WHERE conversation_id = ?"
+)
+SELECT_MESSAGE_COUNT = (
+    "SELECT messages FROM message_counts_by_conversation WHERE conversation_id = ?"
+)
+INCREMENT_CONVERSATION_COUNT = (
+    "UPDATE conversation_counts_by_user SET conversations = conversations + ? WHERE user_id = ?"
+)
+SELECT_CONVERSATION_COUNT = (
+    "SELECT conversations FROM conversation_counts_by_user WHERE user_id = ?"
+)
+# Search hits of one partition in one read
+SELECT_MESSAGES_IN = (
+    "SELECT message_id, conversation_id, sender_id, receiver_id, content, created_at FROM messages_by_conversation_bucket "
+    "WHERE conversation_id = ? AND bucket = ? AND message_id IN ?"
+)
+# Message search (app.util.search): a per-user inverted index. The send path
+# writes one search_tail_by_user row per participant (the message's terms);
+# compaction folds settled tail rows into search_segments_by_user, one
+# partition per (user, term) holding delta-encoded posting lists keyed by
+# their oldest message_id. Queries join the term segments and scan the tail.
+INSERT_SEARCH_TAIL = (
+    "INSERT INTO search_tail_by_user (user_id, message_id, conversation_id, terms) VALUES (?, ?, ?, ?)"
+)
+SELECT_SEARCH_TAIL = (
+    "SELECT message_id, conversation_id, terms FROM search_tail_by_user WHERE user_id = ? LIMIT ?"
+)
+SELECT_SEARCH_TAIL_BEFORE = (
+    "SELECT message_id, conversation_id, terms FROM search_tail_by_user WHERE user_id = ? AND message_id < ? LIMIT ?"
+)
+SELECT_SETTLED_SEARCH_TAIL = (
+    "SELECT message_id, conversation_id, terms FROM search_tail_by_user "
+    "WHERE user_id = ? AND message_id <= ? ORDER BY message_id ASC LIMIT ?"
+)
+DELETE_SEARCH_TAIL = (
+    "DELETE FROM search_tail_by_user WHERE user_id = ? AND message_id <= ?"
+)
+SELECT_LATEST_SEARCH_SEGMENTS = (
+    "SELECT segment, data FROM search_segments_by_user WHERE user_id = ? AND term = ? LIMIT ?"
+)
+SELECT_SEARCH_SEGMENTS = (
+    "SELECT segment, data FROM search_segments_by_user WHERE user_id = ? AND term = ? AND segment <= ? LIMIT ?"
+)
+SELECT_SEARCH_SEGMENT_SIZES = (
+    "SELECT segment, newest, postings FROM search_segments_by_user WHERE user_id = ? AND term = ?"
+)
+SELECT_SEARCH_SEGMENT_RANGE = (
+    "SELECT segment, data FROM search_segments_by_user WHERE user_id = ? AND term = ? AND segment >= ? AND segment <= ?"
+)
+INSERT_SEARCH_SEGMENT = (
+    "INSERT INTO search_segments_by_user (user_id, term, segment, newest, postings, data) VALUES (?, ?, ?, ?, ?, ?)"
+)
+DELETE_SEARCH_SEGMENT = (
+    "DELETE FROM search_segments_by_user WHERE user_id = ? AND term = ? AND segment = ?"
+)
+# One compaction per user at a time, across workers: a lease that expires on its own
+ACQUIRE_SEARCH_COMPACTION = (
+    "INSERT INTO search_compactions_by_user (user_id, owner) VALUES (?, ?) IF NOT EXISTS USING TTL ?"
+)
+RENEW_SEARCH_COMPACTION = (
+    "UPDATE search_compactions_by_user USING TTL ? SET owner = ? WHERE user_id = ? IF owner = ?"
+)
+RELEASE_SEARCH_COMPACTION = (
+    "DELETE FROM search_compactions_by_user WHERE user_id = ? IF owner = ?"
+)
+
+# Conversations whose conversation_metadata row is known to exist, so the
+# steady-state send path can skip the IF NOT EXISTS (Paxos) write
+known_conversations = LRUCache(maxsize=int(os.getenv("KNOWN_CONVERSATIONS_CACHE_SIZE", "100000")))
+
+# Buckets of recently read conversations, newest first. The TTL bounds how
+# long a bucket another worker opens (at a month boundary) stays unseen here.
+message_buckets = LRUCache(
+    maxsize=int(os.getenv("MESSAGE_BUCKETS_CACHE_CONVERSATIONS", "100000")),
+    ttl=float(os.getenv("MESSAGE_BUCKETS_CACHE_TTL", "30")),
+)
+# (conversation_id, bucket) pairs known to be in message_buckets_by_conversation,
+# so the send path writes the index entry once per conversation and month
+known_message_buckets = LRUCache(maxsize=int(os.getenv("KNOWN_MESSAGE_BUCKETS_CACHE_SIZE", "100000")))
+# Buckets read concurrently at most, when a page spans several sparse months
+MESSAGE_BUCKET_READ_AHEAD = int(os.getenv("MESSAGE_BUCKET_READ_AHEAD", "4"))
+# While messages_by_conversation is being migrated, a conversation with no
+# bucket-index entry is read from it, as the single pseudo-bucket
+# LEGACY_BUCKET (below every real bucket). Set to 0 once the backfill has
+# run after the last instance writing the old table stopped.
+LEGACY_MESSAGE_READS = bool(int(os.getenv("LEGACY_MESSAGE_READS", "1")))
+LEGACY_BUCKET = -1
+
+def _message_select(query: str, conversation_id: uuid.UUID, bucket: int, *params) -> Tuple[str, tuple]:
+    """A bucketed message read and its parameters, or its messages_by_conversation twin for LEGACY_BUCKET."""
+    if bucket == LEGACY_BUCKET:
+        return LEGACY_MESSAGE_SELECTS[query], (conversation_id, *params)
+    return query, (conversation_id, bucket, *params)
+
+# Newest messages of recently read conversations (newest first), so repeat
+# opens of an active chat are served from memory. create_message writes
+# through; the TTL bounds staleness from writes made by other workers.
+RECENT_MESSAGES_PER_CONVERSATION = int(os.getenv("RECENT_MESSAGES_PER_CONVERSATION", "50"))
+# Rough per-message overhead of a MessageRow, its message_id and datetime
+# (the other UUIDs are shared within a page)
+_MESSAGE_OVERHEAD_BYTES = 300
+
+def _messages_size(messages) -> int:
+    return sys.getsizeof(messages) + sum(_MESSAGE_OVERHEAD_BYTES + len(m.content) for m in messages)
+
+recent_messages = LRUCache(
+    maxsize=int(os.getenv("RECENT_MESSAGES_CACHE_CONVERSATIONS", "10000")),
+    ttl=float(os.getenv("RECENT_MESSAGES_CACHE_TTL", "30")),
+    max_bytes=int(os.getenv("RECENT_MESSAGES_CACHE_MAX_BYTES", str(64 * 1024 * 1024))),
+    sizeof=_messages_size,
+)
+# conversation_id -> True once a message was written while a cache fill for it was in flight
+_pending_fills = {}
+
+# Bulk sends: statements in flight per request, and message rows per single-partition batch
+BULK_SEND_CONCURRENCY = int(os.getenv("BULK_SEND_CONCURRENCY", "32"))
+BULK_SEND_BATCH_ROWS = int(os.getenv("BULK_SEND_BATCH_ROWS", "25"))
+
+# Conversation exports: rows per driver page
+EXPORT_FETCH_SIZE = int(os.getenv("EXPORT_FETCH_SIZE", "1000"))
+
+# Batched reads: partition reads in flight per request
+BATCH_GET_CONCURRENCY = int(os.getenv("BATCH_GET_CONCURRENCY", "32"))
+
+# Counters (unread, totals): increments are summed in memory and written
+# every COUNTER_FLUSH_INTERVAL_MS (or once COUNTER_FLUSH_MAX_KEYS are pending),
+# one counter batch per partition, at most COUNTER_FLUSH_CONCURRENCY in flight
+COUNTER_FLUSH_INTERVAL = float(os.getenv("COUNTER_FLUSH_INTERVAL_MS", "500")) / 1000
+COUNTER_FLUSH_MAX_KEYS = int(os.getenv("COUNTER_FLUSH_MAX_KEYS", "10000"))
+COUNTER_FLUSH_CONCURRENCY = int(os.getenv("COUNTER_FLUSH_CONCURRENCY", "32"))
+
+def _counter_writer(name: str, query: str, partition: Callable[[Hashable], Hashable] = lambda key: key):
+    """
+    Write function for a CounterCoalescer whose keys bind query: "UPDATE ... SET c = c + ? WHERE ...".
+
+    A key is the WHERE clause's value (or a tuple of them); partition maps
+    it to its partition key. Updates to one partition share a counter batch.
+    Counter updates are not idempotent: a write that timed out may have been
+    applied, so it is dropped rather than retried (undercounting at worst).
+    """
+    def bind(key, delta):
+        return query, (delta,) + (key if isinstance(key, tuple) else (key,))
+
+    async def write(deltas: Dict[Hashable, int]) -> Dict[Hashable, int]:
+        by_partition = {}
+        for key, delta in deltas.items():
+            by_partition.setdefault(partition(key), []).append((key, delta))
+        semaphore = asyncio.Semaphore(COUNTER_FLUSH_CONCURRENCY)
+
+        async def write_partition(updates):
+            async with semaphore:
+                if len(updates) == 1:
+                    await cassandra_client.aexecute(*bind(*updates[0]))
+                else:
+                    await cassandra_client.aexecute_batch([bind(key, delta) for key, delta in updates], counter=True)
+
+        outcomes = await asyncio.gather(*(write_partition(updates) for updates in by_partition.values()), return_exceptions=True)
+        retry = {}
+        for updates, outcome in zip(by_partition.values(), outcomes):
+            if not isinstance(outcome, BaseException):
+                continue
+            if isinstance(outcome, (OperationTimedOut, WriteTimeout)):
+                logger.warning("model.counter_updates_dropped", counter=name, updates=len(updates), error=repr(outcome))
+                continue
+            retry.update(updates)
+        return retry
+
+    return write
+
+def _coalescer(name: str, query: str, partition: Callable[[Hashable], Hashable] = lambda key: key) -> CounterCoalescer:
+    return CounterCoalescer(name, _counter_writer(name, query, partition), COUNTER_FLUSH_INTERVAL, COUNTER_FLUSH_MAX_KEYS)
+
+# Keyed by (user_id, conversation_id)
+unread_increments = _coalescer("unread", INCREMENT_UNREAD_RECEIVED, partition=lambda key: key[0])
+# Keyed by conversation_id and by user_id
+message_count_increments = _coalescer("messages", INCREMENT_MESSAGE_COUNT)
+conversation_count_increments = _coalescer("conversations", INCREMENT_CONVERSATION_COUNT)
+COUNTER_COALESCERS = (unread_increments, message_count_increments, conversation_count_increments)
+
+# Totals read recently (this worker's own increments are added in place);
+# the TTL bounds how long other workers' writes go unseen
+TOTALS_CACHE_TTL = float(os.getenv("TOTALS_CACHE_TTL", "5"))
+message_counts = LRUCache(maxsize=int(os.getenv("MESSAGE_COUNTS_CACHE_SIZE", "100000")), ttl=TOTALS_CACHE_TTL)
+conversation_counts = LRUCache(maxsize=int(os.getenv("CONVERSATION_COUNTS_CACHE_SIZE", "100000")), ttl=TOTALS_CACHE_TTL)
+
+# Identical concurrent reads share one query (app.util.single_flight)
+message_reads = SingleFlight("messages")
+inbox_reads = SingleFlight("inbox")
+total_reads = SingleFlight("totals")
+
+async def _read_total(cache: LRUCache, increments: CounterCoalescer, query: str, key: Hashable) -> int:
+    """A maintained total: one counter read plus this worker's pending increments, cached for TOTALS_CACHE_TTL."""
+    count = cache.get(key)
+    if count is None:
+        count = await total_reads.do((query, key), lambda: _fill_total(cache, increments, query, key))
+    return count
+
+async def _fill_total(cache: LRUCache, increments: CounterCoalescer, query: str, key: Hashable) -> int:
+    rows = await cassandra_client.aexecute(query, (key,))
+    stored = next(iter(rows[0].values())) if rows else None
+    count = max(0, stored or 0) + increments.pending(key)
+    cache.set(key, count)
+    return count
+
+def _add_to_cached_count(cache: LRUCache, key: Hashable) -> None:
+    """Count a local write in a cached total, if there is one, without extending its TTL."""
+    count = cache.peek(key)
+    if count is not None:
+        cache.replace(key, count + 1)
 
-logger = logging.getLogger(__name__)
+# Message search: terms per query, and a page of hits is fetched with
+# SEARCH_SEGMENTS_PER_READ segments per term read at a time
+SEARCH_MAX_TERMS = int(os.getenv("SEARCH_MAX_TERMS", "8"))
+SEARCH_SEGMENTS_PER_READ = int(os.getenv("SEARCH_SEGMENTS_PER_READ", "4"))
+# A user's tail is compacted once this worker wrote SEARCH_TAIL_COMPACT_ROWS
+# rows to it, or a search read that many; each round folds as many rows
+SEARCH_TAIL_COMPACT_ROWS = int(os.getenv("SEARCH_TAIL_COMPACT_ROWS", "500"))
+# Most tail rows one search reads; a search that hits the cap also schedules a compaction
+SEARCH_TAIL_SCAN_ROWS = max(SEARCH_TAIL_COMPACT_ROWS, int(os.getenv("SEARCH_TAIL_SCAN_ROWS", "1000")))
+# Tail rows younger than this are left for a later compaction, so a row
+# still being written is never deleted unfolded
+SEARCH_COMPACT_SETTLE = float(os.getenv("SEARCH_COMPACT_SETTLE_SECONDS", "60"))
+SEARCH_COMPACTION_LEASE = int(os.getenv("SEARCH_COMPACTION_LEASE_SECONDS", "60"))
+SEARCH_COMPACT_CONCURRENCY = int(os.getenv("SEARCH_COMPACT_CONCURRENCY", "32"))
+# A segment is topped up with newer postings until it holds this many
+SEARCH_SEGMENT_MAX_POSTINGS = int(os.getenv("SEARCH_SEGMENT_MAX_POSTINGS", "1024"))
+# user_id -> tail rows this worker wrote since it last asked for a compaction
+search_tail_rows = LRUCache(maxsize=int(os.getenv("SEARCH_TAIL_USERS", "100000")))
+# user_id -> this worker's running compaction
+_search_compactions: Dict[uuid.UUID, asyncio.Task] = {}
+
+SEARCH_COMPACTIONS = counter("messenger_search_compactions_total", "Search index compactions, by outcome.", ("outcome",))
+SEARCH_ROWS_COMPACTED = counter("messenger_search_tail_rows_compacted_total", "Search tail rows folded into segments.").labels()
+SEARCH_SEGMENTS_READ = histogram(
+    "messenger_search_segments_read", "Index segments read per search.",
+    buckets=(0, 1, 2, 4, 8, 16, 32, 64, 128, 256),
+).labels()
+
+# First inbox page per user, updated in place by the send path
+INBOX_CACHE_PAGE_SIZE = int(os.getenv("INBOX_CACHE_PAGE_SIZE", "20"))
+inbox_cache = create_inbox_cache(INBOX_CACHE_PAGE_SIZE)
+# user_id -> True once the user's inbox was written while a cache fill for it was in flight
+_pending_inbox_fills = {}
+
+# Prepared eagerly at application startup
+PREPARED_QUERIES = (
+    INSERT_MESSAGE,
+    INSERT_MESSAGE_BUCKET,
+    SELECT_MESSAGE_BUCKETS,
+    UPSERT_CONVERSATION_BY_USER,
+    INSERT_CONVERSATION_METADATA,
+    SELECT_CONVERSATION_METADATA,
+    SELECT_LATEST_MESSAGES,
+    SELECT_MESSAGES_BEFORE,
+    SELECT_MESSAGES_PAGED,
+    SELECT_MESSAGES_BEFORE_PAGED,
+    SELECT_MESSAGES_AFTER,
+    SELECT_LEGACY_LATEST_MESSAGES,
+    SELECT_LEGACY_MESSAGES_BEFORE,
+    SELECT_LEGACY_MESSAGES_PAGED,
+    SELECT_LEGACY_MESSAGES_BEFORE_PAGED,
+    SELECT_LEGACY_MESSAGES_AFTER,
+    SELECT_CONVERSATION_LAST_UPDATED,
+    INSERT_INBOX_ROW,
+    DELETE_INBOX_ROW,
+    SELECT_LATEST_INBOX,
+    SELECT_INBOX_BEFORE,
+    SELECT_INBOX_SINCE,
+    INCREMENT_UNREAD_RECEIVED,
+    SELECT_UNREAD_RECEIVED,
+    UPSERT_READ_MARKER,
+    SELECT_READ_MARKERS,
+    INCREMENT_MESSAGE_COUNT,
+    SELECT_MESSAGE_COUNT,
+    INCREMENT_CONVERSATION_COUNT,
+    SELECT_CONVERSATION_COUNT,
+    SELECT_MESSAGES_IN,
+    INSERT_SEARCH_TAIL,
+    SELECT_SEARCH_TAIL,
+    SELECT_SEARCH_TAIL_BEFORE,
+    SELECT_SETTLED_SEARCH_TAIL,
+    DELETE_SEARCH_TAIL,
+    SELECT_LATEST_SEARCH_SEGMENTS,
+    SELECT_SEARCH_SEGMENTS,
+    SELECT_SEARCH_SEGMENT_SIZES,
+    SELECT_SEARCH_SEGMENT_RANGE,
+    INSERT_SEARCH_SEGMENT,
+    DELETE_SEARCH_SEGMENT,
+    ACQUIRE_SEARCH_COMPACTION,
+    RENEW_SEARCH_COMPACTION,
+    RELEASE_SEARCH_COMPACTION,
+)
+# Label each statement in /metrics by its constant name, e.g. statement="select_latest_messages"
+name_statements({query: name.lower() for name, query in list(globals().items()) if name.isupper() and query in PREPARED_QUERIES})
+
+REGISTRY.register_cache("known_conversations", known_conversations.stats)
+REGISTRY.register_cache("conversation_ids", conversation_id_cache.stats)
+REGISTRY.register_cache("message_buckets", message_buckets.stats)
+REGISTRY.register_cache("known_message_buckets", known_message_buckets.stats)
+REGISTRY.register_cache("recent_messages", recent_messages.stats)
+REGISTRY.register_cache("inbox", inbox_cache.stats)
+REGISTRY.register_cache("message_counts", message_counts.stats)
+REGISTRY.register_cache("conversation_counts", conversation_counts.stats)
 
 class MessageModel:
     """
@@ -24,120 +469,426 @@ class MessageModel:
     # TODO: Implement the following methods
     
     @staticmethod
-    async def create_message(conversation_id: str, sender_id: str, receiver_id: str, content: str):
+    async def create_message(conversation_id: uuid.UUID, sender_id: uuid.UUID, receiver_id: uuid.UUID, content: str):
         """
-        Create a new message and update conversations_by_user for both participants.
+        Create a new message and move the conversation to the top of both participants' inboxes.
         """
 
         # Generate message_id as timeuuid
         message_id = uuid.uuid1()
-        created_at = datetime.now(timezone.utc)
-        # Insert into messages_by_conversation
-        insert_query = (
-            "INSERT INTO messages_by_conversation (conversation_id, message_id, sender_id, receiver_id, content, created_at) "
-            "VALUES (%(conversation_id)s, %(message_id)s, %(sender_id)s, %(receiver_id)s, %(content)s, %(created_at)s)"
-        )
-        params = {
-            'conversation_id': uuid.UUID(conversation_id),
-            'message_id': message_id,
-            'sender_id': uuid.UUID(sender_id),
-            'receiver_id': uuid.UUID(receiver_id),
-            'content': content,
-            'created_at': created_at
-        }
-        cassandra_client.execute(insert_query, params)
-
-        # Update conversations_by_user for both sender and receiver
-        update_query = (
-            "INSERT INTO conversations_by_user (user_id, conversation_id, last_message, last_updated, other_user_id) "
-            "VALUES (%(user_id)s, %(conversation_id)s, %(last_message)s, %(last_updated)s, %(other_user_id)s)"
-        )
-        for user_id, other_user_id in [
-            (sender_id, receiver_id),
-            (receiver_id, sender_id)
-        ]:
-            update_params = {
-                'user_id': uuid.UUID(user_id),
-                'conversation_id': uuid.UUID(conversation_id),
-                'last_message': content,
-                'last_updated': created_at,
-                'other_user_id': uuid.UUID(other_user_id)
-            }
-            cassandra_client.execute(update_query, update_params)
-
-        # Optionally, insert into conversation_metadata if not exists
-        meta_query = (
-            "INSERT INTO conversation_metadata (conversation_id, created_at) VALUES (%(conversation_id)s, %(created_at)s) IF NOT EXISTS"
-        )
-        meta_params = {
-            'conversation_id': uuid.UUID(conversation_id),
-            'created_at': created_at
-        }
+        # Cassandra keeps millisecond precision; truncating here keeps the
+        # returned value equal to the stored one (and usable in inbox deletes)
+        created_at = truncate_to_ms(datetime.now(timezone.utc))
+        bucket = message_bucket(message_id)
+        await MessageModel._ensure_message_bucket(conversation_id, bucket)
+
+        message = MessageRow(message_id, conversation_id, sender_id, receiver_id, content, created_at)
+        # The message row, both inbox updates and the search index live in
+        # different partitions, so they are sent concurrently rather than batched
+        writes = [
+            cassandra_client.aexecute(
+                INSERT_MESSAGE,
+                (conversation_id, bucket, message_id, sender_id, receiver_id, content, created_at)
+            ),
+            ConversationModel.update_inbox(sender_id, receiver_id, conversation_id, content, created_at),
+            ConversationModel.update_inbox(receiver_id, sender_id, conversation_id, content, created_at),
+            SearchModel.index_new_messages([message]),
+        ]
+        # Only a conversation we have not seen yet pays for the IF NOT EXISTS write
+        if known_conversations.get(conversation_id) is None:
+            writes.append(MessageModel._ensure_conversation_metadata(conversation_id, created_at))
+        await asyncio.gather(*writes)
+
+        MessageModel._count_new_message(message)
+        MessageModel._cache_new_message(message)
+        bus.publish(message)
+        return message
+
+    @staticmethod
+    async def create_messages(messages):
+        """
+        Create many messages, grouped by conversation.
+
+        Each conversation's rows are written as unlogged batches, one
+        partition (conversation and bucket) each, and each participant's
+        inbox is moved once, to the conversation's newest message. At most BULK_SEND_CONCURRENCY
+        statements are in flight at a time.
+
+        Args:
+            messages: (conversation_id, sender_id, receiver_id, content) tuples, IDs as uuid.UUID
+
+        Returns:
+            One entry per input, in order: the created MessageRow, or the
+            exception that prevented it from being stored
+        """
+        results = [None] * len(messages)
+        # conversation_id -> [(index, MessageRow, params)], oldest first
+        groups = {}
+        for index, (conversation_id, sender_id, receiver_id, content) in enumerate(messages):
+            message_id = uuid.uuid1()
+            created_at = truncate_to_ms(datetime.now(timezone.utc))
+            message = MessageRow(message_id, conversation_id, sender_id, receiver_id, content, created_at)
+            params = (conversation_id, message_bucket(message_id), message_id, sender_id, receiver_id, content, created_at)
+            groups.setdefault(conversation_id, []).append((index, message, params))
+
+        semaphore = asyncio.Semaphore(BULK_SEND_CONCURRENCY)
+
+        async def bounded(write):
+            async with semaphore:
+                return await write
+
+        async def write_conversation(conversation_id, group):
+            # Oldest first, so each bucket's rows are contiguous
+            by_bucket = {}
+            for item in group:
+                by_bucket.setdefault(item[2][1], []).append(item)
+            try:
+                await asyncio.gather(*(bounded(MessageModel._ensure_message_bucket(conversation_id, bucket)) for bucket in by_bucket))
+            except Exception as e:
+                for index, _, _ in group:
+                    results[index] = e
+                return
+            chunks = [
+                rows[i:i + BULK_SEND_BATCH_ROWS]
+                for rows in by_bucket.values()
+                for i in range(0, len(rows), BULK_SEND_BATCH_ROWS)
+            ]
+            outcomes = await asyncio.gather(
+                *(bounded(cassandra_client.aexecute_batch([(INSERT_MESSAGE, params) for _, _, params in chunk], logged=False))
+                  for chunk in chunks),
+                return_exceptions=True
+            )
+            written = []
+            for chunk, outcome in zip(chunks, outcomes):
+                for index, message, _ in chunk:
+                    if isinstance(outcome, BaseException):
+                        results[index] = outcome
+                    else:
+                        written.append((index, message))
+            if not written:
+                return
+            newest = written[-1][1]
+            writes = [
+                bounded(ConversationModel.update_inbox(newest.sender_id, newest.receiver_id, newest.conversation_id, newest.content, newest.created_at)),
+                bounded(ConversationModel.update_inbox(newest.receiver_id, newest.sender_id, newest.conversation_id, newest.content, newest.created_at)),
+            ]
+            if known_conversations.get(conversation_id) is None:
+                writes.append(bounded(MessageModel._ensure_conversation_metadata(conversation_id, written[0][1].created_at)))
+            # Bounded by its own semaphore; never raises
+            writes.append(SearchModel.index_new_messages([message for _, message in written]))
+            try:
+                await asyncio.gather(*writes)
+            except Exception as e:
+                # Same outcome as a failed single send: the rows exist but the inboxes may not show them
+                logger.exception("model.bulk_inbox_update_failed", conversation_id=conversation_id)
+                for index, _ in written:
+                    results[index] = e
+                return
+            for index, message in written:
+                results[index] = message
+                MessageModel._count_new_message(message)
+                MessageModel._cache_new_message(message)
+                bus.publish(message)
+
+        await asyncio.gather(*(write_conversation(conversation_id, group) for conversation_id, group in groups.items()))
+        logger.debug("model.create_messages", messages=len(messages), conversations=len(groups))
+        return results
+
+    @staticmethod
+    def _count_new_message(message: MessageRow):
+        """
+        Count a stored message in its conversation's total and as unread for its receiver (coalesced).
+        """
+        message_count_increments.add(message.conversation_id)
+        _add_to_cached_count(message_counts, message.conversation_id)
+        if message.receiver_id != message.sender_id:
+            unread_increments.add((message.receiver_id, message.conversation_id))
+
+    @staticmethod
+    def _cache_new_message(message: MessageRow):
+        """
+        Write a new message through to the recent-messages cache, if the conversation is cached.
+        """
+        conversation_id = str(message.conversation_id)
+        if conversation_id in _pending_fills:
+            _pending_fills[conversation_id] = True
+        # A read that joins a fill from before this message would miss it
+        message_reads.forget(conversation_id)
+        cached = recent_messages.peek(conversation_id)
+        if cached is None:
+            return
+        if message.created_at.tzinfo is not None:
+            # Naive UTC, like timestamps read back from Cassandra, so a cached page renders them all alike
+            message = message._replace(created_at=to_naive_utc(message.created_at))
+        # Usually the newest message; concurrent sends can land slightly out of order
+        index = 0
+        while index < len(cached) and cached[index].message_id.time > message.message_id.time:
+            index += 1
+        updated = cached[:index] + [message] + cached[index:]
+        # replace keeps the entry's expiry, so other workers' messages still show up within the TTL
+        recent_messages.replace(conversation_id, updated[:RECENT_MESSAGES_PER_CONVERSATION])
+
+    @staticmethod
+    async def _ensure_message_bucket(conversation_id: uuid.UUID, bucket: int):
+        """
+        Add a bucket to the conversation's bucket index, unless it is known to be there.
+
+        Awaited before the message is written: a message in a bucket the index
+        does not list would never be read, while an index entry without
+        messages only costs readers an empty read.
+        """
+        if known_message_buckets.get((conversation_id, bucket)) is not None:
+            return
+        await cassandra_client.aexecute(INSERT_MESSAGE_BUCKET, (conversation_id, bucket))
+        known_message_buckets.set((conversation_id, bucket), True)
+        cached = message_buckets.peek(conversation_id)
+        if cached is not None and bucket not in cached:
+            message_buckets.set(conversation_id, tuple(sorted(cached + (bucket,), reverse=True)))
+
+    @staticmethod
+    async def _ensure_conversation_metadata(conversation_id: uuid.UUID, created_at: datetime):
+        """
+        Insert conversation_metadata if it does not exist yet and remember the conversation as known.
+        """
         try:
-            cassandra_client.execute(meta_query, meta_params)
+            await cassandra_client.aexecute(INSERT_CONVERSATION_METADATA, (conversation_id, created_at))
         except Exception:
-            pass  # Ignore if already exists
-
-        return {
-            'message_id': str(message_id),
-            'conversation_id': conversation_id,
-            'sender_id': sender_id,
-            'receiver_id': receiver_id,
-            'content': content,
-            'created_at': created_at
-        }
+            logger.exception("model.ensure_conversation_metadata_failed", conversation_id=conversation_id)
+            return
+        known_conversations.set(conversation_id, True)
 
     @staticmethod
     async def get_conversation_messages(conversation_id: str, limit: int = 20, last_message_id: str = None):
         """
         Get messages for a conversation with stateless, cursor-based pagination (latest first), using last_message_id for paging.
+        The first page is served from the recent-messages cache when possible.
         """
-        logger.info(f"[Model] Fetching messages for conversation_id={conversation_id}, limit={limit}, last_message_id={last_message_id}")
-        if last_message_id:
-            query = (
-                "SELECT * FROM messages_by_conversation WHERE conversation_id = %(conversation_id)s AND message_id < %(last_message_id)s ORDER BY message_id DESC LIMIT %(limit)s"
-            )
-            params = {
-                'conversation_id': uuid.UUID(conversation_id),
-                'last_message_id': uuid.UUID(last_message_id),
-                'limit': limit
-            }
-        else:
-            query = (
-                "SELECT * FROM messages_by_conversation WHERE conversation_id = %(conversation_id)s ORDER BY message_id DESC LIMIT %(limit)s"
-            )
-            params = {
-                'conversation_id': uuid.UUID(conversation_id),
-                'limit': limit
-            }
-        logger.info(f"[Model] Query: {query}, Params: {params}")
-        rows = cassandra_client.execute(query, params)
-        logger.info(f"[Model] Retrieved {len(rows)} rows from Cassandra")
-        # Log the first row if available
-        if rows:
-            logger.info(f"[Model] First row: {rows[0]}")
-        else:
-            logger.info("[Model] No rows returned")
-        return [{'message_id': str(row['message_id']), 'conversation_id': conversation_id, 'sender_id': str(row['sender_id']), 'receiver_id': str(row['receiver_id']), 'content': row['content'], 'created_at': row['created_at']} for row in rows]
+        if limit < 1:
+            raise ValueError("limit must be at least 1")
+        # Canonical form, as the send path keys the cache, the fill guard and single flight;
+        # an invalid ID raises ValueError before any of them is touched
+        conversation_id = str(uuid.UUID(conversation_id))
+        last_message_id = str(uuid.UUID(last_message_id)) if last_message_id else None
+        if not last_message_id and limit <= RECENT_MESSAGES_PER_CONVERSATION:
+            cached = recent_messages.get(conversation_id)
+            logger.debug("model.recent_messages", conversation_id=conversation_id, limit=limit, hit=cached is not None)
+            if cached is None:
+                # Concurrent misses for the conversation share one fill, whatever their limit
+                cached = await message_reads.do(conversation_id, lambda: MessageModel._fill_recent_messages(conversation_id))
+            return cached[:limit]
+        return await message_reads.do(
+            (conversation_id, limit, last_message_id),
+            lambda: MessageModel._fetch_messages(conversation_id, limit, last_message_id)
+        )
 
     @staticmethod
-    async def get_messages_before_message_id(conversation_id: str, before_message_id: str, page: int = 1, limit: int = 20):
+    async def _fill_recent_messages(conversation_id: str):
         """
-        Get messages before a specific message_id (timeuuid) with pagination.
+        Read a full recent-messages cache entry, so any limit up to the cap can be served from it, and cache it
+        unless the conversation was written to meanwhile.
         """
-        offset = (page - 1) * limit
-        query = (
-            "SELECT * FROM messages_by_conversation WHERE conversation_id = %(conversation_id)s AND message_id < %(before_message_id)s ORDER BY message_id DESC LIMIT %(fetch_count)s"
-        )
-        params = {
-            'conversation_id': uuid.UUID(conversation_id),
-            'before_message_id': uuid.UUID(before_message_id),
-            'fetch_count': offset + limit
-        }
-        rows = cassandra_client.execute(query, params)
-        page_rows = rows[offset:offset+limit]
-        return [{'message_id': str(row['message_id']), 'conversation_id': conversation_id, 'sender_id': str(row['sender_id']), 'receiver_id': str(row['receiver_id']), 'content': row['content'], 'created_at': row['created_at']} for row in page_rows]
+        _pending_fills.setdefault(conversation_id, False)
+        try:
+            messages = await MessageModel._fetch_messages(conversation_id, RECENT_MESSAGES_PER_CONVERSATION)
+        finally:
+            written_meanwhile = _pending_fills.pop(conversation_id, False)
+        if not written_meanwhile:
+            recent_messages.set(conversation_id, messages)
+        return messages
+
+    @staticmethod
+    async def get_message_count(conversation_id: str) -> int:
+        """
+        Number of messages in a conversation, from its maintained counter (no message rows are read).
+        """
+        return await _read_total(message_counts, message_count_increments, SELECT_MESSAGE_COUNT, uuid.UUID(conversation_id))
+
+    @staticmethod
+    async def get_many_conversation_messages(requests):
+        """
+        Read pages of several conversations concurrently.
+
+        Each page goes through get_conversation_messages, so first pages
+        are still served from the recent-messages cache. At most
+        BATCH_GET_CONCURRENCY partition reads are in flight at a time.
+
+        Args:
+            requests: (conversation_id, limit, last_message_id or None) tuples
+
+        Returns:
+            One entry per request, in order: the list of messages, or the
+            exception raised while reading that conversation
+        """
+        semaphore = asyncio.Semaphore(BATCH_GET_CONCURRENCY)
+
+        async def read(conversation_id, limit, last_message_id):
+            async with semaphore:
+                return await MessageModel.get_conversation_messages(conversation_id, limit, last_message_id)
+
+        return await asyncio.gather(*(read(*request) for request in requests), return_exceptions=True)
+
+    @staticmethod
+    async def _message_buckets(conversation_id: uuid.UUID, before_message_id: Optional[uuid.UUID] = None):
+        """
+        The conversation's buckets, newest first, from the bucket index (cached briefly).
+        With before_message_id, only the buckets that can hold older messages.
+        A conversation the index does not list yet is (LEGACY_BUCKET,) while
+        LEGACY_MESSAGE_READS is on.
+        """
+        buckets = message_buckets.get(conversation_id)
+        if buckets is None:
+            rows = await cassandra_client.aexecute(SELECT_MESSAGE_BUCKETS, (conversation_id,))
+            buckets = tuple(sorted((row['bucket'] for row in rows), reverse=True))
+            message_buckets.set(conversation_id, buckets)
+        if not buckets and LEGACY_MESSAGE_READS:
+            return (LEGACY_BUCKET,)
+        if before_message_id is not None:
+            newest = message_bucket(before_message_id)
+            buckets = tuple(bucket for bucket in buckets if bucket <= newest)
+        return buckets
+
+    @staticmethod
+    async def _fetch_messages(conversation_id: str, limit: int, last_message_id: str = None):
+        """
+        Read a page of messages, latest first, walking the conversation's buckets newest first.
 
+        Usually the newest bucket fills the page. When it does not, the next
+        buckets are read in waves of 1, 2, 4... (up to MESSAGE_BUCKET_READ_AHEAD)
+        concurrent reads, so a sparse conversation does not cost a round
+        trip per month.
+        """
+        conversation_uuid = uuid.UUID(conversation_id)
+        before = uuid.UUID(last_message_id) if last_message_id else None
+        buckets = await MessageModel._message_buckets(conversation_uuid, before)
+
+        async def read(bucket, count):
+            if before is not None:
+                return await cassandra_client.aexecute(*_message_select(SELECT_MESSAGES_BEFORE, conversation_uuid, bucket, before, count))
+            return await cassandra_client.aexecute(*_message_select(SELECT_LATEST_MESSAGES, conversation_uuid, bucket, count))
+
+        rows = []
+        position, wave = 0, 1
+        while position < len(buckets) and len(rows) < limit:
+            remaining = limit - len(rows)
+            for page in await asyncio.gather(*(read(bucket, remaining) for bucket in buckets[position:position + wave])):
+                rows.extend(page)
+            position += wave
+            wave = min(wave * 2, MESSAGE_BUCKET_READ_AHEAD)
+        del rows[limit:]
+        logger.debug("model.fetch_messages", conversation_id=conversation_id, limit=limit, last_message_id=last_message_id,
+                     buckets=position, rows=len(rows))
+        return rows
+
+    @staticmethod
+    async def get_messages_after(conversation_id: str, after_message_id: str, limit: int = 100):
+        """
+        Get messages newer than after_message_id, oldest first (real-time resume).
+        """
+        conversation_uuid = uuid.UUID(conversation_id)
+        after = uuid.UUID(after_message_id)
+        oldest = message_bucket(after)
+        rows = []
+        for bucket in reversed(await MessageModel._message_buckets(conversation_uuid)):
+            if bucket < oldest and bucket != LEGACY_BUCKET:
+                continue
+            rows.extend(await cassandra_client.aexecute(
+                *_message_select(SELECT_MESSAGES_AFTER, conversation_uuid, bucket, after, limit - len(rows))))
+            if len(rows) >= limit:
+                break
+        return rows
+
+    @staticmethod
+    async def get_messages_before_message_id(conversation_id: str, before_message_id: str = None, limit: int = 20, page_token: str = None):
+        """
+        Get messages before a specific message_id (timeuuid), latest first, paged by the driver.
+
+        Every page resumes from Cassandra's paging state in the bucket the
+        previous page stopped in, moving on to older buckets to fill the
+        page, so deep pages cost the same as the first one. page_token is
+        the token returned with the previous page and is only valid for the
+        same conversation_id, before_message_id and limit.
+
+        Returns:
+            Tuple of (messages, token for the next page or None)
+        """
+        # A fetch size of 0 would make the driver read the whole bucket
+        if limit < 1:
+            raise ValueError("limit must be at least 1")
+        conversation_uuid = uuid.UUID(conversation_id)
+        before = uuid.UUID(before_message_id) if before_message_id else None
+        buckets = await MessageModel._message_buckets(conversation_uuid, before)
+        paging_state = None
+        if page_token:
+            resume_bucket, paging_state = decode_bucket_page_token(page_token)
+            buckets = tuple(bucket for bucket in buckets if bucket <= resume_bucket)
+            if not buckets or buckets[0] != resume_bucket:
+                paging_state = None
+        messages = []
+        next_token = None
+        for position, bucket in enumerate(buckets):
+            if before is not None:
+                query, params = _message_select(SELECT_MESSAGES_BEFORE_PAGED, conversation_uuid, bucket, before)
+            else:
+                query, params = _message_select(SELECT_MESSAGES_PAGED, conversation_uuid, bucket)
+            rows, next_paging_state = await cassandra_client.aexecute_page(
+                query, params, fetch_size=limit - len(messages), paging_state=paging_state if position == 0 else None)
+            messages.extend(rows)
+            if next_paging_state:
+                next_token = encode_bucket_page_token(bucket, next_paging_state)
+                break
+            if len(messages) >= limit:
+                if position + 1 < len(buckets):
+                    next_token = encode_bucket_page_token(buckets[position + 1], None)
+                break
+        return messages, next_token if messages else None
+
+    @staticmethod
+    def iter_conversation_messages(conversation_id: str, before_message_id: str = None, fetch_size: int = EXPORT_FETCH_SIZE):
+        """
+        Every message of a conversation (before before_message_id, if given), latest first, as an async iterator of pages.
+
+        Pages come from driver paging, fetch_size rows at a time, bucket after
+        bucket. The next page (in the same bucket or the next one) is
+        requested while the caller handles the current one, so at most two
+        pages are held however large the conversation is. Malformed IDs
+        raise ValueError here, before any query is made.
+        """
+        conversation_uuid = uuid.UUID(conversation_id)
+        before = uuid.UUID(before_message_id) if before_message_id else None
+
+        def fetch(bucket, paging_state=None):
+            if before is not None:
+                query, params = _message_select(SELECT_MESSAGES_BEFORE_PAGED, conversation_uuid, bucket, before)
+            else:
+                query, params = _message_select(SELECT_MESSAGES_PAGED, conversation_uuid, bucket)
+            return asyncio.ensure_future(
+                cassandra_client.aexecute_page(query, params, fetch_size=fetch_size, paging_state=paging_state))
+
+        async def pages():
+            next_page = None
+            try:
+                buckets = list(await MessageModel._message_buckets(conversation_uuid, before))
+                if not buckets:
+                    return
+                bucket = buckets.pop(0)
+                next_page = fetch(bucket)
+                while next_page is not None:
+                    page, paging_state = await next_page
+                    if paging_state:
+                        next_page = fetch(bucket, paging_state)
+                    elif buckets:
+                        bucket = buckets.pop(0)
+                        next_page = fetch(bucket)
+                    else:
+                        next_page = None
+                    if page:
+                        yield page
+            finally:
+                # The consumer stopped early (e.g. the client went away)
+                if next_page is not None and not next_page.done():
+                    next_page.cancel()
+
+        return pages()
 
 class ConversationModel:
     """
@@ -146,45 +897,214 @@ class ConversationModel:
     
     They should consider:
     - How to efficiently store and retrieve conversations for a user
-    - How to handle stateless, cursor-based pagination (using conversation_id as cursor)
-    - How to optimize for the most recent conversations (using last_updated only for sorting/display, NOT for pagination)
+    - How to handle stateless, cursor-based pagination (using (last_updated, conversation_id) as cursor)
+    - How to optimize for the most recent conversations (inbox_by_user is clustered by last_updated DESC)
     """
     # TODO: Implement the following methods
 
     @staticmethod
-    async def get_user_conversations(user_id: str, limit: int = 20, before_conversation_id: str = None):
+    async def update_inbox(user_id: uuid.UUID, other_user_id: uuid.UUID, conversation_id: uuid.UUID, last_message: str, last_updated: datetime):
         """
-        Get conversations for a user with stateless, cursor-based pagination (using before_conversation_id as cursor).
+        Move a conversation to the top of a user's inbox.
+
+        conversations_by_user is the (user, conversation) -> last_updated lookup
+        used to find and delete the conversation's previous inbox_by_user row.
         """
-        if before_conversation_id:
-            query = (
-                "SELECT * FROM conversations_by_user WHERE user_id = %(user_id)s AND conversation_id < %(before_conversation_id)s ORDER BY conversation_id DESC LIMIT %(limit)s"
-            )
-            params = {
-                'user_id': uuid.UUID(user_id),
-                'before_conversation_id': uuid.UUID(before_conversation_id),
-                'limit': limit
-            }
+        rows = await cassandra_client.aexecute(SELECT_CONVERSATION_LAST_UPDATED, (user_id, conversation_id))
+        previous = rows[0]['last_updated'] if rows else None
+        statements = []
+        if previous is not None:
+            if to_epoch_ms(previous) > to_epoch_ms(last_updated):
+                return  # A newer message already updated this inbox entry
+            statements.append((DELETE_INBOX_ROW, (user_id, previous, conversation_id)))
+        statements.append((INSERT_INBOX_ROW, (user_id, last_updated, conversation_id, other_user_id, last_message)))
+        statements.append((UPSERT_CONVERSATION_BY_USER, (user_id, conversation_id, last_message, last_updated, other_user_id)))
+        # Logged so the lookup row and the inbox row cannot disagree
+        await cassandra_client.aexecute_batch(statements)
+        if previous is None:
+            # First message in this conversation for the user. Two concurrent
+            # first messages can both count it; the recount corrects that.
+            conversation_count_increments.add(user_id)
+            _add_to_cached_count(conversation_counts, user_id)
+        if user_id in _pending_inbox_fills:
+            _pending_inbox_fills[user_id] = True
+        inbox_reads.forget(user_id)
+        await inbox_cache.update(str(user_id), ConversationRow(
+            conversation_id, user_id, other_user_id, last_message,
+            # Naive UTC, like timestamps read back from Cassandra
+            to_naive_utc(last_updated)
+        ))
+
+    @staticmethod
+    async def get_user_conversations(user_id: str, limit: int = 20, before_conversation_id: str = None, cursor: str = None):
+        """
+        Get a user's conversations, most recently updated first.
+
+        Pagination is stateless: cursor is the (last_updated, conversation_id)
+        position of the last conversation on the previous page (see
+        util.encode_inbox_cursor). before_conversation_id is still accepted and
+        resolved to that position through conversations_by_user. The first
+        page is served from the inbox cache when possible.
+        """
+        user_uuid = uuid.UUID(user_id)
+        if not cursor and not before_conversation_id and limit <= INBOX_CACHE_PAGE_SIZE:
+            cached = await inbox_cache.get(str(user_uuid))
+            # A page shorter than the cache page size holds the user's whole inbox
+            if cached is not None and (limit <= len(cached) or len(cached) < INBOX_CACHE_PAGE_SIZE):
+                return cached[:limit]
+            # Concurrent misses for the user share one fill, whatever their limit
+            conversations = await inbox_reads.do(user_uuid, lambda: ConversationModel._fill_inbox(user_uuid))
+            return conversations[:limit]
+        return await inbox_reads.do(
+            (user_uuid, limit, before_conversation_id, cursor),
+            lambda: ConversationModel._read_inbox(user_uuid, limit, before_conversation_id, cursor)
+        )
+
+    @staticmethod
+    async def _fill_inbox(user_uuid: uuid.UUID):
+        """
+        Read a user's first inbox page, INBOX_CACHE_PAGE_SIZE conversations, and cache it
+        unless the user's inbox was written to meanwhile.
+        """
+        _pending_inbox_fills.setdefault(user_uuid, False)
+        try:
+            rows = await cassandra_client.aexecute(SELECT_LATEST_INBOX, (user_uuid, INBOX_CACHE_PAGE_SIZE))
+            conversations = await ConversationModel._inbox_rows_to_conversations(user_uuid, rows)
+        finally:
+            written_meanwhile = _pending_inbox_fills.pop(user_uuid, False)
+        # A page read before a send would be cached without it; the next read fills again
+        if written_meanwhile:
+            return conversations
+        # Skip caching a full page shortened by duplicate removal; it would look like a whole inbox
+        if len(rows) < INBOX_CACHE_PAGE_SIZE or len(conversations) == INBOX_CACHE_PAGE_SIZE:
+            await inbox_cache.set(str(user_uuid), conversations)
+        return conversations
+
+    @staticmethod
+    async def _read_inbox(user_uuid: uuid.UUID, limit: int, before_conversation_id: Optional[str], cursor: Optional[str]):
+        """
+        Read an inbox page that is not served from the cache (see get_user_conversations).
+        """
+        if cursor:
+            last_updated, conversation_uuid = decode_inbox_cursor(cursor)
+            rows = await cassandra_client.aexecute(SELECT_INBOX_BEFORE, (user_uuid, last_updated, conversation_uuid, limit))
+        elif before_conversation_id:
+            conversation_uuid = uuid.UUID(before_conversation_id)
+            lookup = await cassandra_client.aexecute(SELECT_CONVERSATION_LAST_UPDATED, (user_uuid, conversation_uuid))
+            if not lookup:
+                return []
+            rows = await cassandra_client.aexecute(SELECT_INBOX_BEFORE, (user_uuid, lookup[0]['last_updated'], conversation_uuid, limit))
         else:
-            query = (
-                "SELECT * FROM conversations_by_user WHERE user_id = %(user_id)s ORDER BY conversation_id DESC LIMIT %(limit)s"
-            )
-            params = {
-                'user_id': uuid.UUID(user_id),
-                'limit': limit
-            }
-        rows = cassandra_client.execute(query, params)
-        return [{'conversation_id': str(row['conversation_id']), 'user_id': user_id, 'last_message': row['last_message'], 'last_updated': row['last_updated'], 'other_user_id': str(row['other_user_id'])} for row in rows]
+            rows = await cassandra_client.aexecute(SELECT_LATEST_INBOX, (user_uuid, limit))
+        return await ConversationModel._inbox_rows_to_conversations(user_uuid, rows)
+
+    @staticmethod
+    async def get_conversation_count(user_id: str) -> int:
+        """
+        Number of conversations a user has, from their maintained counter (no inbox rows are read).
+        """
+        return await _read_total(conversation_counts, conversation_count_increments, SELECT_CONVERSATION_COUNT, uuid.UUID(user_id))
+
+    @staticmethod
+    async def get_conversations_updated_since(user_id: str, since: datetime, limit: int = 100):
+        """
+        Get a user's conversations updated at or after since, most recent first.
+        """
+        user_uuid = uuid.UUID(user_id)
+        rows = await cassandra_client.aexecute(SELECT_INBOX_SINCE, (user_uuid, since, limit))
+        return await ConversationModel._inbox_rows_to_conversations(user_uuid, rows)
+
+    @staticmethod
+    async def _inbox_rows_to_conversations(user_uuid: uuid.UUID, rows):
+        """
+        Drop duplicate inbox_by_user rows, keeping each conversation's newest.
+        """
+        # Two concurrent sends can both leave an inbox row behind; only the newest is kept and the rest removed
+        conversations = []
+        seen = set()
+        stale = []
+        for row in rows:
+            if row.conversation_id in seen:
+                stale.append((DELETE_INBOX_ROW, (user_uuid, row.last_updated, row.conversation_id)))
+                continue
+            seen.add(row.conversation_id)
+            conversations.append(row)
+        if stale:
+            await cassandra_client.aexecute_batch(stale, logged=False)
+        return conversations
+
+    @staticmethod
+    async def get_read_states(user_id: str, conversation_ids: Sequence[uuid.UUID]) -> Dict[uuid.UUID, Tuple[Optional[uuid.UUID], int]]:
+        """
+        A user's read state in each of the given conversations, from the unread counter and read marker tables.
+
+        Never reads messages: two single-partition reads, whatever the page
+        size. Increments still pending in this worker are included.
+
+        Returns:
+            conversation_id -> (last_read_message_id or None, unread count)
+        """
+        user_uuid = uuid.UUID(user_id)
+        if not conversation_ids:
+            return {}
+        conversation_ids = list(conversation_ids)
+        received_rows, marker_rows = await asyncio.gather(
+            cassandra_client.aexecute(SELECT_UNREAD_RECEIVED, (user_uuid, conversation_ids)),
+            cassandra_client.aexecute(SELECT_READ_MARKERS, (user_uuid, conversation_ids)),
+        )
+        received = {row['conversation_id']: row['received'] for row in received_rows}
+        markers = {row['conversation_id']: (row['last_read_message_id'], row['read_count']) for row in marker_rows}
+        states = {}
+        for conversation_id in conversation_ids:
+            last_read_message_id, read_count = markers.get(conversation_id, (None, 0))
+            count = received.get(conversation_id, 0) + unread_increments.pending((user_uuid, conversation_id))
+            states[conversation_id] = (last_read_message_id, max(0, count - read_count))
+        return states
+
+    @staticmethod
+    async def mark_read(conversation_id: str, user_id: str, message_id: str):
+        """
+        Record that a user has read a conversation up to message_id (a timeuuid).
+
+        The marker keeps the received counter as of now, less the messages
+        after message_id that this worker has cached, so those stay unread.
+        It is written at message_id's timestamp, so marking an older message
+        read (e.g. from another device) never replaces a newer marker.
+
+        Returns:
+            Tuple of (last_read_message_id, unread count) once the marker is written
+        """
+        conversation_uuid = uuid.UUID(conversation_id)
+        user_uuid = uuid.UUID(user_id)
+        message_uuid = uuid.UUID(message_id)
+        if message_uuid.version != 1:
+            raise ValueError("message_id must be a timeuuid")
+        rows = await cassandra_client.aexecute(SELECT_UNREAD_RECEIVED, (user_uuid, [conversation_uuid]))
+        received = (rows[0]['received'] if rows else 0) + unread_increments.pending((user_uuid, conversation_uuid))
+        newer = 0
+        for message in recent_messages.peek(str(conversation_uuid)) or ():
+            if message.message_id == message_uuid:
+                break
+            if message.receiver_id == user_uuid:
+                newer += 1
+        else:
+            newer = 0  # message_id is not cached: nothing is known about what followed it
+        await cassandra_client.aexecute(
+            UPSERT_READ_MARKER,
+            (user_uuid, conversation_uuid, message_uuid, max(0, received - newer), timeuuid_to_micros(message_uuid))
+        )
+        states = await ConversationModel.get_read_states(user_id, [conversation_uuid])
+        return states[conversation_uuid]
 
     @staticmethod
     async def get_conversation(conversation_id: str):
         """
         Get a conversation by ID from conversation_metadata.
         """
-        query = "SELECT * FROM conversation_metadata WHERE conversation_id = %(conversation_id)s"
-        params = {'conversation_id': uuid.UUID(conversation_id)}
-        rows = cassandra_client.execute(query, params)
+        conversation_uuid = uuid.UUID(conversation_id)
+        rows = await cassandra_client.aexecute(SELECT_CONVERSATION_METADATA, (conversation_uuid,))
         if rows:
+            known_conversations.set(conversation_uuid, True)
             return {'conversation_id': conversation_id, 'created_at': rows[0].get('created_at')}
         else:
             return None
@@ -194,21 +1114,300 @@ class ConversationModel:
         """
         Get an existing conversation between two users or create a new one using a deterministic conversation_id.
         """
-        conversation_id = generate_conversation_id(user1_id, user2_id)
+        conversation_uuid = derive_conversation_id(uuid.UUID(user1_id), uuid.UUID(user2_id))
+        conversation_id = str(conversation_uuid)
         # Check if conversation exists
-        query = "SELECT * FROM conversation_metadata WHERE conversation_id = %(conversation_id)s"
-        params = {'conversation_id': uuid.UUID(conversation_id)}
-        rows = cassandra_client.execute(query, params)
+        rows = await cassandra_client.aexecute(SELECT_CONVERSATION_METADATA, (conversation_uuid,))
         if rows:
+            known_conversations.set(conversation_uuid, True)
             return {'conversation_id': conversation_id, 'created_at': rows[0].get('created_at')}
         # If not exists, create
         created_at = datetime.now(timezone.utc)
-        meta_query = (
-            "INSERT INTO conversation_metadata (conversation_id, created_at) VALUES (%(conversation_id)s, %(created_at)s) IF NOT EXISTS"
-        )
-        meta_params = { 
-            'conversation_id': uuid.UUID(conversation_id),
-            'created_at': created_at
-        }
-        cassandra_client.execute(meta_query, meta_params)
-        return {'conversation_id': conversation_id, 'created_at': created_at}
\ No newline at end of file
+        meta_params = (conversation_uuid, created_at)
+        await cassandra_client.aexecute(INSERT_CONVERSATION_METADATA, meta_params)
+        known_conversations.set(conversation_uuid, True)
+        return {'conversation_id': conversation_id, 'created_at': created_at}
+
+class SearchModel:
+    """
+    Full-text search over each user's messages (see app.util.search).
+
+    A message is indexed for both participants: the send path writes a
+    search_tail_by_user row holding its terms. compact() folds a user's
+    settled tail rows into per-term segments, so the tail stays short;
+    search_messages joins the query terms' segments and scans the tail.
+    """
+
+    @staticmethod
+    async def index_messages(messages, compact: bool = True):
+        """
+        Add messages to their participants' search tails.
+
+        Each user's rows are written as single-partition unlogged batches,
+        at most BULK_SEND_CONCURRENCY at a time. With compact, a user this
+        worker has written SEARCH_TAIL_COMPACT_ROWS rows for since their
+        last compaction gets one, in the background.
+        """
+        by_user = {}
+        for message in messages:
+            words = message_terms(message.content)
+            if not words:
+                continue
+            for user_id in {message.sender_id, message.receiver_id}:
+                by_user.setdefault(user_id, []).append(
+                    (INSERT_SEARCH_TAIL, (user_id, message.message_id, message.conversation_id, words)))
+        semaphore = asyncio.Semaphore(BULK_SEND_CONCURRENCY)
+
+        async def write(statements):
+            async with semaphore:
+                if len(statements) == 1:
+                    await cassandra_client.aexecute(*statements[0])
+                else:
+                    await cassandra_client.aexecute_batch(statements, logged=False)
+
+        await asyncio.gather(*(
+            write(rows[i:i + BULK_SEND_BATCH_ROWS])
+            for rows in by_user.values()
+            for i in range(0, len(rows), BULK_SEND_BATCH_ROWS)
+        ))
+        if not compact:
+            return
+        for user_id, rows in by_user.items():
+            written = search_tail_rows.get(user_id, 0) + len(rows)
+            if written >= SEARCH_TAIL_COMPACT_ROWS:
+                SearchModel.schedule_compaction(user_id)
+                written = 0
+            search_tail_rows.set(user_id, written)
+
+    @staticmethod
+    async def index_new_messages(messages):
+        """
+        index_messages for the send path: a failure is logged, not raised,
+        since the messages themselves are stored (backfill_search_index.py
+        indexes them again).
+        """
+        try:
+            await SearchModel.index_messages(messages)
+        except Exception:
+            logger.exception("model.search_index_failed", messages=len(messages))
+
+    @staticmethod
+    def schedule_compaction(user_id: uuid.UUID) -> None:
+        """Compact a user's tail in the background, unless this worker already is."""
+        if user_id in _search_compactions:
+            return
+        task = asyncio.ensure_future(SearchModel.compact(user_id))
+        _search_compactions[user_id] = task
+
+        def done(task):
+            _search_compactions.pop(user_id, None)
+            if not task.cancelled() and task.exception() is not None:
+                logger.error("model.search_compaction_failed", user_id=user_id, error=repr(task.exception()))
+
+        task.add_done_callback(done)
+
+    @staticmethod
+    async def close():
+        """Stop this worker's compactions (at shutdown). Rounds already done stay done."""
+        tasks = list(_search_compactions.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    @staticmethod
+    async def compact(user_id: uuid.UUID, settle: float = SEARCH_COMPACT_SETTLE) -> int:
+        """
+        Fold a user's tail rows older than settle seconds into their term segments.
+
+        Runs under a lease in search_compactions_by_user, so one worker at a
+        time compacts a user; returns 0 at once if another holds it. Rows
+        are folded oldest first, SEARCH_TAIL_COMPACT_ROWS per round: every
+        term's new postings are merged (_merge_term), then the folded rows
+        are deleted. If a round fails, its rows stay in the tail, and merging
+        them again is idempotent.
+
+        Returns:
+            Number of tail rows folded
+        """
+        owner = uuid.uuid4()
+        acquired = await cassandra_client.aexecute(ACQUIRE_SEARCH_COMPACTION, (user_id, owner, SEARCH_COMPACTION_LEASE))
+        if not acquired[0]['[applied]']:
+            SEARCH_COMPACTIONS.labels("busy").inc()
+            return 0
+        cutoff = max_uuid_from_time(datetime.now(timezone.utc) - timedelta(seconds=settle))
+        semaphore = asyncio.Semaphore(SEARCH_COMPACT_CONCURRENCY)
+
+        async def merge(term, postings):
+            async with semaphore:
+                await SearchModel._merge_term(user_id, term, postings)
+
+        folded = 0
+        try:
+            while True:
+                rows = await cassandra_client.aexecute(SELECT_SETTLED_SEARCH_TAIL, (user_id, cutoff, SEARCH_TAIL_COMPACT_ROWS))
+                if not rows:
+                    break
+                by_term = {}
+                for row in rows:
+                    posting = (posting_key(row['message_id']), row['conversation_id'])
+                    for term in row['terms'] or ():
+                        by_term.setdefault(term, []).append(posting)
+                outcomes = await asyncio.gather(*(merge(term, postings) for term, postings in by_term.items()), return_exceptions=True)
+                failed = next((outcome for outcome in outcomes if isinstance(outcome, BaseException)), None)
+                if failed is not None:
+                    raise failed
+                await cassandra_client.aexecute(DELETE_SEARCH_TAIL, (user_id, rows[-1]['message_id']))
+                folded += len(rows)
+                SEARCH_ROWS_COMPACTED.inc(len(rows))
+                if len(rows) < SEARCH_TAIL_COMPACT_ROWS:
+                    break
+                renewed = await cassandra_client.aexecute(RENEW_SEARCH_COMPACTION, (SEARCH_COMPACTION_LEASE, owner, user_id, owner))
+                if not renewed[0]['[applied]']:
+                    logger.warning("model.search_compaction_lease_lost", user_id=user_id, rows=folded)
+                    break
+        except BaseException:
+            SEARCH_COMPACTIONS.labels("failed").inc()
+            raise
+        finally:
+            try:
+                await cassandra_client.aexecute(RELEASE_SEARCH_COMPACTION, (user_id, owner))
+            except Exception as e:
+                # Expires after SEARCH_COMPACTION_LEASE seconds anyway
+                logger.warning("model.search_compaction_release_failed", user_id=user_id, error=repr(e))
+        SEARCH_COMPACTIONS.labels("done").inc()
+        logger.info("model.search_compacted", user_id=user_id, rows=folded)
+        return folded
+
+    @staticmethod
+    async def _merge_term(user_id: uuid.UUID, term: str, postings):
+        """
+        Merge new (key, conversation_id) postings of a term into its segments, in one single-partition batch.
+
+        Segments never overlap: the new postings are merged with every
+        segment whose range they reach into, and with the next older one
+        if the result still fits in SEARCH_SEGMENT_MAX_POSTINGS, so the
+        newest segment is topped up until full. The result is cut into
+        segments of at most that many postings from the oldest, so only the
+        newest can be partial.
+        """
+        low = min(key for key, _ in postings)
+        high = max(key for key, _ in postings)
+        merged = []
+        total = len(postings)
+        below = None
+        # Newest first
+        for row in await cassandra_client.aexecute(SELECT_SEARCH_SEGMENT_SIZES, (user_id, term)):
+            if posting_key(row['segment']) > high:
+                continue
+            if posting_key(row['newest']) >= low:
+                merged.append(row)
+                total += row['postings']
+            else:
+                below = row
+                break
+        if below is not None and total + below['postings'] <= SEARCH_SEGMENT_MAX_POSTINGS:
+            merged.append(below)
+        combined = dict(postings)
+        if merged:
+            rows = await cassandra_client.aexecute(
+                SELECT_SEARCH_SEGMENT_RANGE, (user_id, term, merged[-1]['segment'], merged[0]['segment']))
+            for row in rows:
+                keys, conversations = decode_postings(row['data'])
+                combined.update(zip(keys, conversations))
+        ordered = sorted(combined.items())
+        statements = []
+        kept = set()
+        for start in range(0, len(ordered), SEARCH_SEGMENT_MAX_POSTINGS):
+            chunk = ordered[start:start + SEARCH_SEGMENT_MAX_POSTINGS]
+            segment = posting_message_id(chunk[0][0])
+            kept.add(segment)
+            statements.append((INSERT_SEARCH_SEGMENT, (
+                user_id, term, segment, posting_message_id(chunk[-1][0]), len(chunk), encode_postings(chunk[::-1]))))
+        # A delete and an insert of the same row in one batch share a timestamp, and the delete would win
+        statements.extend(
+            (DELETE_SEARCH_SEGMENT, (user_id, term, row['segment'])) for row in merged if row['segment'] not in kept)
+        if len(statements) == 1:
+            await cassandra_client.aexecute(*statements[0])
+        else:
+            await cassandra_client.aexecute_batch(statements, logged=False)
+
+    @staticmethod
+    async def search_messages(user_id: str, query: str, limit: int = 20, cursor: str = None):
+        """
+        The user's messages that contain every term of query, newest first.
+
+        Indexed hits come from a leapfrog join of the terms' segments, read
+        a few at a time (app.util.search.intersect); recent ones from the
+        user's tail, read concurrently. A long tail gets compacted in the
+        background. cursor is the next_cursor of the previous page.
+
+        At most SEARCH_TAIL_SCAN_ROWS tail rows are read. When the cap is
+        hit, hits older than the oldest row read are left for the next page,
+        since unread tail rows may hold some. That page can then be short,
+        even empty, and still have a next_cursor.
+
+        Returns:
+            Tuple of (messages, cursor for the next page or None)
+        """
+        user_uuid = uuid.UUID(user_id)
+        before = uuid.UUID(cursor) if cursor else None
+        query_terms = sorted(set(tokenize(query)))
+        if not query_terms:
+            raise ValueError("The query has no searchable terms")
+        if len(query_terms) > SEARCH_MAX_TERMS:
+            raise ValueError(f"At most {SEARCH_MAX_TERMS} search terms")
+
+        async def fetch(term, bound, count):
+            if bound is None:
+                rows = await cassandra_client.aexecute(SELECT_LATEST_SEARCH_SEGMENTS, (user_uuid, term, count))
+            else:
+                rows = await cassandra_client.aexecute(SELECT_SEARCH_SEGMENTS, (user_uuid, term, posting_message_id(bound), count))
+            return [(posting_key(row['segment']), row['data']) for row in rows]
+
+        cursors = [PostingCursor(functools.partial(fetch, term), SEARCH_SEGMENTS_PER_READ) for term in query_terms]
+        if before is not None:
+            tail = cassandra_client.aexecute(SELECT_SEARCH_TAIL_BEFORE, (user_uuid, before, SEARCH_TAIL_SCAN_ROWS))
+        else:
+            tail = cassandra_client.aexecute(SELECT_SEARCH_TAIL, (user_uuid, SEARCH_TAIL_SCAN_ROWS))
+        target = posting_key(before) - 1 if before is not None else None
+        tail_rows, indexed = await asyncio.gather(tail, intersect(cursors, target, limit))
+        SEARCH_SEGMENTS_READ.observe(sum(c.segments_read for c in cursors))
+        if len(tail_rows) >= SEARCH_TAIL_COMPACT_ROWS:
+            SearchModel.schedule_compaction(user_uuid)
+
+        # A message can be in both while it is being compacted
+        hits = dict(indexed)
+        wanted = set(query_terms)
+        for row in tail_rows:
+            if wanted.issubset(row['terms'] or ()):
+                hits[posting_key(row['message_id'])] = row['conversation_id']
+        page = sorted(hits.items(), reverse=True)
+        truncated = len(tail_rows) >= SEARCH_TAIL_SCAN_ROWS
+        if truncated:
+            oldest_read = posting_key(tail_rows[-1]['message_id'])
+            page = [hit for hit in page if hit[0] >= oldest_read]
+        page = [(conversation_id, posting_message_id(key)) for key, conversation_id in page[:limit]]
+        stored = await SearchModel._read_messages(page)
+        if len(page) == limit:
+            next_cursor = str(page[-1][1])
+        elif truncated:
+            next_cursor = str(tail_rows[-1]['message_id'])
+        else:
+            next_cursor = None
+        return [stored[message_id] for _, message_id in page if message_id in stored], next_cursor
+
+    @staticmethod
+    async def _read_messages(hits) -> Dict[uuid.UUID, MessageRow]:
+        """
+        The stored messages among (conversation_id, message_id) hits, by
+        message_id: one IN read per (conversation, bucket) partition, all
+        concurrently, so a page of hits in a few conversations costs a few
+        reads rather than one per hit.
+        """
+        partitions = {}
+        for conversation_id, message_id in hits:
+            partitions.setdefault((conversation_id, message_bucket(message_id)), []).append(message_id)
+        pages = await asyncio.gather(*(
+            cassandra_client.aexecute(SELECT_MESSAGES_IN, (conversation_id, bucket, message_ids))
+            for (conversation_id, bucket), message_ids in partitions.items()))
+        return {row.message_id: row for rows in pages for row in rows}
@@ -9,16 +9,28 @@ class ConversationResponse(BaseModel):
     user2_id: str = Field(..., description="ID of the second user (uuid)")
     last_message_at: datetime = Field(..., description="Timestamp of the last message")
     last_message_content: Optional[str] = Field(None, description="Content of the last message")
+    unread_count: Optional[int] = Field(None, description="Messages the user has not read yet (in a user's conversation list)")
 
 class ConversationDetail(ConversationResponse):
     messages: List[MessageResponse] = Field(..., description="List of messages in conversation")
 
 class PaginatedConversationRequest(BaseModel):
     limit: int = Field(20, description="Number of items per page")
-    before_conversation_id: Optional[str] = Field(None, description="Get conversations before this conversation_id (uuid)")
+    before_conversation_id: Optional[str] = Field(None, description="Get conversations after this conversation_id (uuid) in recency order")
+    cursor: Optional[str] = Field(None, description="next_cursor from the previous page")
 
 class PaginatedConversationResponse(BaseModel):
-    total: int = Field(..., description="Total number of conversations")
+    total: int = Field(..., description="Total number of the user's conversations, across all pages")
     limit: int = Field(..., description="Number of items per page")
     data: List[ConversationResponse] = Field(..., description="List of conversations")
-    next_cursor: Optional[str] = Field(None, description="Cursor for the next page (last conversation_id)")
\ No newline at end of file
+    next_cursor: Optional[str] = Field(None, description="Cursor for the next page (last_updated and conversation_id of the last conversation)")
+
+class ReadMarkerRequest(BaseModel):
+    user_id: str = Field(..., description="ID of the user who read the conversation (uuid)")
+    message_id: str = Field(..., description="Newest message the user has read (timeuuid)")
+
+class ReadMarkerResponse(BaseModel):
+    conversation_id: str = Field(..., description="ID of the conversation (uuid)")
+    user_id: str = Field(..., description="ID of the user (uuid)")
+    last_read_message_id: str = Field(..., description="Newest message read by the user on any device (timeuuid)")
+    unread_count: int = Field(..., description="Messages the user has not read yet")
\ No newline at end of file
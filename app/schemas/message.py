@@ -21,7 +21,42 @@ class PaginatedMessageRequest(BaseModel):
     before_message_id: Optional[str] = Field(None, description="Get messages before this message_id (timeuuid)")
 
 class PaginatedMessageResponse(BaseModel):
-    total: int = Field(..., description="Total number of messages")
+    total: int = Field(..., description="Total number of messages in the conversation, across all pages")
     limit: int = Field(..., description="Number of items per page")
     data: List[MessageResponse] = Field(..., description="List of messages")
-    next_cursor: Optional[str] = Field(None, description="Cursor for the next page (last message_id)")
\ No newline at end of file
+    next_cursor: Optional[str] = Field(None, description="Cursor for the next page (last message_id)")
+    next_page_token: Optional[str] = Field(None, description="Opaque URL-safe token resuming the same query at the next page")
+
+class BulkMessageResult(BaseModel):
+    index: int = Field(..., description="Position of the message in the request")
+    status_code: int = Field(..., description="201 if the message was stored, otherwise the error status")
+    message: Optional[MessageResponse] = Field(None, description="The created message")
+    error: Optional[str] = Field(None, description="Why the message was not stored")
+
+class BulkMessageResponse(BaseModel):
+    created: int = Field(..., description="Number of messages stored")
+    failed: int = Field(..., description="Number of messages rejected or not stored")
+    results: List[BulkMessageResult] = Field(..., description="One result per request item, in request order")
+
+class ConversationMessagesRequest(BaseModel):
+    conversation_id: str = Field(..., description="ID of the conversation (uuid)")
+    limit: int = Field(20, ge=1, le=100, description="Number of messages for this conversation (at most 100)")
+    before_message_id: Optional[str] = Field(None, description="Get messages before this message_id (timeuuid)")
+
+class BatchGetMessagesRequest(BaseModel):
+    requests: List[ConversationMessagesRequest] = Field(..., description="Conversations to read (at most 100)")
+
+class ConversationMessagesResult(BaseModel):
+    conversation_id: str = Field(..., description="ID of the conversation (uuid)")
+    status_code: int = Field(..., description="200 if the conversation was read, otherwise the error status")
+    data: List[MessageResponse] = Field(default_factory=list, description="List of messages, latest first")
+    next_cursor: Optional[str] = Field(None, description="Cursor for the next page (last message_id)")
+    error: Optional[str] = Field(None, description="Why the conversation could not be read")
+
+class BatchGetMessagesResponse(BaseModel):
+    results: List[ConversationMessagesResult] = Field(..., description="One result per requested conversation, in request order")
+
+class SearchMessagesResponse(BaseModel):
+    limit: int = Field(..., description="Maximum number of hits per page")
+    data: List[MessageResponse] = Field(..., description="Messages containing every term of the query, latest first")
+    next_cursor: Optional[str] = Field(None, description="Cursor for the next page (last message_id), or null after the last hit")
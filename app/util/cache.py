@@ -0,0 +1,126 @@
+"""
+In-process caches for the Messenger application.
+"""
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+_MISSING = object()
+
+class LRUCache:
+    """
+    Bounded mapping that evicts the least recently used entry.
+
+    Bounds are an entry count (maxsize), an optional total size in bytes
+    (max_bytes, measured with the sizeof callable) and an optional per-entry
+    time to live in seconds. Hits, misses and evictions are counted.
+
+    Not thread-safe: it is meant to be used from the event loop only.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 1024,
+        ttl: Optional[float] = None,
+        max_bytes: Optional[int] = None,
+        sizeof: Optional[Callable[[Any], int]] = None
+    ):
+        if maxsize <= 0:
+            raise ValueError("maxsize must be positive")
+        if max_bytes is not None and sizeof is None:
+            raise ValueError("max_bytes requires a sizeof callable")
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._sizeof = sizeof
+        # key -> (value, expires_at, size)
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _lookup(self, key: Hashable) -> Any:
+        entry = self._data.get(key)
+        if entry is None:
+            return _MISSING
+        if entry[1] is not None and entry[1] <= time.monotonic():
+            self._remove(key)
+            return _MISSING
+        return entry[0]
+
+    def _remove(self, key: Hashable) -> None:
+        _, _, size = self._data.pop(key)
+        self.bytes -= size
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        value = self._lookup(key)
+        if value is _MISSING:
+            self.misses += 1
+            return default
+        self.hits += 1
+        self._data.move_to_end(key)
+        return value
+
+    def peek(self, key: Hashable, default: Any = None) -> Any:
+        """Like get, but without counting a hit or miss or refreshing recency."""
+        value = self._lookup(key)
+        return default if value is _MISSING else value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        size = self._sizeof(value) if self._sizeof else 0
+        if key in self._data:
+            self._remove(key)
+        if self.max_bytes is not None and size > self.max_bytes:
+            return  # Never fits; caching it would only flush everything else
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else None
+        self._data[key] = (value, expires_at, size)
+        self.bytes += size
+        self._evict()
+
+    def replace(self, key: Hashable, value: Any) -> bool:
+        """
+        Change the value of a cached entry, keeping its expiry and recency
+        (e.g. to write a local update through without extending its TTL).
+        Returns False, storing nothing, if key is not cached.
+        """
+        if self._lookup(key) is _MISSING:
+            return False
+        _, expires_at, size = self._data[key]
+        new_size = self._sizeof(value) if self._sizeof else 0
+        self._data[key] = (value, expires_at, new_size)
+        self.bytes += new_size - size
+        self._evict()
+        return True
+
+    def _evict(self) -> None:
+        while len(self._data) > self.maxsize or (self.max_bytes is not None and self.bytes > self.max_bytes):
+            oldest = next(iter(self._data))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def pop(self, key: Hashable, default: Optional[Any] = None) -> Any:
+        value = self._lookup(key)
+        if value is _MISSING:
+            return default
+        self._remove(key)
+        return value
+
+    def clear(self) -> None:
+        self._data.clear()
+        self.bytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'entries': len(self._data),
+            'bytes': self.bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self._lookup(key) is not _MISSING
+
+    def __len__(self) -> int:
+        return len(self._data)
@@ -0,0 +1,84 @@
+"""
+Deterministic conversation IDs for the Messenger application.
+
+A conversation's ID is the first 16 bytes of the SHA-256 of its two
+participants' canonical UUID strings, lower one first. This module derives
+it from uuid.UUID values directly and returns a uuid.UUID, so the send path
+never goes through a hex digest or reparses a string. It gives the same
+IDs as app.util.util.generate_conversation_id for canonical (lowercase,
+hyphenated) UUID strings; scripts/conversation_id_test.py checks that.
+generate_conversation_id hashed user IDs exactly as sent, so a pair sent in
+any other spelling (uppercase, no hyphens, braces) has a conversation of its
+own; raw_conversation_id keeps deriving that one.
+
+Recently used pairs are kept in a bounded LRU, so the steady-state cost
+of an active conversation is a dict lookup.
+"""
+import os
+import uuid
+from hashlib import sha256
+from typing import Dict, Iterable, List, Tuple
+
+from app.util.cache import LRUCache
+
+# (lower user_id, higher user_id) -> conversation_id
+conversation_id_cache = LRUCache(maxsize=int(os.getenv("CONVERSATION_ID_CACHE_SIZE", "50000")))
+
+def _pair(user1_id: uuid.UUID, user2_id: uuid.UUID) -> Tuple[uuid.UUID, uuid.UUID]:
+    # Canonical strings are fixed-width lowercase hex, so ordering them as
+    # strings (as generate_conversation_id does) is ordering them as integers
+    return (user1_id, user2_id) if user1_id.int <= user2_id.int else (user2_id, user1_id)
+
+def _derive(low: bytes, high: bytes) -> uuid.UUID:
+    return uuid.UUID(bytes=sha256(low + high).digest()[:16])
+
+def conversation_id(user1_id: uuid.UUID, user2_id: uuid.UUID) -> uuid.UUID:
+    """ID of the conversation between two users; the argument order does not matter."""
+    pair = _pair(user1_id, user2_id)
+    result = conversation_id_cache.get(pair)
+    if result is None:
+        result = _derive(str(pair[0]).encode(), str(pair[1]).encode())
+        conversation_id_cache.set(pair, result)
+    return result
+
+def is_canonical(user_id: str, parsed: uuid.UUID) -> bool:
+    """Whether user_id is spelled as str(parsed), the form conversation_id hashes."""
+    return user_id == str(parsed)
+
+def raw_conversation_id(user1_id: str, user2_id: str) -> uuid.UUID:
+    """ID of the conversation between two user ID strings hashed as given, like generate_conversation_id (not cached)."""
+    low, high = sorted((user1_id, user2_id))
+    return _derive(low.encode(), high.encode())
+
+def conversation_ids(pairs: Iterable[Tuple[uuid.UUID, uuid.UUID]], use_cache: bool = True) -> List[uuid.UUID]:
+    """
+    conversation_id for many (user1_id, user2_id) pairs, in order.
+
+    Repeated pairs are derived once, and each user's canonical string is
+    formatted once per call however many pairs it appears in. With
+    use_cache=False the LRU is neither read nor filled, for one-off bulk
+    work (e.g. data generation) that would only flush it.
+    """
+    results = []
+    derived: Dict[Tuple[uuid.UUID, uuid.UUID], uuid.UUID] = {}
+    encoded: Dict[uuid.UUID, bytes] = {}
+    for user1_id, user2_id in pairs:
+        pair = _pair(user1_id, user2_id)
+        result = derived.get(pair)
+        if result is None:
+            if use_cache:
+                result = conversation_id_cache.get(pair)
+            if result is None:
+                low, high = pair
+                low_bytes = encoded.get(low)
+                if low_bytes is None:
+                    low_bytes = encoded[low] = str(low).encode()
+                high_bytes = encoded.get(high)
+                if high_bytes is None:
+                    high_bytes = encoded[high] = str(high).encode()
+                result = _derive(low_bytes, high_bytes)
+                if use_cache:
+                    conversation_id_cache.set(pair, result)
+            derived[pair] = result
+        results.append(result)
+    return results
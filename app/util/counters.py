@@ -0,0 +1,116 @@
+"""
+Write coalescing for Cassandra counters.
+
+A burst of messages into one conversation would otherwise be a burst of
+counter updates to the same cell. CounterCoalescer sums increments per key
+in memory and hands them to a write function at most once per interval
+(sooner when many keys are pending), so N messages cost one update per
+key and flush.
+
+Pending increments live only in this worker until they are written. A
+crash loses at most one interval's worth; callers treat the counts as
+approximate within that window.
+"""
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, Hashable, Optional
+
+from app.util.metrics import counter, gauge
+
+logger = logging.getLogger(__name__)
+
+INCREMENTS = counter("messenger_counter_increments_total", "Counter increments added, before coalescing.", ("counter",))
+WRITES = counter("messenger_counter_writes_total", "Coalesced counter updates written.", ("counter",))
+RETRIES = counter("messenger_counter_retries_total", "Coalesced counter updates kept for the next flush after a failed write.", ("counter",))
+PENDING = gauge("messenger_counter_pending_keys", "Keys with increments not yet written: queued, plus those in the running flush.", ("counter",))
+
+# Sums for one flush, key -> delta; the write function returns the ones to retry
+Write = Callable[[Dict[Hashable, int]], Awaitable[Dict[Hashable, int]]]
+
+class CounterCoalescer:
+    """
+    Sums increments per key and writes them every interval seconds, or as soon as max_keys keys are pending.
+
+    One flush runs at a time. The write function gets the summed deltas and
+    returns those it could not write; they are added back for the next
+    flush. If it raises, all of them are.
+    """
+
+    def __init__(self, name: str, write: Write, interval: float = 0.5, max_keys: int = 10000):
+        self.name = name
+        self.interval = interval
+        self.max_keys = max_keys
+        self._write = write
+        self._pending: Dict[Hashable, int] = {}
+        # Deltas handed to the write function by the running flush
+        self._in_flight: Dict[Hashable, int] = {}
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._flushing: Optional[asyncio.Future] = None
+        self._increments = INCREMENTS.labels(name)
+        self._writes = WRITES.labels(name)
+        self._retries = RETRIES.labels(name)
+        self._pending_keys = PENDING.labels(name)
+
+    def add(self, key: Hashable, delta: int = 1) -> None:
+        """Queue an increment of key by delta."""
+        self._pending[key] = self._pending.get(key, 0) + delta
+        self._increments.inc(delta)
+        self._pending_keys.set(len(self._pending) + len(self._in_flight))
+        if self._flushing is not None:
+            return  # Rescheduled when the running flush ends
+        if len(self._pending) >= self.max_keys:
+            self._start_flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.interval, self._start_flush)
+
+    def pending(self, key: Hashable) -> int:
+        """
+        Increments of key this worker has not finished writing: queued, or
+        handed to the write function by a flush that has not completed. A
+        read racing a flush may count its deltas twice, but never misses them.
+        """
+        return self._pending.get(key, 0) + self._in_flight.get(key, 0)
+
+    def _start_flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self._flushing = asyncio.ensure_future(self.flush())
+
+    async def flush(self) -> None:
+        """Write everything pending now."""
+        deltas, self._pending = self._pending, {}
+        self._in_flight = deltas
+        try:
+            retry = await self._write(deltas) if deltas else {}
+        except Exception:
+            logger.exception("Writing %d %s counter updates failed; retrying with the next flush", len(deltas), self.name)
+            retry = deltas
+        finally:
+            # The retries are added back below, before anything else runs
+            self._in_flight = {}
+            self._flushing = None
+        self._writes.inc(len(deltas) - len(retry))
+        self._retries.inc(len(retry))
+        for key, delta in retry.items():
+            self._pending[key] = self._pending.get(key, 0) + delta
+        self._pending_keys.set(len(self._pending))
+        if self._pending and self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.interval, self._start_flush)
+
+    async def close(self) -> None:
+        """Write what is still pending (on shutdown); whatever fails then is logged and lost."""
+        if self._flushing is not None:
+            await asyncio.gather(self._flushing, return_exceptions=True)
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._pending:
+            await self.flush()
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._pending:
+            logger.warning("Dropping %d %s counter updates on shutdown", len(self._pending), self.name)
+            self._pending = {}
+            self._pending_keys.set(0)
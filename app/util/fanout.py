@@ -0,0 +1,356 @@
+"""
+Cross-worker fan-out of new messages for real-time delivery.
+
+Every worker runs its own realtime hub. The send path publishes a stored
+message to the fan-out bus. The bus delivers it to the local hub right away
+and forwards it to the other workers, whose buses hand it to their hubs.
+Messages published in the same event-loop tick are forwarded as one batch.
+
+Backends are selected with FANOUT_BUS_BACKEND:
+
+- local (default): single worker, nothing is forwarded
+- unix: same-host workers exchange datagrams over Unix sockets in
+  FANOUT_SOCKET_DIR; no broker needed
+- redis: any Redis-compatible server at REDIS_URL, pub/sub on FANOUT_CHANNEL
+  (needs the redis package)
+
+Delivery is best effort, like the hub itself. A lost batch only delays the
+affected clients until they reconnect and resume from Cassandra.
+"""
+import asyncio
+import json
+import logging
+import os
+import socket
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections import deque
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from app.db.rows import MessageRow
+
+logger = logging.getLogger(__name__)
+
+def _encode_message(message: MessageRow) -> bytes:
+    # A JSON array in MessageRow field order
+    message_id, conversation_id, sender_id, receiver_id, content, created_at = message
+    return json.dumps(
+        [str(message_id), str(conversation_id), str(sender_id), str(receiver_id), content, created_at.isoformat()],
+        separators=(",", ":")
+    ).encode()
+
+def _decode_message(message: List[Any]) -> MessageRow:
+    message_id, conversation_id, sender_id, receiver_id, content, created_at = message
+    return MessageRow(
+        uuid.UUID(message_id), uuid.UUID(conversation_id), uuid.UUID(sender_id), uuid.UUID(receiver_id),
+        content, datetime.fromisoformat(created_at)
+    )
+
+class FanoutBus(ABC):
+    """
+    Publishes stored messages to every worker's local deliver callable (the realtime hub).
+
+    Subclasses forward batches to the other workers with _send and pass what
+    they receive to _receive.
+    """
+
+    # Largest payload per _send; bigger batches are split
+    max_payload = 60000
+
+    def __init__(self, deliver: Callable[[MessageRow], Any]):
+        self._deliver = deliver
+        self.origin = uuid.uuid4().hex
+        self.started = False
+        self._outgoing: List[bytes] = []
+        self.published = 0
+        self.batches = 0
+        self.received = 0
+        self.errors = 0
+
+    def publish(self, message: MessageRow) -> None:
+        """Deliver a stored message locally now and queue it for the other workers."""
+        self.published += 1
+        self._deliver(message)
+        if not self.started:
+            return
+        self._outgoing.append(_encode_message(message))
+        if len(self._outgoing) == 1:
+            asyncio.get_running_loop().call_soon(self._flush)
+
+    def _flush(self) -> None:
+        batch, self._outgoing = self._outgoing, []
+        for payload in self._payloads(batch):
+            self.batches += 1
+            self._send(payload)
+
+    def _payloads(self, batch: List[bytes]) -> Iterator[bytes]:
+        head = b'{"origin":"' + self.origin.encode() + b'","messages":['
+        chunk, size = [], len(head) + 2
+        for encoded in batch:
+            if chunk and size + len(encoded) + 1 > self.max_payload:
+                yield head + b",".join(chunk) + b"]}"
+                chunk, size = [], len(head) + 2
+            chunk.append(encoded)
+            size += len(encoded) + 1
+        if chunk:
+            yield head + b",".join(chunk) + b"]}"
+
+    def _receive(self, payload: bytes) -> None:
+        try:
+            batch = json.loads(payload)
+            if batch['origin'] == self.origin:
+                return  # Our own batch echoed back by the broker
+            messages = [_decode_message(m) for m in batch['messages']]
+        except (ValueError, KeyError, TypeError, AttributeError):
+            self.errors += 1
+            logger.warning("Dropping malformed fan-out batch", exc_info=True)
+            return
+        self.received += len(messages)
+        for message in messages:
+            self._deliver(message)
+
+    async def start(self) -> None:
+        """Begin forwarding to and receiving from the other workers."""
+        self.started = True
+
+    async def close(self) -> None:
+        self.started = False
+
+    @abstractmethod
+    def _send(self, payload: bytes) -> None:
+        """Forward one batch to the other workers without blocking."""
+
+    def stats(self) -> Dict[str, int]:
+        return {'published': self.published, 'batches': self.batches, 'received': self.received, 'errors': self.errors}
+
+class LocalFanoutBus(FanoutBus):
+    """Single worker: messages only reach the local hub."""
+
+    async def start(self) -> None:
+        pass  # Nothing to forward to; publish never queues
+
+    def _send(self, payload: bytes) -> None:
+        pass
+
+class UnixSocketFanoutBus(FanoutBus):
+    """
+    Same-host workers, one Unix datagram socket each in a shared directory.
+
+    Each batch is sent to every other socket found there; the directory
+    listing is cached for peer_refresh seconds. When a peer's receive queue
+    is full, its batches wait in order (up to max_pending) and are retried
+    shortly; beyond that they are dropped. A socket file whose process is
+    gone is removed.
+    """
+
+    retry_delay = 0.002
+
+    def __init__(self, deliver: Callable[[MessageRow], Any], directory: str, peer_refresh: float = 1.0, max_pending: int = 1000):
+        super().__init__(deliver)
+        self.directory = directory
+        self.peer_refresh = peer_refresh
+        self.max_pending = max_pending
+        self.path: Optional[str] = None
+        self._sock: Optional[socket.socket] = None
+        self._peers: List[str] = []
+        self._peers_at = 0.0
+        # peer path -> batches waiting for room in that peer's receive queue
+        self._pending: Dict[str, deque] = {}
+        self._retry_scheduled = False
+        self.dropped = 0
+
+    async def start(self) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        self.path = os.path.join(self.directory, f"{os.getpid()}-{self.origin[:8]}.sock")
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._sock.setblocking(False)
+        self._sock.bind(self.path)
+        asyncio.get_running_loop().add_reader(self._sock.fileno(), self._on_readable)
+        await super().start()
+        logger.info("Fan-out bus listening on %s", self.path)
+
+    async def close(self) -> None:
+        await super().close()
+        if self._sock is not None:
+            asyncio.get_running_loop().remove_reader(self._sock.fileno())
+            self._sock.close()
+            self._sock = None
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
+
+    def _on_readable(self) -> None:
+        while self._sock is not None:
+            try:
+                payload = self._sock.recv(1 << 18)  # Above the largest datagram the kernel accepts
+            except BlockingIOError:
+                return
+            self._receive(payload)
+
+    def _peer_paths(self) -> List[str]:
+        now = time.monotonic()
+        if now - self._peers_at > self.peer_refresh:
+            self._peers = [e.path for e in os.scandir(self.directory) if e.name.endswith(".sock") and e.path != self.path]
+            self._peers_at = now
+        return self._peers
+
+    def _send(self, payload: bytes) -> None:
+        for peer in self._peer_paths():
+            pending = self._pending.get(peer)
+            if pending is not None:
+                # Keep the peer's batches in order behind the ones already waiting
+                if len(pending) >= self.max_pending:
+                    self.dropped += 1
+                else:
+                    pending.append(payload)
+            elif not self._send_to(peer, payload):
+                self._pending[peer] = deque([payload])
+                self._schedule_retry()
+
+    def _send_to(self, peer: str, payload: bytes) -> bool:
+        """Send one datagram; False if the peer's queue is full and it should be retried."""
+        try:
+            self._sock.sendto(payload, peer)
+        except BlockingIOError:
+            return False
+        except (ConnectionRefusedError, FileNotFoundError):
+            # The worker behind this socket is gone
+            self._peers = [p for p in self._peers if p != peer]
+            self._pending.pop(peer, None)
+            try:
+                os.unlink(peer)
+            except OSError:
+                pass
+        except OSError:
+            self.errors += 1
+            logger.warning("Fan-out send to %s failed", peer, exc_info=True)
+        return True
+
+    def _schedule_retry(self) -> None:
+        if not self._retry_scheduled:
+            self._retry_scheduled = True
+            asyncio.get_running_loop().call_later(self.retry_delay, self._retry)
+
+    def _retry(self) -> None:
+        self._retry_scheduled = False
+        if self._sock is None:
+            return
+        for peer, pending in list(self._pending.items()):
+            while pending and self._send_to(peer, pending[0]):
+                pending.popleft()
+            if not pending:
+                self._pending.pop(peer, None)
+        if self._pending:
+            self._schedule_retry()
+
+    def stats(self) -> Dict[str, int]:
+        return {**super().stats(), 'dropped': self.dropped, 'peers': len(self._peers), 'pending': sum(len(p) for p in self._pending.values())}
+
+class RedisFanoutBus(FanoutBus):
+    """
+    Workers on any host, through pub/sub on a Redis-compatible server.
+
+    client is anything with awaitable publish(channel, data) and a pubsub()
+    whose subscribe(channel) is awaitable and whose listen() async-iterates
+    {"type": ..., "data": ...} items, such as redis.asyncio.Redis or an
+    in-memory fake. Batches are published in order by one sender task.
+    If the subscription fails or ends, the listener subscribes again after
+    a backoff (reconnect_delay, doubling up to max_reconnect_delay);
+    batches published meanwhile are lost, like any best-effort delivery.
+    """
+
+    reconnect_delay = 0.1
+    max_reconnect_delay = 5.0
+
+    def __init__(self, deliver: Callable[[MessageRow], Any], client: Any, channel: str = "messenger:fanout"):
+        super().__init__(deliver)
+        self._client = client
+        self.channel = channel
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+
+    async def start(self) -> None:
+        pubsub = await self._subscribe()
+        self._queue = asyncio.Queue()
+        self._tasks = [asyncio.ensure_future(self._listen(pubsub)), asyncio.ensure_future(self._sender())]
+        await super().start()
+
+    async def close(self) -> None:
+        await super().close()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _subscribe(self):
+        pubsub = self._client.pubsub()
+        await pubsub.subscribe(self.channel)
+        return pubsub
+
+    async def _listen(self, pubsub) -> None:
+        delay = self.reconnect_delay
+        try:
+            while True:
+                try:
+                    if pubsub is None:
+                        pubsub = await self._subscribe()
+                        logger.info("Fan-out bus subscribed again to %s", self.channel)
+                    async for item in pubsub.listen():
+                        delay = self.reconnect_delay
+                        if item.get("type") == "message":
+                            self._receive(item["data"])
+                    logger.warning("Fan-out subscription ended; subscribing again in %.2fs", delay)
+                except Exception:
+                    self.errors += 1
+                    logger.warning("Fan-out subscription failed; subscribing again in %.2fs", delay, exc_info=True)
+                await self._close_pubsub(pubsub)
+                pubsub = None
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.max_reconnect_delay)
+        finally:
+            await self._close_pubsub(pubsub)
+
+    @staticmethod
+    async def _close_pubsub(pubsub) -> None:
+        if pubsub is None:
+            return
+        close = getattr(pubsub, "aclose", None) or getattr(pubsub, "close", None)
+        if close is None:
+            return
+        try:
+            result = close()
+            if asyncio.iscoroutine(result):
+                await result
+        except Exception:
+            logger.debug("Closing a fan-out subscription failed", exc_info=True)
+
+    async def _sender(self) -> None:
+        while True:
+            payload = await self._queue.get()
+            try:
+                await self._client.publish(self.channel, payload)
+            except Exception:
+                self.errors += 1
+                logger.warning("Fan-out publish failed", exc_info=True)
+
+    def _send(self, payload: bytes) -> None:
+        self._queue.put_nowait(payload)
+
+def create_fanout_bus(deliver: Callable[[MessageRow], Any]) -> FanoutBus:
+    """Build the fan-out bus configured by FANOUT_BUS_BACKEND."""
+    backend = os.getenv("FANOUT_BUS_BACKEND", "local").lower()
+    if backend == "local":
+        return LocalFanoutBus(deliver)
+    if backend == "unix":
+        return UnixSocketFanoutBus(deliver, os.getenv("FANOUT_SOCKET_DIR", "/tmp/messenger-fanout"))
+    if backend == "redis":
+        try:
+            import redis.asyncio as redis
+        except ImportError as e:
+            raise RuntimeError("FANOUT_BUS_BACKEND=redis requires the redis package") from e
+        client = redis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379/0"))
+        return RedisFanoutBus(deliver, client, channel=os.getenv("FANOUT_CHANNEL", "messenger:fanout"))
+    raise ValueError(f"Unknown FANOUT_BUS_BACKEND: {backend}")
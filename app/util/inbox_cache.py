@@ -0,0 +1,198 @@
+"""
+Per-user inbox caches for the Messenger application.
+
+Each entry holds the first page of a user's inbox (ConversationRows as
+returned by ConversationModel.get_user_conversations, most recent first).
+The send path updates cached entries in place, so opening the app becomes a
+memory lookup. Backends are selected with INBOX_CACHE_BACKEND:
+
+- memory (default): a bounded in-process LRU; entries expire after
+  INBOX_CACHE_TTL seconds (30 by default), since sends handled by other
+  workers do not update them
+- redis: any Redis-compatible server at REDIS_URL (needs the redis package)
+- none: caching disabled
+"""
+import json
+import logging
+import os
+import uuid
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from app.db.rows import ConversationRow
+from app.util.cache import LRUCache
+from app.util.util import to_epoch_ms
+
+logger = logging.getLogger(__name__)
+
+def merge_inbox_entry(conversations: List[ConversationRow], entry: ConversationRow, page_size: int) -> List[ConversationRow]:
+    """
+    Return a copy of an inbox page with entry moved (or added) to its recency position.
+    """
+    updated = [c for c in conversations if c.conversation_id != entry.conversation_id]
+    entry_ms = to_epoch_ms(entry.last_updated)
+    index = 0
+    while index < len(updated) and to_epoch_ms(updated[index].last_updated) > entry_ms:
+        index += 1
+    updated.insert(index, entry)
+    return updated[:page_size]
+
+class InboxCache(ABC):
+    """Cache of the first inbox page per user."""
+
+    def __init__(self, page_size: int):
+        self.page_size = page_size
+
+    @abstractmethod
+    async def get(self, user_id: str) -> Optional[List[ConversationRow]]:
+        """Return the cached first page for user_id, or None."""
+
+    @abstractmethod
+    async def set(self, user_id: str, conversations: List[ConversationRow]) -> None:
+        """Cache the first page (at most page_size conversations) for user_id."""
+
+    @abstractmethod
+    async def update(self, user_id: str, entry: ConversationRow) -> None:
+        """Move entry to its position in user_id's cached page, if the page is cached."""
+
+    @abstractmethod
+    async def invalidate(self, user_id: str) -> None:
+        """Drop user_id's cached page."""
+
+    def stats(self) -> Dict[str, int]:
+        return {}
+
+class NullInboxCache(InboxCache):
+    """Caching disabled."""
+
+    async def get(self, user_id: str) -> Optional[List[ConversationRow]]:
+        return None
+
+    async def set(self, user_id: str, conversations: List[ConversationRow]) -> None:
+        pass
+
+    async def update(self, user_id: str, entry: ConversationRow) -> None:
+        pass
+
+    async def invalidate(self, user_id: str) -> None:
+        pass
+
+class MemoryInboxCache(InboxCache):
+    """Bounded in-process LRU of inbox pages."""
+
+    def __init__(self, page_size: int, maxsize: int = 100000, ttl: Optional[float] = 30):
+        super().__init__(page_size)
+        self._cache = LRUCache(maxsize=maxsize, ttl=ttl)
+
+    async def get(self, user_id: str) -> Optional[List[ConversationRow]]:
+        return self._cache.get(user_id)
+
+    async def set(self, user_id: str, conversations: List[ConversationRow]) -> None:
+        self._cache.set(user_id, list(conversations[:self.page_size]))
+
+    async def update(self, user_id: str, entry: ConversationRow) -> None:
+        cached = self._cache.peek(user_id)
+        if cached is not None:
+            # Keeps the entry's expiry, so sends handled by other workers show up within the TTL
+            self._cache.replace(user_id, merge_inbox_entry(cached, entry, self.page_size))
+
+    async def invalidate(self, user_id: str) -> None:
+        self._cache.pop(user_id)
+
+    def stats(self) -> Dict[str, int]:
+        return self._cache.stats()
+
+class RedisInboxCache(InboxCache):
+    """
+    Inbox pages stored as JSON in a Redis-compatible server.
+
+    client is anything with awaitable get(key), set(key, value, ex=seconds)
+    and delete(key), such as redis.asyncio.Redis or an in-memory fake.
+    Updates are read-modify-write; a lost race only costs freshness until
+    the next update or the TTL. Backend errors are logged and treated as
+    misses so the database stays the source of truth.
+    """
+
+    def __init__(self, client: Any, page_size: int, ttl: int = 300, prefix: str = "inbox:v2:"):
+        super().__init__(page_size)
+        self._client = client
+        self.ttl = ttl
+        self.prefix = prefix
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    # Each conversation is stored as a JSON array in ConversationRow field order
+    @staticmethod
+    def _dumps(conversations: List[ConversationRow]) -> str:
+        return json.dumps([
+            [str(c.conversation_id), str(c.user_id), str(c.other_user_id), c.last_message, c.last_updated.isoformat()]
+            for c in conversations
+        ])
+
+    @staticmethod
+    def _loads(raw: Any) -> List[ConversationRow]:
+        return [
+            ConversationRow(uuid.UUID(conversation_id), uuid.UUID(user_id), uuid.UUID(other_user_id), last_message, datetime.fromisoformat(last_updated))
+            for conversation_id, user_id, other_user_id, last_message, last_updated in json.loads(raw)
+        ]
+
+    async def get(self, user_id: str) -> Optional[List[ConversationRow]]:
+        try:
+            raw = await self._client.get(self.prefix + user_id)
+        except Exception:
+            self.errors += 1
+            logger.warning("Inbox cache get failed", exc_info=True)
+            return None
+        if raw is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return self._loads(raw)
+
+    async def set(self, user_id: str, conversations: List[ConversationRow]) -> None:
+        try:
+            await self._client.set(self.prefix + user_id, self._dumps(conversations[:self.page_size]), ex=self.ttl)
+        except Exception:
+            self.errors += 1
+            logger.warning("Inbox cache set failed", exc_info=True)
+
+    async def update(self, user_id: str, entry: ConversationRow) -> None:
+        try:
+            raw = await self._client.get(self.prefix + user_id)
+            if raw is not None:
+                updated = merge_inbox_entry(self._loads(raw), entry, self.page_size)
+                await self._client.set(self.prefix + user_id, self._dumps(updated), ex=self.ttl)
+        except Exception:
+            self.errors += 1
+            logger.warning("Inbox cache update failed; invalidating", exc_info=True)
+            await self.invalidate(user_id)
+
+    async def invalidate(self, user_id: str) -> None:
+        try:
+            await self._client.delete(self.prefix + user_id)
+        except Exception:
+            self.errors += 1
+            logger.warning("Inbox cache invalidate failed", exc_info=True)
+
+    def stats(self) -> Dict[str, int]:
+        return {'hits': self.hits, 'misses': self.misses, 'errors': self.errors}
+
+def create_inbox_cache(page_size: int) -> InboxCache:
+    """Build the inbox cache configured by INBOX_CACHE_BACKEND."""
+    backend = os.getenv("INBOX_CACHE_BACKEND", "memory").lower()
+    # A worker's memory cache never sees sends handled by other workers, so its entries expire sooner
+    ttl = int(os.getenv("INBOX_CACHE_TTL", "30" if backend == "memory" else "300"))
+    if backend == "none":
+        return NullInboxCache(page_size)
+    if backend == "memory":
+        return MemoryInboxCache(page_size, maxsize=int(os.getenv("INBOX_CACHE_MAX_USERS", "100000")), ttl=ttl)
+    if backend == "redis":
+        try:
+            import redis.asyncio as redis
+        except ImportError as e:
+            raise RuntimeError("INBOX_CACHE_BACKEND=redis requires the redis package") from e
+        client = redis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379/0"))
+        return RedisInboxCache(client, page_size, ttl=ttl)
+    raise ValueError(f"Unknown INBOX_CACHE_BACKEND: {backend}")
@@ -0,0 +1,119 @@
+"""
+Structured, sampled logging for the data path.
+
+get_logger(name) returns a SampledLogger: events are written as
+"event key=value ..." and only formatted if they are actually emitted.
+DEBUG and INFO events are sampled at a per-logger rate configured with
+LOG_SAMPLE_RATES, e.g. "app.db.cassandra_client=0.01,app.models=0.1"
+(the longest matching logger-name prefix wins). Warnings and errors are
+never sampled.
+
+RequestStats accumulates per-request database work (queries, rows, time)
+in a context variable, so a single summary line can be logged per request
+instead of one line per query.
+"""
+import contextvars
+import logging
+import os
+import random
+import time
+from typing import Any, Dict, Optional
+
+def _parse_sample_rates(spec: str) -> Dict[str, float]:
+    rates = {}
+    for item in spec.split(","):
+        name, sep, rate = item.strip().partition("=")
+        if sep:
+            rates[name.strip()] = max(0.0, min(1.0, float(rate)))
+    return rates
+
+_SAMPLE_RATES = _parse_sample_rates(os.getenv("LOG_SAMPLE_RATES", ""))
+
+def sample_rate_for(name: str) -> float:
+    """Sampling rate for a logger name: the longest configured prefix, else 1.0."""
+    best, rate = -1, 1.0
+    for prefix, value in _SAMPLE_RATES.items():
+        if (name == prefix or name.startswith(prefix + ".")) and len(prefix) > best:
+            best, rate = len(prefix), value
+    return rate
+
+class _Event:
+    """Deferred "event key=value ..." message; only rendered when a handler formats it."""
+
+    __slots__ = ("event", "fields")
+
+    def __init__(self, event: str, fields: Dict[str, Any]):
+        self.event = event
+        self.fields = fields
+
+    def __str__(self) -> str:
+        if not self.fields:
+            return self.event
+        return self.event + " " + " ".join(f"{key}={value}" for key, value in self.fields.items())
+
+class SampledLogger:
+    """Thin wrapper over a stdlib logger adding structured events and sampling."""
+
+    def __init__(self, name: str, sample_rate: Optional[float] = None):
+        self.logger = logging.getLogger(name)
+        self.sample_rate = sample_rate_for(name) if sample_rate is None else sample_rate
+
+    def isEnabledFor(self, level: int) -> bool:
+        return self.logger.isEnabledFor(level)
+
+    def _should_log(self, level: int) -> bool:
+        if not self.logger.isEnabledFor(level):
+            return False
+        return level >= logging.WARNING or self.sample_rate >= 1.0 or random.random() < self.sample_rate
+
+    def log(self, level: int, event: str, **fields: Any) -> None:
+        if self._should_log(level):
+            self.logger.log(level, _Event(event, fields), stacklevel=3, extra={'fields': fields})
+
+    def debug(self, event: str, **fields: Any) -> None:
+        self.log(logging.DEBUG, event, **fields)
+
+    def info(self, event: str, **fields: Any) -> None:
+        self.log(logging.INFO, event, **fields)
+
+    def warning(self, event: str, **fields: Any) -> None:
+        self.log(logging.WARNING, event, **fields)
+
+    def error(self, event: str, **fields: Any) -> None:
+        self.log(logging.ERROR, event, **fields)
+
+    def exception(self, event: str, **fields: Any) -> None:
+        self.logger.error(_Event(event, fields), exc_info=True, stacklevel=2, extra={'fields': fields})
+
+def get_logger(name: str) -> SampledLogger:
+    return SampledLogger(name)
+
+class RequestStats:
+    """Database work done on behalf of one request."""
+
+    __slots__ = ("queries", "rows", "db_time", "started")
+
+    def __init__(self):
+        self.queries = 0
+        self.rows = 0
+        self.db_time = 0.0
+        self.started = time.perf_counter()
+
+    def record(self, rows: int, elapsed: float) -> None:
+        self.queries += 1
+        self.rows += rows
+        self.db_time += elapsed
+
+_request_stats: contextvars.ContextVar = contextvars.ContextVar("request_stats", default=None)
+
+def start_request_stats() -> RequestStats:
+    """Begin collecting stats for the current request (task context)."""
+    stats = RequestStats()
+    _request_stats.set(stats)
+    return stats
+
+def record_query(rows: int, elapsed: float) -> None:
+    """Attribute one database round trip to the current request, if any."""
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.record(rows, elapsed)
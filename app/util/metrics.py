@@ -0,0 +1,210 @@
+"""
+In-process metrics for the Messenger application, exported in the
+Prometheus text exposition format at /metrics.
+
+Metrics are registered once at import time. Each labelled child (one per
+route, statement, ...) is created on first use and cached, so the hot path
+is a dict lookup plus a few integer updates: histogram buckets are
+pre-allocated lists and no label dicts are built per observation.
+"""
+import re
+import threading
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+# Seconds; covers cache hits (sub-millisecond) up to slow cross-DC queries
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)) + "}"
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class _Metric:
+    """A metric family: one child per distinct tuple of label values."""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values: str):
+        """Return the child for these label values, creating it on first use."""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _samples(self, values: Tuple[str, ...], child) -> Iterable[str]:
+        raise NotImplementedError
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} {self.kind}"
+        for values, child in list(self._children.items()):
+            yield from self._samples(values, child)
+
+class _Value:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1) -> None:
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1) -> None:
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+class Counter(_Metric):
+    """Monotonically increasing count."""
+
+    kind = "counter"
+
+    def _new_child(self) -> _Value:
+        return _Value()
+
+    def _samples(self, values, child):
+        yield f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.value)}"
+
+class Gauge(Counter):
+    """Value that can go up and down."""
+
+    kind = "gauge"
+
+class _HistogramChild:
+    __slots__ = ("upper_bounds", "counts", "sum", "_lock")
+
+    def __init__(self, upper_bounds: Tuple[float, ...]):
+        self.upper_bounds = upper_bounds
+        # One slot per bucket plus +Inf; cumulated only when rendered
+        self.counts = [0] * (len(upper_bounds) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        index = bisect_left(self.upper_bounds, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+class Histogram(_Metric):
+    """Distribution of observations over fixed, pre-allocated buckets."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self) -> _HistogramChild:
+        return _HistogramChild(self.buckets)
+
+    def _samples(self, values, child):
+        counts, total = list(child.counts), child.sum
+        names = self.labelnames + ("le",)
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += count
+            yield f"{self.name}_bucket{_format_labels(names, values + (_format_value(bound),))} {cumulative}"
+        labels = _format_labels(self.labelnames, values)
+        yield f"{self.name}_sum{labels} {_format_value(total)}"
+        yield f"{self.name}_count{labels} {cumulative}"
+
+_CACHE_COUNTERS = ("hits", "misses", "evictions", "errors")
+
+class Registry:
+    """Metric families plus cache stats read at scrape time."""
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        self._caches: Dict[str, Callable[[], Dict[str, int]]] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def register_cache(self, name: str, stats: Callable[[], Dict[str, int]]) -> None:
+        """Export a cache's stats() dict (hits, misses, entries, ...) under cache="name"."""
+        self._caches[name] = stats
+
+    def _render_caches(self) -> Iterable[str]:
+        families: Dict[str, List[str]] = {}
+        for name, stats in self._caches.items():
+            values = stats()
+            for key, value in values.items():
+                families.setdefault(key, []).append(f'{{cache="{_escape(name)}"}} {value}')
+            lookups = values.get("hits", 0) + values.get("misses", 0)
+            if "hits" in values:
+                ratio = values["hits"] / lookups if lookups else 0.0
+                families.setdefault("hit_ratio", []).append(f'{{cache="{_escape(name)}"}} {ratio}')
+        for key, samples in families.items():
+            kind = "counter" if key in _CACHE_COUNTERS else "gauge"
+            metric = f"messenger_cache_{key}" + ("_total" if kind == "counter" else "")
+            yield f"# TYPE {metric} {kind}"
+            for sample in samples:
+                yield metric + sample
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        lines.extend(self._render_caches())
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+
+def counter(name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+    return REGISTRY.register(Counter(name, documentation, labelnames))
+
+def gauge(name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+    return REGISTRY.register(Gauge(name, documentation, labelnames))
+
+def histogram(name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+    return REGISTRY.register(Histogram(name, documentation, labelnames, buckets))
+
+_STATEMENT_TARGET = re.compile(r"\b(?:FROM|INTO|UPDATE)\s+(\w+)", re.IGNORECASE)
+_statement_names: Dict[str, str] = {}
+
+def name_statements(names: Dict[str, str]) -> None:
+    """Register readable labels for known CQL strings (query -> name)."""
+    _statement_names.update(names)
+
+def statement_name(query: str) -> str:
+    """
+    Low-cardinality label for a CQL statement.
+
+    Registered names are used as is; any other statement is labelled
+    "<verb>_<table>" (e.g. "select_messages"), derived once and memoised.
+    """
+    name = _statement_names.get(query)
+    if name is None:
+        match = _STATEMENT_TARGET.search(query)
+        verb = query.split(None, 1)[0].lower() if query.strip() else "unknown"
+        name = f"{verb}_{match.group(1).lower()}" if match else verb
+        _statement_names[query] = name
+    return name
@@ -0,0 +1,176 @@
+"""
+In-process pub/sub hub for real-time message delivery.
+
+MessageModel publishes every stored message to the fan-out bus, which
+hands it to the hub of every worker (see app.util.fanout). SSE and
+WebSocket connections subscribe to their worker's hub by user (both
+participants receive it) or by conversation. Each message is serialised
+once per publish, not once per subscriber.
+
+Every subscription has a bounded buffer. A subscriber that falls
+REALTIME_QUEUE_SIZE messages behind is closed rather than allowed to grow
+without bound or slow the publisher. The client reconnects with the last
+message_id it saw and the gap is replayed from Cassandra.
+
+Idle subscriptions are kept small: no buffer is allocated until the first
+message arrives, and waiting uses one bare future instead of an
+asyncio.Queue. Not thread-safe: publish and consume on the event loop.
+"""
+import asyncio
+import os
+from collections import deque
+from typing import Dict, NamedTuple, Optional, Set
+
+from app.db.rows import MessageRow
+from app.util.fanout import create_fanout_bus
+from app.util.json_response import render_json
+from app.util.util import to_naive_utc
+
+REALTIME_QUEUE_SIZE = int(os.getenv("REALTIME_QUEUE_SIZE", "64"))
+
+class Event(NamedTuple):
+    message_id: str
+    conversation_id: str
+    # The message as JSON, shared by every subscriber it is delivered to
+    payload: str
+
+def encode_message(message: MessageRow) -> Event:
+    """Build the event for a message as returned by MessageModel."""
+    # Rendered like the REST responses, so created_at has one format whether
+    # the message came from the send path (aware) or Cassandra (naive UTC)
+    payload = render_json({
+        'message_id': message.message_id,
+        'conversation_id': message.conversation_id,
+        'sender_id': message.sender_id,
+        'receiver_id': message.receiver_id,
+        'content': message.content,
+        'created_at': to_naive_utc(message.created_at),
+    }).decode()
+    return Event(str(message.message_id), str(message.conversation_id), payload)
+
+class Subscription:
+    """A connection's view of the hub: a bounded buffer of pending events."""
+
+    __slots__ = ("user_id", "conversation_id", "maxsize", "closed", "overflowed", "_buffer", "_waiter")
+
+    def __init__(self, user_id: Optional[str], conversation_id: Optional[str], maxsize: int):
+        self.user_id = user_id
+        self.conversation_id = conversation_id
+        self.maxsize = maxsize
+        self.closed = False
+        self.overflowed = False
+        self._buffer: Optional[deque] = None
+        self._waiter: Optional[asyncio.Future] = None
+
+    def push(self, event: Event) -> bool:
+        """Queue an event; returns False (and closes the subscription) if the buffer is full."""
+        if self.closed:
+            return False
+        if self._buffer is None:
+            self._buffer = deque()
+        elif len(self._buffer) >= self.maxsize:
+            self.overflowed = True
+            self.close()
+            return False
+        self._buffer.append(event)
+        self._wake()
+        return True
+
+    async def get(self, timeout: Optional[float] = None) -> Optional[Event]:
+        """
+        Next pending event, waiting up to timeout seconds.
+
+        Returns None on timeout or once the subscription is closed and drained.
+        """
+        if not self._buffer and not self.closed:
+            loop = asyncio.get_running_loop()
+            self._waiter = loop.create_future()
+            timer = loop.call_later(timeout, self._wake) if timeout is not None else None
+            try:
+                await self._waiter
+            finally:
+                self._waiter = None
+                if timer is not None:
+                    timer.cancel()
+        if self._buffer and not self.overflowed:
+            event = self._buffer.popleft()
+            if not self._buffer:
+                self._buffer = None  # Give the memory back while idle
+            return event
+        return None
+
+    def close(self) -> None:
+        self.closed = True
+        self._wake()
+
+    def _wake(self) -> None:
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(None)
+
+class Hub:
+    """Routes published messages to subscriptions keyed by user and by conversation."""
+
+    def __init__(self, queue_size: int = REALTIME_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._by_user: Dict[str, Set[Subscription]] = {}
+        self._by_conversation: Dict[str, Set[Subscription]] = {}
+        self.published = 0
+        self.delivered = 0
+        self.overflows = 0
+
+    def subscribe(self, user_id: Optional[str] = None, conversation_id: Optional[str] = None) -> Subscription:
+        """Subscribe to a user's messages (both directions) or to one conversation, by canonical UUID string."""
+        if (user_id is None) == (conversation_id is None):
+            raise ValueError("Subscribe to exactly one of user_id or conversation_id")
+        subscription = Subscription(user_id, conversation_id, self.queue_size)
+        if user_id is not None:
+            self._by_user.setdefault(user_id, set()).add(subscription)
+        else:
+            self._by_conversation.setdefault(conversation_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        subscription.close()
+        index, key = (self._by_user, subscription.user_id) if subscription.user_id is not None else (self._by_conversation, subscription.conversation_id)
+        subscribers = index.get(key)
+        if subscribers is not None:
+            subscribers.discard(subscription)
+            if not subscribers:
+                del index[key]
+
+    def publish(self, message: MessageRow) -> int:
+        """Deliver a stored message to its participants and conversation watchers; returns the number of deliveries."""
+        targets = []
+        # Subscriptions are keyed by canonical (str(uuid.UUID(...))) IDs; callers canonicalize before subscribing
+        for subscribers in (
+            self._by_user.get(str(message.sender_id)),
+            self._by_user.get(str(message.receiver_id)) if message.receiver_id != message.sender_id else None,
+            self._by_conversation.get(str(message.conversation_id)),
+        ):
+            if subscribers:
+                targets.extend(subscribers)
+        self.published += 1
+        if not targets:
+            return 0
+        event = encode_message(message)
+        delivered = 0
+        for subscription in targets:
+            if subscription.push(event):
+                delivered += 1
+            elif subscription.overflowed:
+                self.overflows += 1
+                self.unsubscribe(subscription)
+        self.delivered += delivered
+        return delivered
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'subscriptions': sum(len(s) for s in self._by_user.values()) + sum(len(s) for s in self._by_conversation.values()),
+            'published': self.published,
+            'delivered': self.delivered,
+            'overflows': self.overflows,
+        }
+
+hub = Hub()
+# The send path publishes here; the bus feeds this worker's hub and every other worker's
+bus = create_fanout_bus(hub.publish)
@@ -0,0 +1,195 @@
+"""
+Inverted-index building blocks for message search.
+
+Message text is split into terms (tokenize). For each user and term, the
+index keeps posting lists: the messages containing the term, newest first.
+A posting is the message's timeuuid, packed into one integer (posting_key)
+that sorts like the timeuuid does, plus the conversation it belongs to.
+
+Posting lists are stored in segments of up to a few thousand postings.
+encode_postings stores each posting as the varint gap between its
+timestamp and the previous one, plus a varint index into a small
+dictionary. The dictionary holds the segment's distinct (conversation,
+clock sequence and node) pairs. A posting then takes a few bytes instead
+of the 32 of two UUIDs.
+
+PostingCursor reads one term's segments lazily, and intersect joins
+several cursors (leapfrog), so a query for a rare term and a common one
+skips through the common term's segments instead of decoding all of them.
+Storage and merging of segments are up to the caller
+(see SearchModel in app.models.cassandra_models).
+"""
+import re
+import unicodedata
+import uuid
+from bisect import bisect_right
+from collections import deque
+from typing import Awaitable, Callable, List, Optional, Sequence, Set, Tuple
+
+# Longer "words" (hashes, base64 blobs) are not indexed
+MAX_TERM_LENGTH = 64
+
+_WORD = re.compile(r"\w+")
+_LOW_MASK = (1 << 64) - 1
+_FORMAT = 1
+
+# (posting key, conversation_id)
+Posting = Tuple[int, uuid.UUID]
+
+def tokenize(text: str) -> List[str]:
+    """The terms of text, in order: NFKC-normalized, casefolded runs of letters, digits and underscores."""
+    return [word for word in _WORD.findall(unicodedata.normalize("NFKC", text).casefold()) if len(word) <= MAX_TERM_LENGTH]
+
+def terms(text: str) -> Set[str]:
+    """The distinct terms of text."""
+    return set(tokenize(text))
+
+def posting_key(message_id: uuid.UUID) -> int:
+    """A timeuuid as one integer: its 60-bit timestamp, then its clock sequence and node."""
+    return (message_id.time << 64) | (message_id.int & _LOW_MASK)
+
+def posting_message_id(key: int) -> uuid.UUID:
+    """The timeuuid of a posting key (inverse of posting_key)."""
+    timestamp, low = key >> 64, key & _LOW_MASK
+    return uuid.UUID(fields=(
+        timestamp & 0xffffffff, (timestamp >> 32) & 0xffff, ((timestamp >> 48) & 0x0fff) | 0x1000,
+        low >> 56, (low >> 48) & 0xff, low & 0xffffffffffff,
+    ))
+
+def _put_varint(out: bytearray, value: int) -> None:
+    while value >= 0x80:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+
+def encode_postings(postings: Sequence[Posting]) -> bytes:
+    """
+    Serialize postings, newest first with unique keys, as one segment.
+
+    Layout: format byte, varint count, varint dictionary size, dictionary
+    entries (16-byte conversation_id, 8-byte clock sequence and node), then
+    per posting a varint timestamp (the first absolute, then the gap to the
+    previous one) and a varint dictionary index.
+    """
+    sources = {}
+    body = bytearray()
+    previous = None
+    for key, conversation_id in postings:
+        timestamp = key >> 64
+        _put_varint(body, timestamp if previous is None else previous - timestamp)
+        _put_varint(body, sources.setdefault((conversation_id, key & _LOW_MASK), len(sources)))
+        previous = timestamp
+    out = bytearray((_FORMAT,))
+    _put_varint(out, len(postings))
+    _put_varint(out, len(sources))
+    for conversation_id, low in sources:
+        out += conversation_id.bytes
+        out += low.to_bytes(8, "big")
+    out += body
+    return bytes(out)
+
+def decode_postings(data: bytes) -> Tuple[List[int], List[uuid.UUID]]:
+    """
+    The keys (ascending) and conversation_ids of a segment made by encode_postings.
+    Ascending, so callers can bisect them.
+    """
+    if data[0] != _FORMAT:
+        raise ValueError(f"Unknown posting format {data[0]}")
+    position = 1
+
+    def varint():
+        nonlocal position
+        value = shift = 0
+        while True:
+            byte = data[position]
+            position += 1
+            value |= (byte & 0x7f) << shift
+            if byte < 0x80:
+                return value
+            shift += 7
+
+    count = varint()
+    sources = []
+    for _ in range(varint()):
+        conversation_id = uuid.UUID(bytes=data[position:position + 16])
+        sources.append((conversation_id, int.from_bytes(data[position + 16:position + 24], "big")))
+        position += 24
+    keys = [0] * count
+    conversations = [None] * count
+    timestamp = 0
+    # Stored newest first; filled from the end so the lists come out ascending
+    for index in range(count - 1, -1, -1):
+        gap = varint()
+        timestamp = gap if index == count - 1 else timestamp - gap
+        conversation_id, low = sources[varint()]
+        keys[index] = (timestamp << 64) | low
+        conversations[index] = conversation_id
+    return keys, conversations
+
+# fetch(bound, count): up to count (oldest key, data) segments whose oldest key
+# is <= bound (any, if bound is None), newest first
+Fetch = Callable[[Optional[int], int], Awaitable[List[Tuple[int, bytes]]]]
+
+class PostingCursor:
+    """
+    One term's postings, newest first, over segments that do not overlap.
+
+    Segments are fetched batch at a time, by oldest key. A segment is
+    decoded only if it can hold the posting sought; seek targets only ever
+    decrease, so a segment entirely newer than the target is skipped.
+    """
+
+    def __init__(self, fetch: Fetch, batch: int = 4):
+        self._fetch = fetch
+        self._batch = batch
+        self._segments = deque()
+        self._keys: List[int] = []
+        self._conversations: List[uuid.UUID] = []
+        self._exhausted = False
+        self.segments_read = 0
+
+    async def seek(self, target: Optional[int]) -> Optional[Posting]:
+        """The newest posting with a key <= target (of all, if target is None), or None if there is none."""
+        while True:
+            if self._keys:
+                index = len(self._keys) if target is None else bisect_right(self._keys, target)
+                # Newer postings are never sought again
+                del self._keys[index:]
+                del self._conversations[index:]
+                if index:
+                    return self._keys[-1], self._conversations[-1]
+            if self._segments:
+                oldest, data = self._segments.popleft()
+                if target is None or oldest <= target:
+                    self._keys, self._conversations = decode_postings(data)
+                continue
+            if self._exhausted:
+                return None
+            segments = await self._fetch(target, self._batch)
+            self.segments_read += len(segments)
+            self._exhausted = len(segments) < self._batch
+            self._segments.extend(segments)
+
+async def intersect(cursors: Sequence[PostingCursor], target: Optional[int], limit: int) -> List[Posting]:
+    """
+    Up to limit postings present in every cursor, newest first, with keys <= target (if given).
+
+    Leapfrog join: each cursor in turn seeks to the current candidate, and
+    a cursor that lands below it makes its posting the new candidate, until
+    all of them land on the same one.
+    """
+    hits = []
+    while len(hits) < limit:
+        candidate, agreed, index = target, 0, 0
+        while agreed < len(cursors):
+            posting = await cursors[index].seek(candidate)
+            if posting is None:
+                return hits
+            if posting[0] == candidate:
+                agreed += 1
+            else:
+                candidate, agreed = posting[0], 1
+            index = (index + 1) % len(cursors)
+        hits.append(posting)
+        target = candidate - 1
+    return hits
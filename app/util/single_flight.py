@@ -0,0 +1,64 @@
+"""
+Read coalescing ("single flight") for the model tier.
+
+When a push notification wakes every device of both participants, or a
+client retries in a tight loop, many identical reads arrive at once. The
+first caller runs the read. Callers with the same key that arrive while it
+is in flight wait for that result instead of sending their own query. Once
+the read completes, the next caller starts a new one. A writer calls
+forget(key) so that callers arriving after its write start a new read
+rather than join one that may have missed it.
+
+Waiters share one result object; callers must not mutate it.
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+from app.util.metrics import counter, gauge
+
+CALLS = counter("messenger_single_flight_calls_total", "Reads requested through single flight.", ("group",))
+COLLAPSED = counter("messenger_single_flight_collapsed_total", "Reads served by joining an identical read already in flight.", ("group",))
+IN_FLIGHT = gauge("messenger_single_flight_in_flight", "Distinct reads currently in flight.", ("group",))
+
+class SingleFlight:
+    """
+    Runs at most one read per key at a time and shares its outcome (result or exception) with every concurrent caller.
+
+    The read runs in its own task, so a caller that is cancelled (e.g. the
+    client disconnected) does not cancel it for the others.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._in_flight: Dict[Hashable, asyncio.Future] = {}
+        self._calls = CALLS.labels(name)
+        self._collapsed = COLLAPSED.labels(name)
+        self._in_flight_gauge = IN_FLIGHT.labels(name)
+
+    async def do(self, key: Hashable, read: Callable[[], Awaitable[Any]]) -> Any:
+        """The result of read(), or of the identical read with this key already in flight."""
+        self._calls.inc()
+        task = self._in_flight.get(key)
+        if task is not None:
+            self._collapsed.inc()
+        else:
+            task = asyncio.ensure_future(read())
+            self._in_flight[key] = task
+            self._in_flight_gauge.inc()
+            task.add_done_callback(lambda done: self._done(key, done))
+        return await asyncio.shield(task)
+
+    def forget(self, key: Hashable) -> None:
+        """Make the next caller with this key start a new read; callers already waiting keep the one in flight."""
+        self._in_flight.pop(key, None)
+
+    def _done(self, key: Hashable, task: asyncio.Future) -> None:
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+        self._in_flight_gauge.dec()
+        # Retrieved here so a read whose callers were all cancelled does not log "exception never retrieved"
+        if not task.cancelled():
+            task.exception()
+
+    def __len__(self) -> int:
+        return len(self._in_flight)
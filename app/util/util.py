@@ -1,7 +1,82 @@
 from hashlib import sha256
+import base64
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Tuple
+import struct
 import uuid
 
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
 def generate_conversation_id(user1_id: str, user2_id: str) -> str:
     sorted_ids = sorted([user1_id, user2_id])
     hash_input = (sorted_ids[0] + sorted_ids[1]).encode()
     return str(uuid.UUID(sha256(hash_input).hexdigest()[0:32]))
+
+def to_epoch_ms(value: datetime) -> int:
+    """Milliseconds since the epoch; naive datetimes (as returned by the driver) are treated as UTC."""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return (value - EPOCH) // timedelta(milliseconds=1)
+
+def to_naive_utc(value: datetime) -> datetime:
+    """value as naive UTC, the form the driver returns timestamps in; naive values are taken to be UTC already."""
+    if value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+def truncate_to_ms(value: datetime) -> datetime:
+    """Drop sub-millisecond precision, matching what Cassandra stores for a timestamp column."""
+    return value.replace(microsecond=value.microsecond // 1000 * 1000)
+
+# Start of the UUID v1 (timeuuid) clock, counted in 100ns intervals
+_UUID_EPOCH = datetime(1582, 10, 15, tzinfo=timezone.utc)
+# The Unix epoch on that clock
+_UUID_EPOCH_OFFSET = (EPOCH - _UUID_EPOCH) // timedelta(microseconds=1) * 10
+
+def timeuuid_to_datetime(value: uuid.UUID) -> datetime:
+    """Timestamp embedded in a version 1 UUID, as an aware UTC datetime."""
+    return _UUID_EPOCH + timedelta(microseconds=value.time // 10)
+
+def timeuuid_to_micros(value: uuid.UUID) -> int:
+    """Microseconds since the Unix epoch of a version 1 UUID, e.g. as a CQL write timestamp (USING TIMESTAMP)."""
+    return (value.time - _UUID_EPOCH_OFFSET) // 10
+
+def message_bucket(message_id: uuid.UUID) -> int:
+    """
+    Partition bucket of a message in messages_by_conversation_bucket: the
+    month of its timeuuid, counted from January 1970.
+    """
+    moment = timeuuid_to_datetime(message_id)
+    return (moment.year - 1970) * 12 + moment.month - 1
+
+def encode_inbox_cursor(last_updated: datetime, conversation_id: str) -> str:
+    """Encode the (last_updated, conversation_id) position of an inbox row as a URL-safe cursor."""
+    return f"{to_epoch_ms(last_updated)}_{conversation_id}"
+
+def decode_inbox_cursor(cursor: str) -> Tuple[datetime, uuid.UUID]:
+    """Inverse of encode_inbox_cursor. Raises ValueError for a malformed cursor."""
+    epoch_ms, _, conversation_id = cursor.partition("_")
+    last_updated = EPOCH + timedelta(milliseconds=int(epoch_ms))
+    return last_updated, uuid.UUID(conversation_id)
+
+def encode_bucket_page_token(bucket: int, paging_state: Optional[bytes]) -> str:
+    """Page token of a bucketed read: the bucket to resume in and the driver paging state within it (None: its start)."""
+    return encode_page_token(struct.pack(">i", bucket) + (paging_state or b""))
+
+def decode_bucket_page_token(token: str) -> Tuple[int, Optional[bytes]]:
+    """Inverse of encode_bucket_page_token. Raises ValueError for a malformed token."""
+    raw = decode_page_token(token)
+    if len(raw) < 4:
+        raise ValueError("Invalid page token")
+    return struct.unpack(">i", raw[:4])[0], raw[4:] or None
+
+def encode_page_token(paging_state: bytes) -> str:
+    """Encode a driver paging state as a compact, URL-safe token (unpadded base64url)."""
+    return base64.urlsafe_b64encode(paging_state).rstrip(b"=").decode("ascii")
+
+def decode_page_token(token: str) -> bytes:
+    """Inverse of encode_page_token. Raises ValueError for a malformed token."""
+    try:
+        return base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+    except (TypeError, ValueError, UnicodeEncodeError) as e:
+        raise ValueError("Invalid page token") from e
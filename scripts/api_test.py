@@ -79,7 +79,9 @@ async def test_paginated_conversation():
         logger.info(f"[test_paginated_conversation] First page response: {resp.json()}")
         assert resp.status_code == 200
         data = resp.json()
-        assert data["total"] == 20
+        # total counts the whole conversation, not the page
+        assert data["total"] == 28
+        assert len(data["data"]) == 20
         assert data["limit"] == 20
         assert data["next_cursor"] is not None
         next_cursor = data["next_cursor"]
@@ -88,7 +90,8 @@ async def test_paginated_conversation():
         assert resp2.status_code == 200
         data2 = resp2.json()
         # Will only work once the test is run cause the second time the count will increase by 1 because of other tests writing to the same conversation
-        assert data2["total"] == 8
+        assert data2["total"] == 28
+        assert len(data2["data"]) == 8
         assert data2["next_cursor"] is None or data2["next_cursor"]
         all_msgs = data["data"] + data2["data"]
         contents = [msg["content"] for msg in all_msgs]
@@ -128,4 +131,96 @@ async def test_send_and_retrieve_message():
         logger.info(f"[test_send_and_retrieve_message] GET response: {resp2.json()}")
         assert resp2.status_code == 200
         data2 = resp2.json()
-        assert any(msg["content"] == "Test deterministic message" for msg in data2["data"])
\ No newline at end of file
+        assert any(msg["content"] == "Test deterministic message" for msg in data2["data"])
+@pytest.mark.asyncio
+async def test_bulk_send_messages():
+    # Fresh users so the seeded conversations used by the other tests are untouched
+    alice, bob = str(uuid.uuid4()), str(uuid.uuid4())
+    async with httpx.AsyncClient() as client:
+        payload = [
+            {"sender_id": alice, "receiver_id": bob, "content": "bulk 1"},
+            {"sender_id": "not-a-uuid", "receiver_id": bob, "content": "bulk rejected"},
+            {"sender_id": bob, "receiver_id": alice, "content": "bulk 2"},
+        ]
+        resp = await client.post(f"{API_BASE}/messages/bulk", json=payload)
+        logger.info(f"[test_bulk_send_messages] POST response: {resp.json()}")
+        assert resp.status_code == 200
+        data = resp.json()
+        assert data["created"] == 2
+        assert data["failed"] == 1
+        assert [r["status_code"] for r in data["results"]] == [201, 400, 201]
+        resp2 = await client.get(f"{API_BASE}/messages/conversation/{generate_conversation_id(alice, bob)}")
+        assert [msg["content"] for msg in resp2.json()["data"]] == ["bulk 2", "bulk 1"]
+        resp3 = await client.get(f"{API_BASE}/conversations/user/{alice}")
+        conversations = resp3.json()["data"]
+        assert len(conversations) == 1
+        assert conversations[0]["last_message_content"] == "bulk 2"
+
+@pytest.mark.asyncio
+async def test_batch_get_conversation_messages():
+    async with httpx.AsyncClient() as client:
+        payload = {"requests": [
+            {"conversation_id": CONV_USER1_USER2, "limit": 2},
+            {"conversation_id": EMPTYID},
+            {"conversation_id": "not-a-uuid"},
+        ]}
+        resp = await client.post(f"{API_BASE}/messages/conversations:batchGet", json=payload)
+        logger.info(f"[test_batch_get_conversation_messages] Response: {resp.json()}")
+        assert resp.status_code == 200
+        results = resp.json()["results"]
+        assert [r["conversation_id"] for r in results] == [CONV_USER1_USER2, EMPTYID, "not-a-uuid"]
+        assert [r["status_code"] for r in results] == [200, 200, 400]
+        single = await client.get(f"{API_BASE}/messages/conversation/{CONV_USER1_USER2}", params={"limit": 2})
+        assert results[0]["data"] == single.json()["data"]
+        assert results[1]["data"] == []
+
+@pytest.mark.asyncio
+async def test_read_marker_and_unread_counts():
+    # Fresh users so the seeded conversations used by the other tests are untouched
+    alice, bob = str(uuid.uuid4()), str(uuid.uuid4())
+    conversation_id = generate_conversation_id(alice, bob)
+    async with httpx.AsyncClient() as client:
+        sent = []
+        for i in range(3):
+            resp = await client.post(f"{API_BASE}/messages/", json={"sender_id": alice, "receiver_id": bob, "content": f"unread {i}"})
+            sent.append(resp.json()["message_id"])
+        inbox = (await client.get(f"{API_BASE}/conversations/user/{bob}")).json()["data"]
+        logger.info(f"[test_read_marker_and_unread_counts] Inbox: {inbox}")
+        assert inbox[0]["unread_count"] == 3
+        assert (await client.get(f"{API_BASE}/conversations/user/{alice}")).json()["data"][0]["unread_count"] == 0
+        resp = await client.post(f"{API_BASE}/conversations/{conversation_id}/read", json={"user_id": bob, "message_id": sent[-1]})
+        logger.info(f"[test_read_marker_and_unread_counts] Read response: {resp.json()}")
+        assert resp.status_code == 200
+        assert resp.json()["unread_count"] == 0
+        await client.post(f"{API_BASE}/messages/", json={"sender_id": alice, "receiver_id": bob, "content": "unread 3"})
+        # An older marker, e.g. from another device, does not move the marker back
+        resp = await client.post(f"{API_BASE}/conversations/{conversation_id}/read", json={"user_id": bob, "message_id": sent[0]})
+        assert resp.json()["last_read_message_id"] == sent[-1]
+        assert resp.json()["unread_count"] == 1
+        assert (await client.get(f"{API_BASE}/conversations/user/{bob}")).json()["data"][0]["unread_count"] == 1
+        resp = await client.post(f"{API_BASE}/conversations/{conversation_id}/read", json={"user_id": bob, "message_id": str(uuid.uuid4())})
+        assert resp.status_code == 400
+
+@pytest.mark.asyncio
+async def test_search_messages():
+    alice, bob, carol = str(uuid.uuid4()), str(uuid.uuid4()), str(uuid.uuid4())
+    word = f"zz{uuid.uuid4().hex}"
+    async with httpx.AsyncClient() as client:
+        sent = []
+        for receiver, content in [(bob, f"Lunch {word}?"), (carol, f"{word.upper()} lunch at noon"), (bob, "no match here")]:
+            resp = await client.post(f"{API_BASE}/messages/", json={"sender_id": alice, "receiver_id": receiver, "content": content})
+            sent.append(resp.json()["message_id"])
+        resp = await client.get(f"{API_BASE}/messages/search", params={"user_id": alice, "q": f"lunch {word}"})
+        logger.info(f"[test_search_messages] Response: {resp.json()}")
+        assert resp.status_code == 200
+        assert [m["message_id"] for m in resp.json()["data"]] == [sent[1], sent[0]]
+        # Paging: one hit per page, resuming after the last one
+        first = (await client.get(f"{API_BASE}/messages/search", params={"user_id": alice, "q": word, "limit": 1})).json()
+        assert [m["message_id"] for m in first["data"]] == [sent[1]]
+        second = (await client.get(f"{API_BASE}/messages/search", params={"user_id": alice, "q": word, "limit": 1, "cursor": first["next_cursor"]})).json()
+        assert [m["message_id"] for m in second["data"]] == [sent[0]]
+        # Only the participants' indexes have the message
+        resp = await client.get(f"{API_BASE}/messages/search", params={"user_id": bob, "q": word})
+        assert [m["message_id"] for m in resp.json()["data"]] == [sent[0]]
+        resp = await client.get(f"{API_BASE}/messages/search", params={"user_id": alice, "q": "?!"})
+        assert resp.status_code == 400
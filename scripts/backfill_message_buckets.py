@@ -0,0 +1,59 @@
+"""
+Backfill the bucketed message tables from messages_by_conversation.
+
+Copies every message into messages_by_conversation_bucket and records its
+bucket in message_buckets_by_conversation (see setup_db.migrate_message_buckets).
+Token ranges are scanned in parallel and written with concurrent prepared
+inserts. Progress and throughput are logged as ranges complete. The copy
+is idempotent. Run it once before deploying the bucketed version, and again
+once no instance writes the old table. Until the second run, the bucketed
+readers read a conversation that has no bucket yet from the old table
+(LEGACY_MESSAGE_READS). A conversation that has buckets but also old-table
+messages written by old instances after the first run lacks those
+messages until the second run.
+
+Usage:
+    python scripts/backfill_message_buckets.py --splits 256 --parallel 16 --concurrency 200
+"""
+import argparse
+import logging
+import threading
+import time
+
+from cassandra.cluster import Cluster
+
+from setup_db import CASSANDRA_HOST, CASSANDRA_KEYSPACE, migrate_message_buckets
+
+logger = logging.getLogger(__name__)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--splits", type=int, default=256, help="Token ranges the table is scanned in")
+    parser.add_argument("--parallel", type=int, default=8, help="Token ranges scanned at a time")
+    parser.add_argument("--concurrency", type=int, default=100, help="Inserts in flight per range")
+    args = parser.parse_args()
+
+    cluster = Cluster([CASSANDRA_HOST])
+    session = cluster.connect(CASSANDRA_KEYSPACE)
+    started = time.perf_counter()
+    lock = threading.Lock()
+    done = {"ranges": 0, "rows": 0}
+
+    def progress(rows):
+        with lock:
+            done["ranges"] += 1
+            done["rows"] += rows
+            elapsed = time.perf_counter() - started
+            logger.info(f"{done['ranges']}/{args.splits} ranges, {done['rows']} rows, {done['rows'] / elapsed:,.0f} rows/s")
+
+    try:
+        total = migrate_message_buckets(session, args.splits, args.parallel, args.concurrency, progress)
+        elapsed = time.perf_counter() - started
+        logger.info(f"Done: {total} rows in {elapsed:.1f}s ({total / elapsed:,.0f} rows/s)")
+    finally:
+        cluster.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Build the message search index from the stored messages.
+
+Scans message_buckets_by_conversation by token range and indexes every
+message of each conversation for both participants (SearchModel.index_messages),
+then compacts the search tails of every user it touched. Indexing a
+message again is idempotent, so it is safe to re-run, with the service
+running or not: after loading messages outside the app, or to catch up
+on messages whose index write failed. Progress is logged as ranges complete.
+
+Usage:
+    python scripts/backfill_search_index.py --splits 256 --parallel 16 --compactions 32
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from setup_db import token_ranges
+from app.db.cassandra_client import cassandra_client
+from app.models.cassandra_models import MessageModel, SearchModel
+
+logger = logging.getLogger(__name__)
+
+SELECT_CONVERSATION_RANGE = (
+    "SELECT conversation_id FROM message_buckets_by_conversation "
+    "WHERE token(conversation_id) > ? AND token(conversation_id) <= ?"
+)
+
+
+async def backfill(splits: int, parallel: int, compactions: int, fetch_size: int):
+    started = time.perf_counter()
+    semaphore = asyncio.Semaphore(parallel)
+    users = set()
+    done = {"ranges": 0, "messages": 0}
+
+    async def index_range(token_range):
+        async with semaphore:
+            rows = await cassandra_client.aexecute(SELECT_CONVERSATION_RANGE, token_range)
+            # One row per bucket, a conversation's rows contiguous
+            conversation_ids = list(dict.fromkeys(row['conversation_id'] for row in rows))
+            messages = 0
+            for conversation_id in conversation_ids:
+                async for page in MessageModel.iter_conversation_messages(str(conversation_id), fetch_size=fetch_size):
+                    await SearchModel.index_messages(page, compact=False)
+                    for message in page:
+                        users.update((message.sender_id, message.receiver_id))
+                    messages += len(page)
+        done["ranges"] += 1
+        done["messages"] += messages
+        elapsed = time.perf_counter() - started
+        logger.info(f"{done['ranges']}/{splits} ranges, {done['messages']} messages indexed "
+                    f"({done['messages'] / elapsed:,.0f}/s)")
+
+    await cassandra_client.aconnect()
+    await asyncio.gather(*(index_range(token_range) for token_range in token_ranges(splits)))
+
+    logger.info(f"Compacting the search tails of {len(users)} users...")
+    semaphore = asyncio.Semaphore(compactions)
+    folded = 0
+
+    async def compact(user_id):
+        nonlocal folded
+        async with semaphore:
+            folded += await SearchModel.compact(user_id)
+
+    await asyncio.gather(*(compact(user_id) for user_id in users))
+    logger.info(f"Done: {done['messages']} messages indexed, {folded} tail rows compacted "
+                f"in {time.perf_counter() - started:.1f}s")
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--splits", type=int, default=256, help="Token ranges the bucket index is scanned in")
+    parser.add_argument("--parallel", type=int, default=8, help="Token ranges indexed at a time")
+    parser.add_argument("--compactions", type=int, default=32, help="User tails compacted at a time")
+    parser.add_argument("--fetch-size", type=int, default=1000, help="Messages read per page")
+    args = parser.parse_args()
+    try:
+        asyncio.run(backfill(args.splits, args.parallel, args.compactions, args.fetch_size))
+    finally:
+        cassandra_client.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Concurrency benchmark: blocking CassandraClient.execute() vs awaitable aexecute().
+
+Drives an open-loop mixed read/write workload (fixed arrival rate, at most
+--concurrency queries in flight) from a single event loop against the
+in-process Cassandra stand-in (scripts/fake_cassandra.py) and reports
+throughput and latency percentiles for both execution paths. Latency is
+measured from each operation's scheduled arrival, so time spent waiting on a
+blocked event loop is included.
+
+Usage:
+    python scripts/bench_async_execute.py --ops 2000 --rate 1500 --concurrency 200
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fake_cassandra
+
+fake_cassandra.install()
+
+from app.db.cassandra_client import cassandra_client  # noqa: E402
+
+from app.models.cassandra_models import INSERT_MESSAGE, SELECT_LATEST_MESSAGES  # noqa: E402
+from app.util.util import message_bucket  # noqa: E402
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def run(mode: str, ops: int, rate: float, concurrency: int, read_ratio: float, seed: int):
+    rng = random.Random(seed)
+    plan = [rng.random() < read_ratio for _ in range(ops)]
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+    loop = asyncio.get_running_loop()
+    origin = loop.time()
+
+    async def one(index: int, is_read: bool):
+        arrival = origin + index / rate
+        await asyncio.sleep(max(0.0, arrival - loop.time()))
+        async with semaphore:
+            if is_read:
+                query, params = SELECT_LATEST_MESSAGES, (uuid.uuid4(), message_bucket(uuid.uuid1()), 20)
+            else:
+                message_id = uuid.uuid1()
+                query, params = INSERT_MESSAGE, (uuid.uuid4(), message_bucket(message_id), message_id, uuid.uuid4(), uuid.uuid4(), 'x', datetime.now(timezone.utc))
+            if mode == "blocking":
+                cassandra_client.execute(query, params)
+            else:
+                await cassandra_client.aexecute(query, params)
+            latencies.append(loop.time() - arrival)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(index, is_read) for index, is_read in enumerate(plan)))
+    elapsed = time.perf_counter() - started
+    return elapsed, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--ops", type=int, default=2000)
+    parser.add_argument("--rate", type=float, default=1500.0, help="arrivals per second")
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--read-ratio", type=float, default=0.7)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    print(f"ops={args.ops} rate={args.rate:.0f}/s concurrency={args.concurrency} read_ratio={args.read_ratio}")
+    print(f"{'mode':<10} {'ops/s':>10} {'p50 ms':>10} {'p99 ms':>10} {'max ms':>10}")
+    for mode in ("blocking", "async"):
+        elapsed, latencies = asyncio.run(run(mode, args.ops, args.rate, args.concurrency, args.read_ratio, args.seed))
+        print(f"{mode:<10} {args.ops / elapsed:>10.0f} "
+              f"{percentile(latencies, 50) * 1000:>10.2f} "
+              f"{percentile(latencies, 99) * 1000:>10.2f} "
+              f"{max(latencies) * 1000:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
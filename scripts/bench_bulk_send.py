@@ -0,0 +1,87 @@
+"""
+Bulk send benchmark: N x POST /api/messages/ vs one POST /api/messages/bulk.
+
+Drives the FastAPI app in-process (httpx ASGI transport) against the
+in-process Cassandra stand-in (scripts/fake_cassandra.py) with its default
+read/write latency model. Messages are spread over --conversations
+conversations, like a bot or migration job replaying traffic. Single sends
+are issued --concurrency at a time, the way a well-behaved client would.
+
+Usage:
+    python scripts/bench_bulk_send.py --messages 1000 --conversations 50
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fake_cassandra
+
+fake_cassandra.install()
+
+import httpx  # noqa: E402
+from app.main import app  # noqa: E402
+
+
+def make_payloads(messages: int, conversations: int, seed: int):
+    rng = random.Random(seed)
+    pairs = [(str(uuid.uuid4()), str(uuid.uuid4())) for _ in range(conversations)]
+    payloads = []
+    for i in range(messages):
+        sender, receiver = rng.choice(pairs)
+        if rng.random() < 0.5:
+            sender, receiver = receiver, sender
+        payloads.append({"sender_id": sender, "receiver_id": receiver, "content": f"message {i}"})
+    return payloads
+
+
+async def run_single(client, payloads, concurrency: int) -> float:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(payload):
+        async with semaphore:
+            resp = await client.post("/api/messages/", json=payload)
+            assert resp.status_code == 201, resp.text
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(p) for p in payloads))
+    return time.perf_counter() - started
+
+
+async def run_bulk(client, payloads) -> float:
+    started = time.perf_counter()
+    resp = await client.post("/api/messages/bulk", json=payloads)
+    assert resp.status_code == 200 and resp.json()["failed"] == 0, resp.text
+    return time.perf_counter() - started
+
+
+async def main_async(args):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        single = await run_single(client, make_payloads(args.messages, args.conversations, args.seed), args.concurrency)
+        bulk = await run_bulk(client, make_payloads(args.messages, args.conversations, args.seed + 1))
+    print(f"{'mode':<8} {'seconds':>9} {'msg/s':>9}")
+    print(f"{'single':<8} {single:>9.3f} {args.messages / single:>9.0f}")
+    print(f"{'bulk':<8} {bulk:>9.3f} {args.messages / bulk:>9.0f}")
+    print(f"speedup  {single / bulk:.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--messages", type=int, default=1000)
+    parser.add_argument("--conversations", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=8, help="single sends in flight")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
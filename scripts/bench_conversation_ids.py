@@ -0,0 +1,69 @@
+"""
+Conversation ID benchmark: string round trips vs app.util.conversation_ids.
+
+    send       per message, from the request's sender_id/receiver_id strings
+               to the UUIDs bound in the INSERT:
+                 old     generate_conversation_id on the strings, then
+                         uuid.UUID() of the conversation, sender and receiver
+                 new     uuid.UUID() of sender and receiver, then
+                         conversation_id (LRU hit for an active pair)
+    bulk       the conversation IDs of --users users talking to each other
+               (every pair, as data generation does):
+                 old     uuid.UUID(generate_conversation_id(str(a), str(b)))
+                 new     conversation_ids(pairs, use_cache=False)
+
+Usage:
+    python scripts/bench_conversation_ids.py --iterations 200000 --users 300
+"""
+import argparse
+import itertools
+import os
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.util.conversation_ids import conversation_id, conversation_ids  # noqa: E402
+from app.util.util import generate_conversation_id  # noqa: E402
+
+
+def send_old(sender: str, receiver: str):
+    conversation = generate_conversation_id(sender, receiver)
+    return uuid.UUID(conversation), uuid.UUID(sender), uuid.UUID(receiver)
+
+
+def send_new(sender: str, receiver: str):
+    sender_id, receiver_id = uuid.UUID(sender), uuid.UUID(receiver)
+    return conversation_id(sender_id, receiver_id), sender_id, receiver_id
+
+
+def timed(fn, *args, iterations=1):
+    started = time.perf_counter()
+    for _ in range(iterations):
+        result = fn(*args)
+    return (time.perf_counter() - started) / iterations, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=200000)
+    parser.add_argument("--users", type=int, default=300)
+    args = parser.parse_args()
+
+    sender, receiver = str(uuid.uuid4()), str(uuid.uuid4())
+    assert send_old(sender, receiver) == send_new(sender, receiver)
+    old, _ = timed(send_old, sender, receiver, iterations=args.iterations)
+    new, _ = timed(send_new, sender, receiver, iterations=args.iterations)
+    print(f"send      old {old * 1e9:7.0f}ns  new {new * 1e9:7.0f}ns  speedup {old / new:.1f}x")
+
+    users = [uuid.uuid4() for _ in range(args.users)]
+    pairs = list(itertools.combinations(users, 2))
+    old, expected = timed(lambda: [uuid.UUID(generate_conversation_id(str(a), str(b))) for a, b in pairs])
+    new, actual = timed(conversation_ids, pairs, False)
+    assert actual == expected
+    print(f"bulk      {len(pairs)} pairs  old {old * 1e9 / len(pairs):7.0f}ns/pair  new {new * 1e9 / len(pairs):7.0f}ns/pair  speedup {old / new:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
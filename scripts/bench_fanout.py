@@ -0,0 +1,132 @@
+"""
+Fan-out bus benchmark: cross-worker delivery of published messages.
+
+One worker publishes --messages messages in bursts of --burst per event-loop
+tick; every other worker records when each message reaches its local
+deliver callback (where the realtime hub would be). Reports deliveries,
+latency percentiles and how many messages each forwarded batch carried.
+
+Backends:
+    unix   --workers separate processes on Unix datagram sockets
+    redis  --workers buses in this process, sharing an in-memory Redis
+           stand-in (scripts/fake_redis.py)
+
+Usage:
+    python scripts/bench_fanout.py --backend unix --workers 4 --messages 20000 --burst 50
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.db.rows import MessageRow  # noqa: E402
+from app.util.fanout import RedisFanoutBus, UnixSocketFanoutBus  # noqa: E402
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))]
+
+
+def make_message(i: int):
+    return MessageRow(uuid.uuid1(), uuid.uuid4(), uuid.uuid4(), uuid.uuid4(), repr(time.time()), datetime.now(timezone.utc))
+
+
+async def publish_all(bus, messages: int, burst: int) -> None:
+    for start in range(0, messages, burst):
+        for i in range(start, min(start + burst, messages)):
+            bus.publish(make_message(i))
+        await asyncio.sleep(0)  # next tick: the burst goes out as one batch
+
+
+def unix_worker(index: int, directory: str, args, ready, go, results) -> None:
+    async def run():
+        latencies = []
+        bus = UnixSocketFanoutBus(lambda m: latencies.append(time.time() - float(m.content)), directory)
+        if index == 0:
+            bus._deliver = lambda m: None
+        await bus.start()
+        ready.release()
+        while not go.is_set():
+            await asyncio.sleep(0.01)
+        if index == 0:
+            await publish_all(bus, args.messages, args.burst)
+        deadline = time.monotonic() + args.drain
+        while time.monotonic() < deadline and (index == 0 or len(latencies) < args.messages):
+            await asyncio.sleep(0.01)
+        results.put((index, latencies, bus.stats()))
+        await bus.close()
+    asyncio.run(run())
+
+
+def run_unix(args):
+    directory = tempfile.mkdtemp(prefix="fanout-bench-")
+    ctx = multiprocessing.get_context("spawn")
+    ready, go, results = ctx.Semaphore(0), ctx.Event(), ctx.Queue()
+    procs = [ctx.Process(target=unix_worker, args=(i, directory, args, ready, go, results)) for i in range(args.workers)]
+    for p in procs:
+        p.start()
+    for _ in procs:
+        ready.acquire()
+    time.sleep(args.peer_refresh_wait)
+    go.set()
+    collected = [results.get() for _ in procs]
+    for p in procs:
+        p.join()
+    return collected
+
+
+def run_redis(args):
+    import fake_redis
+
+    async def run():
+        broker = fake_redis.FakeBroker()
+        latencies = [[] for _ in range(args.workers)]
+        buses = []
+        for i in range(args.workers):
+            deliver = (lambda m: None) if i == 0 else (lambda m, sink=latencies[i]: sink.append(time.time() - float(m.content)))
+            bus = RedisFanoutBus(deliver, fake_redis.FakeRedis(broker))
+            await bus.start()
+            buses.append(bus)
+        await publish_all(buses[0], args.messages, args.burst)
+        deadline = time.monotonic() + args.drain
+        while time.monotonic() < deadline and any(len(l) < args.messages for l in latencies[1:]):
+            await asyncio.sleep(0.01)
+        collected = [(i, latencies[i], bus.stats()) for i, bus in enumerate(buses)]
+        for bus in buses:
+            await bus.close()
+        return collected
+    return asyncio.run(run())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--backend", choices=("unix", "redis"), default="unix")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--burst", type=int, default=50, help="messages published per event-loop tick")
+    parser.add_argument("--drain", type=float, default=5.0, help="seconds to wait for stragglers")
+    args = parser.parse_args()
+    args.peer_refresh_wait = 1.1  # let every worker's peer list include the others
+
+    collected = run_unix(args) if args.backend == "unix" else run_redis(args)
+    collected.sort(key=lambda item: item[0])
+    publisher_stats = collected[0][2]
+    latencies = [l for _, worker_latencies, _ in collected[1:] for l in worker_latencies]
+    expected = args.messages * (args.workers - 1)
+    print(f"backend              {args.backend}, {args.workers} workers")
+    print(f"delivered            {len(latencies)}/{expected}")
+    print(f"batches sent         {publisher_stats['batches']} ({args.messages / max(1, publisher_stats['batches']):.1f} messages/batch)")
+    if latencies:
+        print(f"delivery latency     p50 {percentile(latencies, 50) * 1000:.2f}ms p99 {percentile(latencies, 99) * 1000:.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
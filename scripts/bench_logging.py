@@ -0,0 +1,93 @@
+"""
+Logging overhead benchmark: request throughput with logging on vs. off.
+
+Drives the FastAPI app in-process (httpx ASGI transport) against the
+in-process Cassandra stand-in (scripts/fake_cassandra.py) with zero simulated
+latency, so the numbers are dominated by application CPU. "on" logs at INFO
+to a discarding handler (the per-request summary line is emitted and
+formatted); "off" raises the root level above CRITICAL.
+
+Usage:
+    python scripts/bench_logging.py --requests 3000
+"""
+import argparse
+import asyncio
+import io
+import logging
+import os
+import sys
+import time
+import uuid
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Exercise the database path on every request
+os.environ.setdefault("RECENT_MESSAGES_CACHE_TTL", "0")
+os.environ.setdefault("INBOX_CACHE_BACKEND", "none")
+
+import fake_cassandra
+from app.util.util import message_bucket
+
+SENDER, RECEIVER = uuid.uuid4(), uuid.uuid4()
+CONVERSATION_ID = uuid.uuid4()
+PAGE = [
+    {'message_id': uuid.uuid1(), 'conversation_id': CONVERSATION_ID, 'sender_id': SENDER, 'receiver_id': RECEIVER, 'content': f"message {i}", 'created_at': datetime(2025, 1, 1)}
+    for i in range(20)
+]
+
+
+def responder(query, params, fetch_size, paging_state):
+    if query.startswith("SELECT bucket"):
+        return [{'bucket': message_bucket(PAGE[0]['message_id'])}], None, 0.0
+    if query.startswith("SELECT message_id"):
+        return PAGE, None, 0.0
+    return [], None, 0.0
+
+
+fake_cassandra.install(responder)
+
+import httpx  # noqa: E402
+from app.main import app  # noqa: E402
+from app.util.util import generate_conversation_id  # noqa: E402
+
+
+async def run(requests: int) -> float:
+    conversation_id = generate_conversation_id(str(SENDER), str(RECEIVER))
+    payload = {"sender_id": str(SENDER), "receiver_id": str(RECEIVER), "content": "hello"}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        started = time.perf_counter()
+        for i in range(requests):
+            if i % 4 == 0:
+                resp = await client.post("/api/messages/", json=payload)
+            else:
+                resp = await client.get(f"/api/messages/conversation/{conversation_id}")
+            assert resp.status_code < 300, resp.text
+        return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=3000)
+    args = parser.parse_args()
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    sink = logging.StreamHandler(io.StringIO())
+    sink.setFormatter(logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s"))
+    root.addHandler(sink)
+
+    asyncio.run(run(200))  # warm up
+    print(f"{'logging':<8} {'req/s':>10}")
+    for mode, level in (("off", logging.CRITICAL + 1), ("on", logging.INFO), ("off", logging.CRITICAL + 1), ("on", logging.INFO)):
+        root.setLevel(level)
+        sink.stream.seek(0)
+        sink.stream.truncate()
+        elapsed = asyncio.run(run(args.requests))
+        print(f"{mode:<8} {args.requests / elapsed:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
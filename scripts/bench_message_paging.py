@@ -0,0 +1,148 @@
+"""
+Paging benchmark: offset over-fetch vs driver paging tokens in a long conversation.
+
+Builds a conversation of --messages rows, one a minute (so it spans several
+month buckets), in the in-process Cassandra stand-in (scripts/fake_cassandra.py),
+whose simulated latency grows with the number of rows read, and walks it page
+by page. The "offset" mode reproduces the old get_messages_before_message_id
+on the unbucketed table (LIMIT offset + limit, sliced in Python); the "token"
+mode uses MessageModel.get_messages_before_message_id with page tokens, which
+carry on from one bucket into the next. The token walk is checked to return
+every message once, in order.
+
+Usage:
+    python scripts/bench_message_paging.py --messages 100000 --limit 20
+"""
+import argparse
+import asyncio
+import bisect
+import logging
+import os
+import struct
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fake_cassandra
+from cassandra.util import uuid_from_time
+
+ROW_LATENCY = 0.000002  # simulated server cost per row read
+BASE_LATENCY = 0.0005
+CONVERSATION = []  # newest first, like the clustering order
+BUCKETS = {}  # bucket -> its messages, newest first
+KEYS = {}  # bucket (None: whole conversation) -> negated message_id times, ascending
+
+# The pre-bucketing statement, for the offset mode
+LEGACY_SELECT_MESSAGES_BEFORE = (
+    "SELECT message_id, conversation_id, sender_id, receiver_id, content, created_at FROM messages_by_conversation "
+    "WHERE conversation_id = ? AND message_id < ? ORDER BY message_id DESC LIMIT ?"
+)
+
+
+def responder(query, params, fetch_size, paging_state):
+    if query.startswith("SELECT bucket"):
+        return [{'bucket': bucket} for bucket in sorted(BUCKETS, reverse=True)], None, BASE_LATENCY
+    if "bucket = ?" in query:
+        bucket, cursor = params[1], params[2] if len(params) > 2 else None
+        rows = BUCKETS.get(bucket, [])
+    else:
+        bucket, cursor = None, params[1]
+        rows = CONVERSATION
+    start = bisect.bisect_right(KEYS[bucket], -cursor.time) if "message_id <" in query else 0
+    if "LIMIT" in query:
+        page = rows[start:start + params[-1]]
+        return page, None, BASE_LATENCY + ROW_LATENCY * len(page)
+    offset = struct.unpack(">Q", paging_state)[0] if paging_state else start
+    page = rows[offset:offset + fetch_size]
+    next_offset = offset + len(page)
+    next_state = struct.pack(">Q", next_offset) if next_offset < len(rows) else None
+    return page, next_state, BASE_LATENCY + ROW_LATENCY * len(page)
+
+
+fake_cassandra.install(responder)
+
+from app.db.cassandra_client import cassandra_client  # noqa: E402
+from app.models.cassandra_models import MessageModel  # noqa: E402
+from app.util.util import message_bucket  # noqa: E402
+
+
+def build_conversation(size: int, conversation_id: uuid.UUID):
+    sender, receiver = uuid.uuid4(), uuid.uuid4()
+    start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    for i in reversed(range(size)):
+        created_at = start + timedelta(minutes=i)
+        message_id = uuid_from_time(created_at, node=1, clock_seq=1)
+        CONVERSATION.append({
+            'message_id': message_id,
+            'conversation_id': conversation_id,
+            'sender_id': sender,
+            'receiver_id': receiver,
+            'content': f"message {i}",
+            'created_at': created_at,
+        })
+        BUCKETS.setdefault(message_bucket(message_id), []).append(CONVERSATION[-1])
+    KEYS[None] = [-row['message_id'].time for row in CONVERSATION]
+    for bucket, rows in BUCKETS.items():
+        KEYS[bucket] = [-row['message_id'].time for row in rows]
+
+
+async def offset_page(conversation_id: str, before_message_id: str, page: int, limit: int):
+    """The pre-token implementation: over-fetch offset + limit rows and slice."""
+    offset = (page - 1) * limit
+    params = (uuid.UUID(conversation_id), uuid.UUID(before_message_id), offset + limit)
+    rows = await cassandra_client.aexecute(LEGACY_SELECT_MESSAGES_BEFORE, params)
+    return rows[offset:offset + limit]
+
+
+async def check_token_walk(conversation_id: str, limit: int):
+    """Every message but the newest (the before cursor), once, latest first, in pages of limit."""
+    before = str(CONVERSATION[0]['message_id'])
+    seen, token = [], None
+    while True:
+        page, token = await MessageModel.get_messages_before_message_id(conversation_id, before, limit, token)
+        assert len(page) == limit or token is None, (len(page), token)
+        seen.extend(m.message_id for m in page)
+        if token is None:
+            break
+    assert seen == [row['message_id'] for row in CONVERSATION[1:]], "token walk skipped or repeated messages"
+    print(f"token walk           {len(seen)} messages across {len(BUCKETS)} buckets, in order")
+
+
+async def run(conversation_id: str, limit: int, depths):
+    before = str(CONVERSATION[0]['message_id'])
+    print(f"{'page':>6} {'offset ms':>12} {'token ms':>12}")
+    token = None
+    page = 0
+    for depth in depths:
+        # Walk tokens up to this depth (token paging is sequential by design)
+        while page < depth:
+            start = time.perf_counter()
+            _, token = await MessageModel.get_messages_before_message_id(conversation_id, before, limit, token if page else None)
+            token_ms = (time.perf_counter() - start) * 1000
+            page += 1
+        start = time.perf_counter()
+        await offset_page(conversation_id, before, depth, limit)
+        offset_ms = (time.perf_counter() - start) * 1000
+        print(f"{depth:>6} {offset_ms:>12.2f} {token_ms:>12.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--messages", type=int, default=100000)
+    parser.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    conversation_id = uuid.uuid4()
+    build_conversation(args.messages, conversation_id)
+    max_page = (args.messages - 1) // args.limit
+    depths = sorted({d for d in (1, 10, 50, 100, 500, 1000, 2500, max_page) if d <= max_page})
+    asyncio.run(check_token_walk(str(conversation_id), args.limit))
+    asyncio.run(run(str(conversation_id), args.limit, depths))
+
+
+if __name__ == "__main__":
+    main()
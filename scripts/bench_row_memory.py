@@ -0,0 +1,109 @@
+"""
+Row representation benchmark: dicts vs MessageRow, measured with tracemalloc.
+
+Builds --rows rows of messages_by_conversation (one conversation, two
+participants) from fresh driver-style tuples, the way each page comes off
+the wire, two ways:
+
+    dict   dict_factory, then the per-row dict copy with str() IDs that
+           MessageModel used to make
+    row    app.db.rows.row_factory (MessageRow, shared partition key and
+           participant UUIDs)
+
+Reports memory retained per row once the raw tuples are gone (rows plus
+the values they keep alive), peak memory including the raw pages, build
+time, and how many garbage collections the build set off.
+
+Usage:
+    python scripts/bench_row_memory.py --rows 100000 --page-size 5000
+"""
+import argparse
+import gc
+import os
+import sys
+import time
+import tracemalloc
+import uuid
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cassandra.query import dict_factory  # noqa: E402
+
+from app.db.rows import MessageRow, row_factory  # noqa: E402
+
+OLD_COLUMNS = ["message_id", "sender_id", "receiver_id", "content", "created_at"]
+
+
+def raw_pages(rows: int, page_size: int, with_conversation_id: bool):
+    """Driver-style pages of tuples; every value is a new object, as deserialised."""
+    conversation_id, sender, receiver = uuid.uuid4(), uuid.uuid4(), uuid.uuid4()
+    start = datetime(2025, 1, 1)
+    pages = []
+    for offset in range(0, rows, page_size):
+        page = []
+        for i in range(offset, min(rows, offset + page_size)):
+            a, b = (sender, receiver) if i % 2 else (receiver, sender)
+            values = [uuid.uuid1(), uuid.UUID(int=a.int), uuid.UUID(int=b.int), f"message {i}: see you at eight", start + timedelta(seconds=i)]
+            if with_conversation_id:
+                values.insert(1, uuid.UUID(int=conversation_id.int))
+            page.append(tuple(values))
+        pages.append(page)
+    return str(conversation_id), pages
+
+
+def build_dicts(conversation_id, pages):
+    messages = []
+    for page in pages:
+        rows = dict_factory(OLD_COLUMNS, page)
+        messages.extend(
+            {'message_id': str(row['message_id']), 'conversation_id': conversation_id, 'sender_id': str(row['sender_id']), 'receiver_id': str(row['receiver_id']), 'content': row['content'], 'created_at': row['created_at']}
+            for row in rows
+        )
+    return messages
+
+
+def build_rows(conversation_id, pages):
+    messages = []
+    for page in pages:
+        messages.extend(row_factory(MessageRow._fields, page))
+    return messages
+
+
+def measure(build, rows, page_size, with_conversation_id):
+    gc.collect()
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    # Traced from here, so retained memory includes the values the rows keep alive
+    conversation_id, pages = raw_pages(rows, page_size, with_conversation_id)
+    collections = sum(stat["collections"] for stat in gc.get_stats())
+    started = time.perf_counter()
+    result = build(conversation_id, pages)
+    elapsed = time.perf_counter() - started
+    collections = sum(stat["collections"] for stat in gc.get_stats()) - collections
+    del pages
+    gc.collect()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert len(result) == rows
+    return (current - baseline) / rows, (peak - baseline) / rows, elapsed, collections
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--page-size", type=int, default=5000)
+    args = parser.parse_args()
+
+    print(f"rows                 {args.rows} in pages of {args.page_size}")
+    print(f"{'':<8} {'retained B/row':>15} {'peak B/row':>12} {'ms':>9} {'gc runs':>8}")
+    results = {}
+    for name, build, with_conversation_id in (("dict", build_dicts, False), ("row", build_rows, True)):
+        retained, peak, elapsed, collections = measure(build, args.rows, args.page_size, with_conversation_id)
+        results[name] = retained
+        print(f"{name:<8} {retained:>15.0f} {peak:>12.0f} {elapsed * 1000:>9.1f} {collections:>8}")
+    print(f"retained memory      {results['row'] / results['dict']:.0%} of dict rows")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+Message page serialization benchmark: validated Pydantic path vs direct JSON.
+
+Serialises one page of --page-size messages (as returned by
+MessageModel.get_conversation_messages) to response bytes, two ways:
+
+    pydantic   a MessageResponse per row and a PaginatedMessageResponse,
+               then FastAPI's serialize_response against the route's
+               response_model (re-validation + JSON), as the routes did
+    direct     MessageController.page_json + FastJSONResponse (orjson)
+
+Reports time per page and, from tracemalloc, the peak memory allocated
+while serialising one page (every intermediate model, dict and buffer).
+Both paths must produce the same bytes; the script checks that first.
+
+Usage:
+    python scripts/bench_serialization.py --page-size 100 --iterations 2000
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+import uuid
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fake_cassandra
+
+fake_cassandra.install()
+
+from fastapi.routing import serialize_response  # noqa: E402
+
+from app.api.routes.message_routes import router  # noqa: E402
+from app.controllers.message_controller import MessageController  # noqa: E402
+from app.db.rows import MessageRow  # noqa: E402
+from app.schemas.message import MessageResponse, PaginatedMessageResponse  # noqa: E402
+from app.util.json_response import FastJSONResponse  # noqa: E402
+
+
+def make_page(page_size: int):
+    """MessageRows as returned by MessageModel, newest first."""
+    conversation_id, sender, receiver = uuid.uuid4(), uuid.uuid4(), uuid.uuid4()
+    now = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    return [
+        MessageRow(
+            uuid.uuid1(), conversation_id,
+            sender if i % 2 else receiver, receiver if i % 2 else sender,
+            f"message {i}: the quick brown fox jumps over the lazy dog",
+            now - timedelta(seconds=i, microseconds=i * 1000),
+        )
+        for i in range(page_size)
+    ]
+
+
+def run_sync(coroutine):
+    """Drive a coroutine that never suspends (serialize_response for an async endpoint) without an event loop."""
+    try:
+        coroutine.send(None)
+    except StopIteration as done:
+        return done.value
+    raise RuntimeError("coroutine suspended")
+
+
+def response_field():
+    for route in router.routes:
+        if getattr(route, "path", None) == "/api/messages/conversation/{conversation_id}":
+            return route.response_field
+    raise RuntimeError("message page route not found")
+
+
+def pydantic_path(messages, limit, field):
+    data = [
+        MessageResponse(
+            message_id=str(m.message_id), sender_id=str(m.sender_id), receiver_id=str(m.receiver_id),
+            content=m.content, created_at=m.created_at, conversation_id=str(m.conversation_id),
+        )
+        for m in messages
+    ]
+    page = PaginatedMessageResponse(total=len(data), limit=limit, data=data, next_cursor=str(messages[-1].message_id))
+    return run_sync(serialize_response(field=field, response_content=page, dump_json=True))
+
+
+def direct_path(messages, limit, field):
+    return FastJSONResponse(MessageController.page_json(messages, limit, len(messages))).body
+
+
+def measure(fn, messages, limit, field, iterations):
+    for _ in range(min(200, iterations)):
+        fn(messages, limit, field)
+    started = time.perf_counter()
+    for _ in range(iterations):
+        fn(messages, limit, field)
+    per_page = (time.perf_counter() - started) / iterations
+
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    fn(messages, limit, field)
+    peak = tracemalloc.get_traced_memory()[1] - baseline
+    tracemalloc.stop()
+    return per_page, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--page-size", type=int, default=100)
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+
+    messages = make_page(args.page_size)
+    field = response_field()
+    expected = pydantic_path(messages, args.page_size, field)
+    actual = direct_path(messages, args.page_size, field)
+    assert actual == expected, "direct JSON differs from the validated response"
+
+    print(f"page                 {args.page_size} messages, {len(actual)} bytes of JSON")
+    results = {}
+    for name, fn in (("pydantic", pydantic_path), ("direct", direct_path)):
+        per_page, peak = measure(fn, messages, args.page_size, field, args.iterations)
+        results[name] = per_page
+        print(f"{name:<20} {per_page * 1e6:8.1f}us/page  peak allocated {peak / 1024:7.1f} KiB/page")
+    print(f"speedup              {results['pydantic'] / results['direct']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
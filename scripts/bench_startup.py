@@ -0,0 +1,97 @@
+"""
+Startup benchmark: import time and time to first request.
+
+Each run starts a fresh interpreter that imports app.main, enters the
+FastAPI lifespan and immediately issues requests through the ASGI app,
+recording (from interpreter start):
+
+    import app.main         how long the import takes
+    first liveness          first GET /health/live answered
+    first data request      first GET /api/conversations/user/{id} answered
+    ready                   GET /health/ready first returns 200
+
+By default the app runs against the Cassandra stand-in
+(scripts/fake_cassandra.py) with a simulated cluster connect of
+--connect-delay seconds and --prepare-delay seconds per prepared statement.
+With --real it connects to the cluster configured by CASSANDRA_HOST etc.
+
+Usage:
+    python scripts/bench_startup.py --runs 5 --connect-delay 2 --prepare-delay 0.02
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import statistics
+import subprocess
+import sys
+import time
+import uuid
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def child(args) -> None:
+    """One measured startup; prints its timings as JSON."""
+    began = time.perf_counter()
+    logging.disable(logging.WARNING)
+    if not args.real:
+        import fake_cassandra
+        fake_cassandra.install(
+            fake_cassandra.latency_responder(slow_fraction=0),
+            connect_delay=args.connect_delay, prepare_delay=args.prepare_delay,
+        )
+    import httpx
+    imported = time.perf_counter()
+    from app.main import app
+    timings = {"import": time.perf_counter() - imported}
+
+    async def run():
+        async with app.router.lifespan_context(app):
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+                resp = await client.get("/health/live")
+                assert resp.status_code == 200, resp.text
+                timings["live"] = time.perf_counter() - began
+                resp = await client.get(f"/api/conversations/user/{uuid.uuid4()}")
+                assert resp.status_code == 200, resp.text
+                timings["first_request"] = time.perf_counter() - began
+                while (await client.get("/health/ready")).status_code != 200:
+                    await asyncio.sleep(0.005)
+                timings["ready"] = time.perf_counter() - began
+
+    asyncio.run(run())
+    print(json.dumps(timings))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--connect-delay", type=float, default=2.0, help="simulated cluster connect, seconds")
+    parser.add_argument("--prepare-delay", type=float, default=0.02, help="simulated prepare round trip, seconds")
+    parser.add_argument("--real", action="store_true", help="connect to the configured cluster instead of the stand-in")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(args)
+        return
+
+    command = [sys.executable, os.path.abspath(__file__), "--child",
+               "--connect-delay", str(args.connect_delay), "--prepare-delay", str(args.prepare_delay)]
+    if args.real:
+        command.append("--real")
+    runs = []
+    for _ in range(args.runs):
+        output = subprocess.run(command, check=True, capture_output=True, text=True, cwd=ROOT).stdout
+        runs.append(json.loads(output.strip().splitlines()[-1]))
+
+    print(f"runs                 {args.runs} ({'configured cluster' if args.real else f'stand-in, connect {args.connect_delay}s, prepare {args.prepare_delay}s'})")
+    for key, label in (("import", "import app.main"), ("live", "first liveness"),
+                       ("first_request", "first data request"), ("ready", "ready")):
+        samples = [run[key] for run in runs]
+        print(f"{label:<20} median {statistics.median(samples) * 1000:8.1f}ms  max {max(samples) * 1000:8.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Property test: app.util.conversation_ids gives exactly the IDs of
+generate_conversation_id, for any two users, in either order, with or
+without its cache, and for user IDs spelled non-canonically.
+
+Runs without Cassandra:
+    python -m pytest -q scripts/conversation_id_test.py
+"""
+import os
+import random
+import sys
+import uuid
+from hashlib import sha256
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.util import conversation_ids as service  # noqa: E402
+from app.util.cache import LRUCache  # noqa: E402
+from app.util.util import generate_conversation_id as util_generate_conversation_id  # noqa: E402
+
+SEED = int(os.getenv("CONVERSATION_ID_TEST_SEED", "20251018"))
+EXAMPLES = int(os.getenv("CONVERSATION_ID_TEST_EXAMPLES", "20000"))
+
+def generate_conversation_id(user1_id: str, user2_id: str) -> str:
+    sorted_ids = sorted([user1_id, user2_id])
+    hash_input = (sorted_ids[0] + sorted_ids[1]).encode()
+    return str(uuid.UUID(sha256(hash_input).hexdigest()[0:32]))
+
+def random_user(rng: random.Random) -> uuid.UUID:
+    kind = rng.randrange(6)
+    if kind == 0:
+        return uuid.UUID(int=rng.getrandbits(128), version=4)
+    if kind == 1:
+        return uuid.uuid1(node=rng.getrandbits(48), clock_seq=rng.getrandbits(14))
+    if kind == 2:
+        # Small and huge values: leading and trailing zero / f digits
+        return uuid.UUID(int=rng.choice([0, 1, 2 ** 128 - 1, 2 ** 127, rng.getrandbits(8), 2 ** 128 - 1 - rng.getrandbits(8)]))
+    if kind == 3:
+        # Repeated hex digits, as in the hardcoded test users
+        return uuid.UUID(rng.choice("0123456789abcdef") * 32)
+    return uuid.UUID(int=rng.getrandbits(128))
+
+def random_pair(rng: random.Random):
+    user1_id = random_user(rng)
+    kind = rng.randrange(4)
+    if kind == 0:
+        return user1_id, user1_id
+    if kind == 1:
+        # Same prefix, differing only near the end
+        return user1_id, uuid.UUID(int=user1_id.int ^ (1 << rng.randrange(8)))
+    return user1_id, random_user(rng)
+
+@pytest.fixture
+def pairs():
+    rng = random.Random(SEED)
+    return [random_pair(rng) for _ in range(EXAMPLES)]
+
+@pytest.fixture(autouse=True)
+def small_cache(monkeypatch):
+    # Small enough that the examples keep evicting entries
+    monkeypatch.setattr(service, "conversation_id_cache", LRUCache(maxsize=64))
+
+def test_matches_generate_conversation_id(pairs):
+    for user1_id, user2_id in pairs:
+        expected = generate_conversation_id(str(user1_id), str(user2_id))
+        assert util_generate_conversation_id(str(user1_id), str(user2_id)) == expected
+        assert str(service.conversation_id(user1_id, user2_id)) == expected
+        assert str(service.conversation_id(user2_id, user1_id)) == expected
+
+def test_cached_result_is_identical(pairs):
+    rng = random.Random(SEED + 1)
+    for user1_id, user2_id in pairs[:1000]:
+        first = service.conversation_id(user1_id, user2_id)
+        again = service.conversation_id(*rng.sample([user1_id, user2_id], 2))
+        assert again == first
+        assert again.bytes == first.bytes
+    assert len(service.conversation_id_cache) <= 64
+    assert service.conversation_id_cache.hits >= 1000
+
+@pytest.mark.parametrize("use_cache", [True, False])
+def test_batch_matches_single(pairs, use_cache):
+    rng = random.Random(SEED + 2)
+    # Repeated pairs and users, in both orders, as in bulk sends
+    batch = pairs[:2000] + [pair[::-1] for pair in rng.sample(pairs[:2000], 500)] + rng.sample(pairs[:2000], 500)
+    results = service.conversation_ids(batch, use_cache=use_cache)
+    assert len(results) == len(batch)
+    for (user1_id, user2_id), result in zip(batch, results):
+        assert isinstance(result, uuid.UUID)
+        assert str(result) == generate_conversation_id(str(user1_id), str(user2_id))
+    if not use_cache:
+        assert len(service.conversation_id_cache) == 0
+
+def test_batch_of_nothing():
+    assert service.conversation_ids([]) == []
+
+def spellings(user_id: uuid.UUID):
+    """user_id as clients may send it; all but the first are not canonical."""
+    return [str(user_id), str(user_id).upper(), user_id.hex, user_id.hex.upper(), "{%s}" % user_id, user_id.urn]
+
+def test_non_canonical_input_keeps_its_raw_conversation(pairs):
+    rng = random.Random(SEED + 3)
+    for user1_id, user2_id in pairs[:2000]:
+        user1, user2 = rng.choice(spellings(user1_id)), rng.choice(spellings(user2_id))
+        assert uuid.UUID(user1) == user1_id and uuid.UUID(user2) == user2_id
+        expected = generate_conversation_id(user1, user2)
+        assert str(service.raw_conversation_id(user1, user2)) == expected
+        assert str(service.raw_conversation_id(user2, user1)) == expected
+        if service.is_canonical(user1, user1_id) and service.is_canonical(user2, user2_id):
+            assert str(service.conversation_id(user1_id, user2_id)) == expected
+
+def test_is_canonical():
+    user_id = uuid.uuid4()
+    assert [service.is_canonical(spelling, user_id) for spelling in spellings(user_id)] == [True] + [False] * 5
@@ -0,0 +1,262 @@
+"""
+In-process stand-in for a Cassandra cluster, used by the benchmark scripts.
+
+It mimics the small part of the DataStax driver API that CassandraClient
+relies on (Cluster, Session, ResponseFuture). Responses are produced by a
+pluggable responder and delivered after a simulated latency from a single
+background "IO thread", like the real driver's event loop.
+"""
+import heapq
+import itertools
+import random
+import threading
+import time
+from typing import Any, Callable, List, Optional, Tuple
+
+import cassandra.cluster
+from cassandra.cluster import EXEC_PROFILE_DEFAULT
+from cassandra.query import BatchStatement
+
+# responder(query, params, fetch_size, paging_state) -> (rows as dicts, next_paging_state, latency_seconds)
+Responder = Callable[[str, Any, Optional[int], Optional[bytes]], Tuple[List[Any], Optional[bytes], float]]
+
+
+def latency_responder(read_latency: float = 0.002, write_latency: float = 0.001,
+                      slow_fraction: float = 0.01, slow_latency: float = 0.05,
+                      seed: int = 42) -> Responder:
+    """Responder returning no rows with a read/write latency model and a slow tail."""
+    rng = random.Random(seed)
+    lock = threading.Lock()
+
+    def respond(query, params, fetch_size, paging_state):
+        with lock:
+            jitter = rng.uniform(0.8, 1.2)
+            slow = rng.random() < slow_fraction
+        is_read = query.lstrip().upper().startswith("SELECT")
+        latency = slow_latency if slow else (read_latency if is_read else write_latency) * jitter
+        return [], None, latency
+
+    return respond
+
+
+def _selected_columns(query: str) -> Optional[List[str]]:
+    """Column names of a "SELECT a, b FROM ..." query, or None for anything else."""
+    head, sep, _ = query.partition(" FROM ")
+    if not sep or not head.lstrip().upper().startswith("SELECT "):
+        return None
+    columns = [c.strip() for c in head.lstrip()[7:].split(",")]
+    return None if "*" in columns else columns
+
+
+class _Reactor:
+    """Single background thread firing callbacks at their due time."""
+
+    def __init__(self):
+        self._heap = []
+        self._counter = itertools.count()
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name="fake-cassandra-io", daemon=True)
+        self._thread.start()
+
+    def call_later(self, delay: float, fn: Callable[[], None]) -> None:
+        with self._cond:
+            heapq.heappush(self._heap, (time.perf_counter() + delay, next(self._counter), fn))
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._heap:
+                    self._cond.wait()
+                due, _, fn = self._heap[0]
+                now = time.perf_counter()
+                if due > now:
+                    self._cond.wait(due - now)
+                    continue
+                heapq.heappop(self._heap)
+            fn()
+
+
+class FakeResultSet:
+    def __init__(self, rows, paging_state):
+        self.current_rows = rows
+        self.paging_state = paging_state
+
+    def __iter__(self):
+        return iter(self.current_rows)
+
+
+class FakeResponseFuture:
+    def __init__(self, session, query, params, fetch_size, paging_state):
+        self._session = session
+        self._query = query
+        self._params = params
+        self._fetch_size = fetch_size
+        self._paging_state = paging_state
+        self._callbacks = []
+        self._errbacks = []
+        self._event = threading.Event()
+        self._rows = None
+        self._exception = None
+        self._lock = threading.Lock()
+        self._send()
+
+    def _send(self):
+        try:
+            rows, next_state, latency = self._session.responder(
+                self._query, self._params, self._fetch_size, self._paging_state)
+        except Exception as exc:
+            self._session.reactor.call_later(0, lambda: self._set_exception(exc))
+            return
+        self._session.reactor.call_later(latency, lambda: self._set_result(rows, next_state))
+
+    def _set_result(self, rows, next_state):
+        rows = self._session.make_rows(rows, self._query)
+        with self._lock:
+            self._rows = rows
+            self._paging_state = next_state
+            callbacks = list(self._callbacks)
+        self._event.set()
+        for fn in callbacks:
+            fn(rows)
+
+    def _set_exception(self, exc):
+        with self._lock:
+            self._exception = exc
+            errbacks = list(self._errbacks)
+        self._event.set()
+        for fn in errbacks:
+            fn(exc)
+
+    def add_callbacks(self, callback, errback):
+        with self._lock:
+            self._callbacks.append(callback)
+            self._errbacks.append(errback)
+            done = self._event.is_set()
+        if done:
+            if self._exception is not None:
+                errback(self._exception)
+            else:
+                callback(self._rows)
+
+    @property
+    def has_more_pages(self):
+        return self._paging_state is not None
+
+    def start_fetching_next_page(self):
+        self._event.clear()
+        self._send()
+
+    def result(self):
+        self._event.wait()
+        if self._exception is not None:
+            raise self._exception
+        return FakeResultSet(self._rows, self._paging_state)
+
+
+class FakeBoundStatement:
+    keyspace = None
+    routing_key = None
+    custom_payload = None
+
+    def __init__(self, query_string, values):
+        self.query_string = query_string
+        self.values = values
+        self.fetch_size = None
+
+
+class FakePreparedStatement:
+    def __init__(self, query_string):
+        self.query_string = query_string
+        self.is_idempotent = False
+
+    def bind(self, values):
+        return FakeBoundStatement(self.query_string, tuple(values))
+
+
+class FakeSession:
+    # Simulated round trip for each prepare (the driver blocks the caller for it)
+    prepare_delay = 0.0
+
+    def __init__(self, responder: Responder):
+        self.responder = responder
+        self.reactor = _Reactor()
+        self.row_factory = lambda colnames, rows: rows
+        self.prepare_count = 0
+
+    def prepare(self, query):
+        self.prepare_count += 1
+        if self.prepare_delay:
+            time.sleep(self.prepare_delay)
+        return FakePreparedStatement(query)
+
+    def make_rows(self, rows, query=""):
+        """
+        Run responder rows (dicts) through the configured row factory, like the driver does.
+
+        Columns come in the order the SELECT lists them, as from the driver,
+        so responders need not order their dicts. Columns a responder leaves
+        out are None.
+        """
+        if not rows:
+            return []
+        colnames = _selected_columns(query) or list(rows[0].keys())
+        return self.row_factory(colnames, [tuple(row.get(name) for name in colnames) for row in rows])
+
+    def _query_string(self, statement):
+        if isinstance(statement, BatchStatement):
+            queries = "; ".join(query for _, query, _ in statement._statements_and_parameters)
+            return f"BEGIN BATCH {queries} APPLY BATCH"
+        return getattr(statement, "query_string", statement)
+
+    @staticmethod
+    def _fetch_size(statement):
+        fetch_size = getattr(statement, "fetch_size", None)
+        return fetch_size if isinstance(fetch_size, int) else None
+
+    def execute(self, statement, params=None, paging_state=None, **kwargs):
+        params = getattr(statement, "values", params)
+        fetch_size = self._fetch_size(statement)
+        rows, next_state, latency = self.responder(self._query_string(statement), params, fetch_size, paging_state)
+        time.sleep(latency)
+        return FakeResultSet(self.make_rows(rows, self._query_string(statement)), next_state)
+
+    def execute_async(self, statement, params=None, paging_state=None, **kwargs):
+        params = getattr(statement, "values", params)
+        fetch_size = self._fetch_size(statement)
+        return FakeResponseFuture(self, self._query_string(statement), params, fetch_size, paging_state)
+
+
+class FakeCluster:
+    responder: Responder = staticmethod(latency_responder())
+    # Simulated control connection, topology discovery and pool fill
+    connect_delay = 0.0
+
+    def __init__(self, contact_points=None, *args, **kwargs):
+        self.contact_points = contact_points
+        self.execution_profiles = kwargs.get("execution_profiles") or {}
+
+    def connect(self, keyspace=None):
+        if self.connect_delay:
+            time.sleep(self.connect_delay)
+        session = FakeSession(type(self).responder)
+        default = self.execution_profiles.get(EXEC_PROFILE_DEFAULT)
+        if default is not None:
+            session.row_factory = default.row_factory
+        return session
+
+    def shutdown(self):
+        pass
+
+
+def install(responder: Optional[Responder] = None, connect_delay: float = 0.0, prepare_delay: float = 0.0) -> None:
+    """
+    Replace cassandra.cluster.Cluster with the stand-in.
+
+    Must be called before app.db.cassandra_client is imported.
+    """
+    if responder is not None:
+        FakeCluster.responder = staticmethod(responder)
+    FakeCluster.connect_delay = connect_delay
+    FakeSession.prepare_delay = prepare_delay
+    cassandra.cluster.Cluster = FakeCluster
@@ -0,0 +1,58 @@
+"""
+In-memory stand-in for a Redis server, for benchmarks and local checks.
+
+FakeRedis mimics the parts of redis.asyncio.Redis the app uses: get, set
+(with ex), delete, publish and pubsub().subscribe/listen. Clients created
+on the same FakeBroker share data and channels, like connections to one
+server. Everything runs on the calling event loop.
+"""
+import asyncio
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+
+class FakeBroker:
+    def __init__(self):
+        self.data: Dict[str, Tuple[Any, Optional[float]]] = {}
+        self.channels: Dict[str, List[asyncio.Queue]] = {}
+
+
+class FakePubSub:
+    def __init__(self, broker: FakeBroker):
+        self._broker = broker
+        self._queue: asyncio.Queue = asyncio.Queue()
+
+    async def subscribe(self, channel: str) -> None:
+        self._broker.channels.setdefault(channel, []).append(self._queue)
+        self._queue.put_nowait({"type": "subscribe", "channel": channel, "data": 1})
+
+    async def listen(self):
+        while True:
+            yield await self._queue.get()
+
+
+class FakeRedis:
+    def __init__(self, broker: Optional[FakeBroker] = None):
+        self.broker = broker or FakeBroker()
+
+    async def get(self, key: str):
+        value = self.broker.data.get(key)
+        if value is None or (value[1] is not None and value[1] <= time.monotonic()):
+            return None
+        return value[0]
+
+    async def set(self, key: str, value: Any, ex: Optional[int] = None) -> bool:
+        self.broker.data[key] = (value.encode() if isinstance(value, str) else value, time.monotonic() + ex if ex else None)
+        return True
+
+    async def delete(self, key: str) -> int:
+        return 1 if self.broker.data.pop(key, None) is not None else 0
+
+    async def publish(self, channel: str, data: Any) -> int:
+        queues = self.broker.channels.get(channel, [])
+        for queue in queues:
+            queue.put_nowait({"type": "message", "channel": channel, "data": data})
+        return len(queues)
+
+    def pubsub(self) -> FakePubSub:
+        return FakePubSub(self.broker)
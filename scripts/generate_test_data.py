@@ -1,23 +1,40 @@
 """
 Script to generate test data for the Messenger application.
 This script is a skeleton for students to implement.
+
+Without arguments it writes a small, hardcoded data set with edge cases
+(the one scripts/api_test.py expects). With --scale it synthesises a
+data set of any size for load testing instead; see generate_scale_data.
+
+Usage:
+    python scripts/generate_test_data.py
+    python scripts/generate_test_data.py --scale --users 1000000 --conversations 5000000 --workers 8
 """
 import os
+import sys
 import uuid
+import math
+import time
+import asyncio
+import argparse
 import logging
 import random
+import multiprocessing
+from concurrent.futures import FIRST_EXCEPTION, ProcessPoolExecutor, wait
 from datetime import datetime, timedelta
+from hashlib import sha256
+from typing import Dict, List, NamedTuple, Optional, Tuple
 from cassandra.cluster import Cluster
+from cassandra.util import uuid_from_time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from setup_db import migrate_inbox_by_user, migrate_message_buckets, recount_totals
+from app.util.conversation_ids import conversation_id as generate_conversation_id, conversation_ids
+from app.util.util import message_bucket
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
-from hashlib import sha256
-import uuid
-
-def generate_conversation_id(user1_id: str, user2_id: str) -> str:
-    sorted_ids = sorted([user1_id, user2_id])
-    hash_input = (sorted_ids[0] + sorted_ids[1]).encode()
-    return str(uuid.UUID(sha256(hash_input).hexdigest()[0:32]))
 
 # Cassandra connection settings
 CASSANDRA_HOST = os.getenv("CASSANDRA_HOST", "localhost")
@@ -60,7 +77,7 @@ def generate_test_data(session):
     """, (user3_id, "carol"))
 
     # Deterministic conversation between user1 and user2
-    conversation_id = uuid.UUID(generate_conversation_id(str(user1_id), str(user2_id)))
+    conversation_id = generate_conversation_id(user1_id, user2_id)
     now = datetime(2025, 4, 20, 12, 0, 0)  # Fixed timestamp
 
     # Insert conversation metadata
@@ -79,7 +96,6 @@ def generate_test_data(session):
     """, (user2_id, conversation_id, user1_id, "Hey Bob!", now))
 
     # Insert deterministic messages
-    from cassandra.util import uuid_from_time
     base_time = datetime(2025, 4, 20, 12, 0, 0)
     messages = [
         {
@@ -110,7 +126,7 @@ def generate_test_data(session):
 
     # --- EDGE CASES ---
     # 1. Empty conversation (no messages)
-    empty_convo_id = uuid.UUID(generate_conversation_id(str(user1_id), str(user3_id)))
+    empty_convo_id = generate_conversation_id(user1_id, user3_id)
     empty_convo_time = datetime(2025, 4, 20, 13, 0, 0)
     session.execute("""
         INSERT INTO conversation_metadata (conversation_id, created_at) VALUES (%s, %s)
@@ -125,7 +141,7 @@ def generate_test_data(session):
     """, (user3_id, empty_convo_id, user1_id, None, empty_convo_time))
 
     # 2. Conversation with only one message
-    single_msg_convo_id = uuid.UUID(generate_conversation_id(str(user2_id), str(user3_id)))
+    single_msg_convo_id = generate_conversation_id(user2_id, user3_id)
     single_msg_time = datetime(2025, 4, 20, 14, 0, 0)
     session.execute("""
         INSERT INTO conversation_metadata (conversation_id, created_at) VALUES (%s, %s)
@@ -145,7 +161,7 @@ def generate_test_data(session):
     """, (single_msg_convo_id, msg_id, user2_id, user3_id, "Yo Carol!", single_msg_time))
 
     # 3. Conversation with many messages (pagination)
-    paginated_convo_id = uuid.UUID(generate_conversation_id(str(user1_id), str(user2_id)))
+    paginated_convo_id = generate_conversation_id(user1_id, user2_id)
     paginated_base_time = datetime(2025, 4, 20, 15, 0, 0)
     for i in range(25):
         paginated_msg_time = paginated_base_time + timedelta(minutes=i)
@@ -165,7 +181,7 @@ def generate_test_data(session):
     """, ("Paginated message 25", paginated_base_time + timedelta(minutes=24), user2_id, paginated_convo_id))
 
     # 4. Messages with special/long/empty content in a new convo
-    special_convo_id = uuid.UUID(generate_conversation_id(str(user3_id), str(user1_id)))
+    special_convo_id = generate_conversation_id(user3_id, user1_id)
     special_time = datetime(2025, 4, 20, 16, 0, 0)
     session.execute("""
         INSERT INTO conversation_metadata (conversation_id, created_at) VALUES (%s, %s)
@@ -202,8 +218,320 @@ def generate_test_data(session):
     logger.info("Edge case test data generated.")
     logger.info("Deterministic test data generated.")
 
+# --- Scale mode ---------------------------------------------------------------
+#
+# Users are numbered 0..users-1, and the number is also their popularity
+# rank. Every user starts about 2 * conversations / users conversations.
+# The partner is drawn from a Zipf distribution over ranks, so a few hot
+# users end up in a large share of all conversations. A pair can be drawn
+# from either side, so each pair has one owner, chosen by a hash of the
+# pair, and only the owner's draw is kept. That way a conversation is
+# generated exactly once, with no coordination between workers. Message
+# counts per conversation follow their own Zipf distribution.
+#
+# Everything a user starts is derived from (seed, user number) alone, so
+# the data set does not depend on --workers. The XOR digest printed at the
+# end can be compared across runs.
+
+SCALE_INSERT_USER = "INSERT INTO users (user_id, username) VALUES (?, ?)"
+SCALE_INSERT_MESSAGE = (
+    "INSERT INTO messages_by_conversation_bucket (conversation_id, bucket, message_id, sender_id, receiver_id, content, created_at) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?)"
+)
+SCALE_INSERT_MESSAGE_BUCKET = "INSERT INTO message_buckets_by_conversation (conversation_id, bucket) VALUES (?, ?)"
+# Plain insert: every conversation is generated exactly once, so no IF NOT EXISTS (Paxos) round
+SCALE_INSERT_METADATA = "INSERT INTO conversation_metadata (conversation_id, created_at) VALUES (?, ?)"
+SCALE_INSERT_CONVERSATION_BY_USER = (
+    "INSERT INTO conversations_by_user (user_id, conversation_id, other_user_id, last_message, last_updated) "
+    "VALUES (?, ?, ?, ?, ?)"
+)
+SCALE_INSERT_INBOX_ROW = (
+    "INSERT INTO inbox_by_user (user_id, last_updated, conversation_id, other_user_id, last_message) "
+    "VALUES (?, ?, ?, ?, ?)"
+)
+# Maintained totals. Counters add up: generating into a keyspace that already
+# holds this data set counts it twice (scripts/recount_totals.py repairs that)
+SCALE_ADD_MESSAGE_COUNT = "UPDATE message_counts_by_conversation SET messages = messages + ? WHERE conversation_id = ?"
+SCALE_ADD_CONVERSATION_COUNT = "UPDATE conversation_counts_by_user SET conversations = conversations + ? WHERE user_id = ?"
+
+WORDS = (
+    "hey hi hello ok sure thanks lol yes no maybe tomorrow tonight later now see you at the "
+    "office home lunch dinner meeting call me when are free running late on my way sounds good "
+    "great what about this weekend did get it sent file photo link check out love that haha nice"
+).split()
+
+class ScaleConfig(NamedTuple):
+    users: int
+    conversations: int
+    max_messages: int
+    user_zipf: float
+    message_zipf: float
+    seed: int
+    days: int
+    concurrency: int
+    batch_rows: int
+    dry_run: bool
+
+class ShardResult(NamedTuple):
+    users: int
+    conversations: int
+    messages: int
+    rows: int
+    digest: int
+    # floor(log2(messages)) -> conversations
+    sizes: Dict[int, int]
+
+# Progress counters shared with the parent: [users, conversations, messages, rows]
+_progress = None
+# How much a worker accumulates before touching the shared counters
+_PROGRESS_EVERY_ROWS = 5000
+
+def zipf_rank(u: float, n: int, s: float) -> int:
+    """
+    Rank in [0, n) with P(rank k) roughly proportional to (k + 1) ** -s, for u uniform in [0, 1).
+
+    Inverse CDF of the continuous approximation (a Pareto distribution bounded
+    to [1, n + 1]), so it needs no per-rank table however large n is.
+    """
+    if abs(s - 1.0) < 1e-9:
+        x = math.exp(u * math.log(n + 1))
+    else:
+        x = (1 + u * ((n + 1) ** (1 - s) - 1)) ** (1 / (1 - s))
+    return min(n - 1, int(x) - 1)
+
+def scale_user_id(base: int, number: int) -> uuid.UUID:
+    """Deterministic user_id of user number; base comes from the seed."""
+    return uuid.UUID(int=(base << 64) | number, version=4)
+
+def _owns(user: int, other: int) -> bool:
+    """Whether user is the owner of the pair (user, other); exactly one of the two is."""
+    low, high = (user, other) if user < other else (other, user)
+    mixed = (low * 0x9E3779B97F4A7C15 + high * 0xC2B2AE3D27D4EB4F) & 0xFFFFFFFFFFFFFFFF
+    return (user == low) == (mixed >> 63 == 0)
+
+def _started_conversations(config: ScaleConfig, base: int, user: int):
+    """
+    The conversations user owns, as (conversation_id, other_user, messages), each
+    message a (message_id, sender, receiver, content, created_at) tuple, oldest first.
+    """
+    rng = random.Random((config.seed << 40) ^ user)
+    # Twice the target per user: about half the draws belong to the other side
+    expected = 2 * config.conversations / config.users
+    draws = int(expected) + (rng.random() < expected - int(expected))
+    partners = []
+    for _ in range(draws):
+        other = zipf_rank(rng.random(), config.users, config.user_zipf)
+        if other != user and other not in partners and _owns(user, other):
+            partners.append(other)
+    if not partners:
+        return []
+    user_id = scale_user_id(base, user)
+    other_ids = [scale_user_id(base, other) for other in partners]
+    ids = conversation_ids([(user_id, other_id) for other_id in other_ids], use_cache=False)
+    window_ms = config.days * 86400 * 1000
+    start_ms = (datetime(2025, 1, 1) - datetime(1970, 1, 1)) // timedelta(milliseconds=1)
+    conversations = []
+    for conversation_id, other_id in zip(ids, other_ids):
+        count = zipf_rank(rng.random(), config.max_messages, config.message_zipf) + 1
+        node = rng.getrandbits(48)
+        at_ms = start_ms + rng.randrange(window_ms)
+        messages = []
+        for _ in range(count):
+            # Exponential gaps (minutes on average), at least 1ms apart so message_ids stay ordered
+            at_ms += 1 + int(rng.expovariate(1 / 90000))
+            created_at = datetime(1970, 1, 1) + timedelta(milliseconds=at_ms)
+            message_id = uuid_from_time(at_ms / 1000, node=node, clock_seq=rng.getrandbits(14))
+            sender, receiver = (user_id, other_id) if rng.random() < 0.5 else (other_id, user_id)
+            content = " ".join(rng.choices(WORDS, k=rng.randint(1, 16)))
+            messages.append((message_id, sender, receiver, content, created_at))
+        conversations.append((conversation_id, other_id, messages))
+    return conversations
+
+def _init_scale_worker(progress) -> None:
+    global _progress
+    _progress = progress
+    logging.getLogger("cassandra").setLevel(logging.WARNING)
+
+def _add_progress(counts: List[int]) -> None:
+    with _progress.get_lock():
+        for i, count in enumerate(counts):
+            _progress[i] += count
+    counts[:] = [0] * len(counts)
+
+def generate_scale_shard(config: ScaleConfig, first_user: int, last_user: int) -> ShardResult:
+    """Generate, and unless dry_run write, users first_user..last_user-1 and the conversations they own."""
+    return asyncio.run(_generate_scale_shard(config, first_user, last_user))
+
+async def _generate_scale_shard(config: ScaleConfig, first_user: int, last_user: int) -> ShardResult:
+    from app.db.cassandra_client import cassandra_client
+
+    base = random.Random(config.seed).getrandbits(64)
+    totals = [0, 0, 0, 0]
+    pending = [0, 0, 0, 0]
+    digest = 0
+    sizes: Dict[int, int] = {}
+    # user_id -> conversations started in this shard, written once at the end
+    conversations_per_user: Dict[uuid.UUID, int] = {}
+    semaphore = asyncio.Semaphore(config.concurrency)
+    in_flight = set()
+    failure: List[BaseException] = []
+
+    async def write(coroutine_fn, *args):
+        try:
+            await coroutine_fn(*args)
+        except Exception as e:
+            failure.append(e)
+        finally:
+            semaphore.release()
+
+    async def submit(rows: int, coroutine_fn, *args):
+        """Start one statement or batch once fewer than concurrency are in flight."""
+        pending[3] += rows
+        if config.dry_run:
+            return
+        if failure:
+            raise failure[0]
+        await semaphore.acquire()
+        task = asyncio.ensure_future(write(coroutine_fn, *args))
+        in_flight.add(task)
+        task.add_done_callback(in_flight.discard)
+
+    for user in range(first_user, last_user):
+        user_id = scale_user_id(base, user)
+        await submit(1, cassandra_client.aexecute, SCALE_INSERT_USER, (user_id, f"user{user}"))
+        pending[0] += 1
+        for conversation_id, other_id, messages in _started_conversations(config, base, user):
+            by_bucket: Dict[int, list] = {}
+            for message in messages:
+                bucket = message_bucket(message[0])
+                by_bucket.setdefault(bucket, []).append((conversation_id, bucket, *message))
+            for bucket, params in by_bucket.items():
+                await submit(1, cassandra_client.aexecute, SCALE_INSERT_MESSAGE_BUCKET, (conversation_id, bucket))
+                for i in range(0, len(params), config.batch_rows):
+                    chunk = params[i:i + config.batch_rows]
+                    # Single-partition unlogged batch, as the bulk send path writes
+                    await submit(len(chunk), cassandra_client.aexecute_batch,
+                                 [(SCALE_INSERT_MESSAGE, p) for p in chunk], False)
+            last_id, _, _, last_content, last_at = messages[-1]
+            created_at = messages[0][4]
+            await submit(1, cassandra_client.aexecute, SCALE_INSERT_METADATA, (conversation_id, created_at))
+            await submit(1, cassandra_client.aexecute, SCALE_ADD_MESSAGE_COUNT, (len(messages), conversation_id))
+            for owner, other in ((user_id, other_id), (other_id, user_id)):
+                conversations_per_user[owner] = conversations_per_user.get(owner, 0) + 1
+                await submit(1, cassandra_client.aexecute, SCALE_INSERT_CONVERSATION_BY_USER,
+                             (owner, conversation_id, other, last_content, last_at))
+                await submit(1, cassandra_client.aexecute, SCALE_INSERT_INBOX_ROW,
+                             (owner, last_at, conversation_id, other, last_content))
+            pending[1] += 1
+            pending[2] += len(messages)
+            bucket = len(messages).bit_length() - 1
+            sizes[bucket] = sizes.get(bucket, 0) + 1
+            digest ^= int.from_bytes(sha256(conversation_id.bytes + last_id.bytes + len(messages).to_bytes(4, "big")).digest()[:16], "big")
+        if pending[3] >= _PROGRESS_EVERY_ROWS:
+            totals = [t + p for t, p in zip(totals, pending)]
+            _add_progress(pending)
+    for user_id, count in conversations_per_user.items():
+        await submit(1, cassandra_client.aexecute, SCALE_ADD_CONVERSATION_COUNT, (count, user_id))
+    await asyncio.gather(*in_flight)
+    if failure:
+        raise failure[0]
+    totals = [t + p for t, p in zip(totals, pending)]
+    _add_progress(pending)
+    return ShardResult(*totals, digest, sizes)
+
+def generate_scale_data(config: ScaleConfig, workers: int, report_interval: float = 5.0) -> ShardResult:
+    """
+    Generate a synthetic data set across a pool of worker processes, reporting throughput as it goes.
+
+    Users are split into contiguous shards, several per worker so that
+    shards with hot users do not hold up the run. Each worker has its own
+    driver session and keeps up to config.concurrency prepared statements or
+    batches in flight.
+    """
+    context = multiprocessing.get_context("spawn")
+    progress = context.Array("q", 4)
+    shards = min(config.users, workers * 8)
+    bounds = [config.users * i // shards for i in range(shards + 1)]
+    logger.info(
+        f"Generating {config.users} users and about {config.conversations} conversations "
+        f"on {workers} workers ({shards} shards, seed {config.seed}{', dry run' if config.dry_run else ''})..."
+    )
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                             initializer=_init_scale_worker, initargs=(progress,)) as pool:
+        futures = [pool.submit(generate_scale_shard, config, bounds[i], bounds[i + 1]) for i in range(shards)]
+        last_time, last_messages, last_rows = started, 0, 0
+        while True:
+            done, not_done = wait(futures, timeout=report_interval, return_when=FIRST_EXCEPTION)
+            now = time.perf_counter()
+            users, conversations, messages, rows = progress[:]
+            interval = max(now - last_time, 1e-9)
+            logger.info(
+                f"[{now - started:7.1f}s] users={users} conversations={conversations} messages={messages} "
+                f"rows={rows} ({(messages - last_messages) / interval:,.0f} msg/s, {(rows - last_rows) / interval:,.0f} rows/s)"
+            )
+            last_time, last_messages, last_rows = now, messages, rows
+            if any(f.exception() for f in done):
+                for f in not_done:
+                    f.cancel()
+                raise next(f.exception() for f in done if f.exception())
+            if not not_done:
+                break
+        results = [f.result() for f in futures]
+    elapsed = time.perf_counter() - started
+    sizes: Dict[int, int] = {}
+    digest = 0
+    for result in results:
+        digest ^= result.digest
+        for bucket, count in result.sizes.items():
+            sizes[bucket] = sizes.get(bucket, 0) + count
+    total = ShardResult(
+        sum(r.users for r in results), sum(r.conversations for r in results),
+        sum(r.messages for r in results), sum(r.rows for r in results), digest, sizes
+    )
+    logger.info(
+        f"Generated {total.users} users, {total.conversations} conversations, {total.messages} messages "
+        f"({total.rows} rows) in {elapsed:.1f}s: {total.messages / elapsed:,.0f} msg/s, {total.rows / elapsed:,.0f} rows/s"
+    )
+    for bucket in sorted(sizes):
+        logger.info(f"  conversations with {2 ** bucket:>6}-{2 ** (bucket + 1) - 1:<6} messages: {sizes[bucket]}")
+    logger.info(f"Data set digest: {digest:032x}")
+    return total
+
 def main():
     """Main function to generate test data."""
+    parser = argparse.ArgumentParser(description="Generate test data for the Messenger application.")
+    parser.add_argument("--scale", action="store_true", help="Synthesise a large data set instead of the hardcoded one")
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--conversations", type=int, default=None, help="Approximate total (default: 5 per user)")
+    parser.add_argument("--max-messages", type=int, default=5000, help="Largest conversation")
+    parser.add_argument("--user-zipf", type=float, default=1.1, help="Zipf exponent of user popularity (hot users)")
+    parser.add_argument("--message-zipf", type=float, default=1.6, help="Zipf exponent of conversation sizes")
+    parser.add_argument("--days", type=int, default=90, help="Time span messages are spread over")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--concurrency", type=int, default=128, help="Statements in flight per worker")
+    parser.add_argument("--batch-rows", type=int, default=25, help="Messages per single-partition batch")
+    parser.add_argument("--report-interval", type=float, default=5.0, help="Seconds between progress lines")
+    parser.add_argument("--dry-run", action="store_true", help="Generate without writing (measures the generator, checks the digest)")
+    args = parser.parse_args()
+
+    if args.scale:
+        config = ScaleConfig(
+            users=args.users,
+            conversations=args.conversations if args.conversations is not None else 5 * args.users,
+            max_messages=args.max_messages,
+            user_zipf=args.user_zipf,
+            message_zipf=args.message_zipf,
+            seed=args.seed,
+            days=args.days,
+            concurrency=args.concurrency,
+            batch_rows=args.batch_rows,
+            dry_run=args.dry_run,
+        )
+        generate_scale_data(config, args.workers, args.report_interval)
+        return
+
     cluster = None
     
     try:
@@ -212,6 +540,12 @@ def main():
         
         # Generate test data
         generate_test_data(session)
+        # The recency-ordered inbox is derived from conversations_by_user
+        migrate_inbox_by_user(session)
+        # The hardcoded messages are written in the legacy layout and copied into the bucketed one
+        migrate_message_buckets(session, splits=1, parallel=1)
+        # ...and counted into the maintained totals
+        recount_totals(session, splits=1, parallel=1)
         
         logger.info("Test data generation completed successfully!")
     except Exception as e:
@@ -222,4 +556,4 @@ def main():
             logger.info("Cassandra connection closed")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,183 @@
+"""
+Real-time delivery load test: many idle SSE connections, then a burst of sends.
+
+Opens --connections Server-Sent Events streams (/api/realtime/events, one
+per user), lets them sit idle, then sends --messages messages between random
+pairs of connected users and reports delivery latency and how many
+deliveries arrived.
+
+By default the app runs in this process against the Cassandra stand-in
+(scripts/fake_cassandra.py) and clients are driven straight through ASGI,
+so the reported memory growth per connection covers the server-side cost
+(hub subscription, response task, middleware) plus a small client stub.
+With --url the clients are raw TCP connections to a running server instead;
+pass --server-pid to also report that server's memory growth.
+
+Usage:
+    python scripts/load_test_realtime.py --connections 50000 --messages 2000
+    python scripts/load_test_realtime.py --url http://localhost:6969 --connections 10000 --server-pid 1234
+"""
+import argparse
+import asyncio
+import gc
+import json
+import logging
+import os
+import random
+import sys
+import time
+import uuid
+from urllib.parse import urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def rss_bytes(pid="self") -> int:
+    with open(f"/proc/{pid}/status") as status:
+        for line in status:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) * 1024
+    return 0
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))]
+
+
+class Deliveries:
+    """Collects delivery latency from SSE frames whose content is the send timestamp."""
+
+    def __init__(self):
+        self.latencies = []
+
+    def feed(self, chunk: bytes) -> None:
+        now = time.perf_counter()
+        for frame in chunk.split(b"\n\n"):
+            for line in frame.split(b"\n"):
+                if line.startswith(b"data: {"):
+                    self.latencies.append(now - float(json.loads(line[6:])["content"]))
+
+
+async def open_asgi_stream(app, user_id: str, deliveries: Deliveries, ready: asyncio.Event, disconnect: asyncio.Event):
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET", "scheme": "http",
+        "path": "/api/realtime/events", "raw_path": b"/api/realtime/events", "root_path": "",
+        "query_string": f"user_id={user_id}".encode(), "headers": [(b"host", b"loadtest")],
+        "client": ("127.0.0.1", 0), "server": ("loadtest", 80),
+    }
+    requested = False
+
+    async def receive():
+        nonlocal requested
+        if not requested:
+            requested = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await disconnect.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            ready.set()
+        elif message["type"] == "http.response.body":
+            deliveries.feed(message.get("body", b""))
+
+    await app(scope, receive, send)
+
+
+async def open_tcp_stream(host: str, port: int, user_id: str, deliveries: Deliveries, ready: asyncio.Event, disconnect: asyncio.Event):
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write(f"GET /api/realtime/events?user_id={user_id} HTTP/1.1\r\nHost: {host}\r\nAccept: text/event-stream\r\n\r\n".encode())
+    await writer.drain()
+    await reader.readuntil(b"\r\n\r\n")
+    ready.set()
+    reading = asyncio.ensure_future(reader.read(65536))
+    closing = asyncio.ensure_future(disconnect.wait())
+    while True:
+        done, _ = await asyncio.wait({reading, closing}, return_when=asyncio.FIRST_COMPLETED)
+        if closing in done or not reading.result():
+            break
+        deliveries.feed(reading.result())
+        reading = asyncio.ensure_future(reader.read(65536))
+    reading.cancel()
+    writer.close()
+
+
+async def run(args):
+    deliveries = Deliveries()
+    disconnect = asyncio.Event()
+    users = [str(uuid.uuid4()) for _ in range(args.connections)]
+
+    if args.url:
+        import httpx
+        parts = urlsplit(args.url)
+        host, port = parts.hostname, parts.port or 80
+        client = httpx.AsyncClient(base_url=args.url, timeout=None)
+        open_stream = lambda user_id, ready: open_tcp_stream(host, port, user_id, deliveries, ready, disconnect)
+        pid = args.server_pid
+    else:
+        import fake_cassandra
+        fake_cassandra.install(fake_cassandra.latency_responder(slow_fraction=0))
+        import httpx
+        from app.main import app
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://loadtest", timeout=None)
+        open_stream = lambda user_id, ready: open_asgi_stream(app, user_id, deliveries, ready, disconnect)
+        pid = "self"
+        await client.get("/")  # import and warm everything before measuring
+
+    gc.collect()
+    before = rss_bytes(pid) if pid else 0
+    started = time.perf_counter()
+    tasks, readies = [], []
+    for start in range(0, len(users), 1000):
+        batch = [asyncio.Event() for _ in users[start:start + 1000]]
+        tasks.extend(asyncio.ensure_future(open_stream(u, r)) for u, r in zip(users[start:start + 1000], batch))
+        readies.extend(batch)
+        await asyncio.gather(*(r.wait() for r in batch))
+    connect_seconds = time.perf_counter() - started
+    gc.collect()
+    after = rss_bytes(pid) if pid else 0
+    print(f"connections          {len(users)} in {connect_seconds:.1f}s")
+    if pid:
+        print(f"memory growth        {(after - before) / 2**20:.1f} MiB ({(after - before) / len(users):.0f} bytes/connection)")
+
+    rng = random.Random(args.seed)
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def send_one():
+        sender, receiver = rng.sample(users, 2)
+        async with semaphore:
+            resp = await client.post("/api/messages/", json={"sender_id": sender, "receiver_id": receiver, "content": repr(time.perf_counter())})
+            assert resp.status_code == 201, resp.text
+
+    started = time.perf_counter()
+    await asyncio.gather(*(send_one() for _ in range(args.messages)))
+    await asyncio.sleep(0.5)  # let the last deliveries drain
+    send_seconds = time.perf_counter() - started - 0.5
+    expected = 2 * args.messages
+    print(f"sent                 {args.messages} in {send_seconds:.2f}s ({args.messages / send_seconds:.0f} msg/s)")
+    print(f"delivered            {len(deliveries.latencies)}/{expected}")
+    if deliveries.latencies:
+        print(f"delivery latency     p50 {percentile(deliveries.latencies, 50) * 1000:.1f}ms "
+              f"p99 {percentile(deliveries.latencies, 99) * 1000:.1f}ms")
+
+    disconnect.set()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    await client.aclose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--connections", type=int, default=10000)
+    parser.add_argument("--messages", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=32, help="sends in flight")
+    parser.add_argument("--url", help="run against this server instead of in-process")
+    parser.add_argument("--server-pid", type=int, help="with --url, report this process's memory growth")
+    parser.add_argument("--seed", type=int, default=11)
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""
+Reconcile the maintained totals with the rows they count.
+
+Recounts every conversation's messages (message_counts_by_conversation)
+and every user's conversations (conversation_counts_by_user), and moves
+the counters that are off (see setup_db.recount_totals). Token ranges are
+scanned in parallel; progress and corrections are logged as ranges
+complete. Run it after restoring data or loading it outside the app,
+and from time to time to undo drift (e.g. increments lost in a crash).
+
+Usage:
+    python scripts/recount_totals.py --splits 256 --parallel 16 --concurrency 200
+"""
+import argparse
+import logging
+import threading
+import time
+
+from cassandra.cluster import Cluster
+
+from setup_db import CASSANDRA_HOST, CASSANDRA_KEYSPACE, recount_totals
+
+logger = logging.getLogger(__name__)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--splits", type=int, default=256, help="Token ranges the tables are scanned in")
+    parser.add_argument("--parallel", type=int, default=8, help="Token ranges scanned at a time")
+    parser.add_argument("--concurrency", type=int, default=100, help="Statements in flight per range")
+    args = parser.parse_args()
+
+    cluster = Cluster([CASSANDRA_HOST])
+    session = cluster.connect(CASSANDRA_KEYSPACE)
+    started = time.perf_counter()
+    lock = threading.Lock()
+    done = {"ranges": 0, "checked": 0, "corrected": 0}
+
+    def progress(checked, corrected):
+        with lock:
+            done["ranges"] += 1
+            done["checked"] += checked
+            done["corrected"] += corrected
+            elapsed = time.perf_counter() - started
+            logger.info(f"{done['ranges']}/{args.splits} ranges, {done['checked']} totals checked "
+                        f"({done['checked'] / elapsed:,.0f}/s), {done['corrected']} corrected")
+
+    try:
+        checked, corrected = recount_totals(session, args.splits, args.parallel, args.concurrency, progress)
+        logger.info(f"Done: {checked} totals checked, {corrected} corrected in {time.perf_counter() - started:.1f}s")
+    finally:
+        cluster.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -2,10 +2,18 @@
 Script to initialize Cassandra keyspace and tables for the Messenger application.
 """
 import os
+import sys
 import time
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from cassandra.cluster import Cluster
 from cassandra.auth import PlainTextAuthProvider
+from cassandra.concurrent import execute_concurrent, execute_concurrent_with_args
+from cassandra.query import SimpleStatement
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.util.util import message_bucket
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -68,7 +76,21 @@ def create_tables(session):
             PRIMARY KEY (user_id, conversation_id)
         ) WITH CLUSTERING ORDER BY (conversation_id DESC)
     """)
-    # Messages by conversation
+    # Inbox by user, most recently updated conversation first.
+    # Rows are keyed by last_updated, so a new message deletes the previous row
+    # (looked up through conversations_by_user) and inserts a new one.
+    session.execute("""
+        CREATE TABLE IF NOT EXISTS inbox_by_user (
+            user_id uuid,
+            last_updated timestamp,
+            conversation_id uuid,
+            other_user_id uuid,
+            last_message text,
+            PRIMARY KEY (user_id, last_updated, conversation_id)
+        ) WITH CLUSTERING ORDER BY (last_updated DESC, conversation_id DESC)
+    """)
+    # Messages by conversation, one partition per conversation (legacy layout;
+    # the source of migrate_message_buckets)
     session.execute("""
         CREATE TABLE IF NOT EXISTS messages_by_conversation (
             conversation_id uuid,
@@ -80,6 +102,88 @@ def create_tables(session):
             PRIMARY KEY (conversation_id, message_id)
         ) WITH CLUSTERING ORDER BY (message_id DESC)
     """)
+    # Messages by conversation, one partition per conversation and month
+    # (bucket, see app.util.util.message_bucket), so partitions stay bounded
+    session.execute("""
+        CREATE TABLE IF NOT EXISTS messages_by_conversation_bucket (
+            conversation_id uuid,
+            bucket int,
+            message_id timeuuid,
+            sender_id uuid,
+            receiver_id uuid,
+            content text,
+            created_at timestamp,
+            PRIMARY KEY ((conversation_id, bucket), message_id)
+        ) WITH CLUSTERING ORDER BY (message_id DESC)
+    """)
+    # The buckets each conversation has messages in, newest first
+    session.execute("""
+        CREATE TABLE IF NOT EXISTS message_buckets_by_conversation (
+            conversation_id uuid,
+            bucket int,
+            PRIMARY KEY (conversation_id, bucket)
+        ) WITH CLUSTERING ORDER BY (bucket DESC)
+    """)
+    # Messages each user has received per conversation, for unread badges
+    session.execute("""
+        CREATE TABLE IF NOT EXISTS unread_counts_by_user (
+            user_id uuid,
+            conversation_id uuid,
+            received counter,
+            PRIMARY KEY (user_id, conversation_id)
+        )
+    """)
+    # Where each user has read up to, and the received count at that point
+    session.execute("""
+        CREATE TABLE IF NOT EXISTS read_markers_by_user (
+            user_id uuid,
+            conversation_id uuid,
+            last_read_message_id timeuuid,
+            read_count bigint,
+            PRIMARY KEY (user_id, conversation_id)
+        )
+    """)
+    # Maintained totals for paginated responses (see recount_totals)
+    session.execute("""
+        CREATE TABLE IF NOT EXISTS message_counts_by_conversation (
+            conversation_id uuid PRIMARY KEY,
+            messages counter
+        )
+    """)
+    session.execute("""
+        CREATE TABLE IF NOT EXISTS conversation_counts_by_user (
+            user_id uuid PRIMARY KEY,
+            conversations counter
+        )
+    """)
+    # Message search index (see SearchModel): recent rows not yet compacted,
+    # per-term posting segments, and a compaction lease per user
+    session.execute("""
+        CREATE TABLE IF NOT EXISTS search_tail_by_user (
+            user_id uuid,
+            message_id timeuuid,
+            conversation_id uuid,
+            terms set<text>,
+            PRIMARY KEY (user_id, message_id)
+        ) WITH CLUSTERING ORDER BY (message_id DESC)
+    """)
+    session.execute("""
+        CREATE TABLE IF NOT EXISTS search_segments_by_user (
+            user_id uuid,
+            term text,
+            segment timeuuid,
+            newest timeuuid,
+            postings int,
+            data blob,
+            PRIMARY KEY ((user_id, term), segment)
+        ) WITH CLUSTERING ORDER BY (segment DESC)
+    """)
+    session.execute("""
+        CREATE TABLE IF NOT EXISTS search_compactions_by_user (
+            user_id uuid PRIMARY KEY,
+            owner uuid
+        )
+    """)
     # Conversation metadata
     session.execute("""
         CREATE TABLE IF NOT EXISTS conversation_metadata (
@@ -89,6 +193,189 @@ def create_tables(session):
     """)
     logger.info("Tables created successfully.")
 
+def migrate_inbox_by_user(session, concurrency: int = 100):
+    """
+    Backfill inbox_by_user from conversations_by_user.
+
+    Safe to re-run: rows are keyed by the current last_updated, so re-inserting
+    them is idempotent.
+    """
+    logger.info("Backfilling inbox_by_user from conversations_by_user...")
+    scan = SimpleStatement(
+        "SELECT user_id, conversation_id, other_user_id, last_message, last_updated FROM conversations_by_user",
+        fetch_size=1000
+    )
+    insert = session.prepare(
+        "INSERT INTO inbox_by_user (user_id, last_updated, conversation_id, other_user_id, last_message) "
+        "VALUES (?, ?, ?, ?, ?)"
+    )
+    args = (
+        (row.user_id, row.last_updated, row.conversation_id, row.other_user_id, row.last_message)
+        for row in session.execute(scan)
+        if row.last_updated is not None
+    )
+    results = execute_concurrent_with_args(session, insert, args, concurrency=concurrency, results_generator=True)
+    count = 0
+    for success, result in results:
+        if not success:
+            raise result
+        count += 1
+    logger.info(f"Backfilled {count} inbox rows.")
+
+# Murmur3Partitioner tokens are in (MIN_TOKEN, MAX_TOKEN]
+MIN_TOKEN = -2 ** 63
+MAX_TOKEN = 2 ** 63 - 1
+
+def token_ranges(splits: int):
+    """Split the token ring into splits contiguous (start, end] ranges."""
+    width = (MAX_TOKEN - MIN_TOKEN) // splits
+    bounds = [MIN_TOKEN + width * i for i in range(splits)] + [MAX_TOKEN]
+    return list(zip(bounds, bounds[1:]))
+
+def migrate_message_buckets(session, splits: int = 64, parallel: int = 8, concurrency: int = 100, progress=None):
+    """
+    Backfill messages_by_conversation_bucket and message_buckets_by_conversation
+    from messages_by_conversation.
+
+    The token ring is split into ranges that are scanned in parallel
+    threads (the driver session is thread-safe). Each scan writes its rows
+    with up to concurrency prepared inserts in flight. Safe to re-run:
+    every row keeps its primary key, so rewriting it is idempotent. Run it
+    (again) once no instance writes the old table any more.
+
+    progress, if given, is called with the number of rows copied after each range.
+    """
+    logger.info(f"Backfilling messages_by_conversation_bucket in {splits} token ranges, {parallel} at a time...")
+    scan = session.prepare(
+        "SELECT conversation_id, message_id, sender_id, receiver_id, content, created_at FROM messages_by_conversation "
+        "WHERE token(conversation_id) > ? AND token(conversation_id) <= ?"
+    )
+    scan.fetch_size = 1000
+    insert_message = session.prepare(
+        "INSERT INTO messages_by_conversation_bucket (conversation_id, bucket, message_id, sender_id, receiver_id, content, created_at) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?)"
+    )
+    insert_bucket = session.prepare(
+        "INSERT INTO message_buckets_by_conversation (conversation_id, bucket) VALUES (?, ?)"
+    )
+
+    def statements(start, end):
+        # Rows come partition by partition, so a (conversation, bucket) pair
+        # repeats only within a run of rows: remembering the last one suffices
+        indexed = None
+        for row in session.execute(scan, (start, end)):
+            bucket = message_bucket(row.message_id)
+            if (row.conversation_id, bucket) != indexed:
+                indexed = (row.conversation_id, bucket)
+                yield insert_bucket, indexed
+            yield insert_message, (row.conversation_id, bucket, row.message_id, row.sender_id, row.receiver_id, row.content, row.created_at)
+
+    def copy_range(token_range):
+        copied = 0
+        results = execute_concurrent(session, statements(*token_range), concurrency=concurrency, results_generator=True)
+        for success, result in results:
+            if not success:
+                raise result
+            copied += 1
+        if progress is not None:
+            progress(copied)
+        return copied
+
+    with ThreadPoolExecutor(max_workers=parallel) as pool:
+        total = sum(pool.map(copy_range, token_ranges(splits)))
+    logger.info(f"Backfilled {total} message and bucket index rows.")
+    return total
+
+def recount_totals(session, splits: int = 64, parallel: int = 8, concurrency: int = 100, progress=None):
+    """
+    Reconcile message_counts_by_conversation and conversation_counts_by_user
+    with the rows they count.
+
+    The token ring is split into ranges that are scanned in parallel
+    threads. Conversations are found in message_buckets_by_conversation and
+    each of their bucket partitions is counted by Cassandra (SELECT COUNT(*),
+    one bounded partition at a time). Users' rows in conversations_by_user
+    are counted as they stream past. Each counter is then read and moved by
+    the difference, up to concurrency statements in flight, so a second run
+    changes nothing. A counter written to while its rows are being counted
+    can end up off by those writes; run it when traffic is low.
+
+    progress, if given, is called with (counters checked, counters corrected) after each range.
+    Returns the totals of both.
+    """
+    logger.info(f"Recounting totals in {splits} token ranges, {parallel} at a time...")
+    scan_buckets = session.prepare(
+        "SELECT conversation_id, bucket FROM message_buckets_by_conversation "
+        "WHERE token(conversation_id) > ? AND token(conversation_id) <= ?"
+    )
+    scan_buckets.fetch_size = 5000
+    count_bucket = session.prepare(
+        "SELECT COUNT(*) FROM messages_by_conversation_bucket WHERE conversation_id = ? AND bucket = ?"
+    )
+    scan_users = session.prepare(
+        "SELECT user_id FROM conversations_by_user WHERE token(user_id) > ? AND token(user_id) <= ?"
+    )
+    scan_users.fetch_size = 5000
+    read_messages = session.prepare("SELECT messages FROM message_counts_by_conversation WHERE conversation_id = ?")
+    add_messages = session.prepare("UPDATE message_counts_by_conversation SET messages = messages + ? WHERE conversation_id = ?")
+    read_conversations = session.prepare("SELECT conversations FROM conversation_counts_by_user WHERE user_id = ?")
+    add_conversations = session.prepare("UPDATE conversation_counts_by_user SET conversations = conversations + ? WHERE user_id = ?")
+
+    def run(statement, args):
+        rows = []
+        for success, result in execute_concurrent_with_args(session, statement, args, concurrency=concurrency):
+            if not success:
+                raise result
+            rows.append(result.one())
+        return rows
+
+    def reconcile(actual, read, add):
+        """Move the counter of each key of actual to its value; returns how many were off."""
+        keys = list(actual)
+        stored = run(read, [(key,) for key in keys])
+        corrections = [(actual[key] - ((row[0] or 0) if row else 0), key) for key, row in zip(keys, stored)]
+        corrections = [(delta, key) for delta, key in corrections if delta]
+        if corrections:
+            run(add, corrections)
+        return len(corrections)
+
+    def count_conversations(pairs):
+        actual = {}
+        for (conversation_id, _), row in zip(pairs, run(count_bucket, pairs)):
+            actual[conversation_id] = actual.get(conversation_id, 0) + row[0]
+        return len(actual), reconcile(actual, read_messages, add_messages)
+
+    def recount_range(token_range):
+        checked = corrected = 0
+        # A conversation's buckets are contiguous; chunks end between conversations
+        pairs = []
+        for row in session.execute(scan_buckets, token_range):
+            if len(pairs) >= concurrency and row.conversation_id != pairs[-1][0]:
+                counts = count_conversations(pairs)
+                checked, corrected = checked + counts[0], corrected + counts[1]
+                pairs = []
+            pairs.append((row.conversation_id, row.bucket))
+        if pairs:
+            counts = count_conversations(pairs)
+            checked, corrected = checked + counts[0], corrected + counts[1]
+        users = {}
+        for row in session.execute(scan_users, token_range):
+            if len(users) >= concurrency and row.user_id not in users:
+                checked, corrected = checked + len(users), corrected + reconcile(users, read_conversations, add_conversations)
+                users = {}
+            users[row.user_id] = users.get(row.user_id, 0) + 1
+        if users:
+            checked, corrected = checked + len(users), corrected + reconcile(users, read_conversations, add_conversations)
+        if progress is not None:
+            progress(checked, corrected)
+        return checked, corrected
+
+    with ThreadPoolExecutor(max_workers=parallel) as pool:
+        results = list(pool.map(recount_range, token_ranges(splits)))
+    checked, corrected = sum(r[0] for r in results), sum(r[1] for r in results)
+    logger.info(f"Recounted {checked} totals, corrected {corrected}.")
+    return checked, corrected
+
 def main():
     """Initialize the database."""
     logger.info("Starting Cassandra initialization...")
@@ -104,6 +391,9 @@ def main():
         create_keyspace(session)
         session.set_keyspace(CASSANDRA_KEYSPACE)
         create_tables(session)
+        migrate_inbox_by_user(session)
+        migrate_message_buckets(session)
+        recount_totals(session)
         
         logger.info("Cassandra initialization completed successfully.")
     except Exception as e:
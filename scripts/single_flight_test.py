@@ -0,0 +1,91 @@
+"""
+Test: identical concurrent reads through app.util.single_flight share one
+read, its exceptions included, and a cancelled caller or a forget() does
+not disturb the others.
+
+Runs without Cassandra:
+    python -m pytest -q scripts/single_flight_test.py
+"""
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.util.single_flight import SingleFlight  # noqa: E402
+
+class Reads:
+    """A read function that counts its calls and finishes when released."""
+
+    def __init__(self, result=None, error=None):
+        self.calls = 0
+        self.release = asyncio.Event()
+        self.result = result
+        self.error = error
+
+    async def __call__(self):
+        self.calls += 1
+        call = self.calls
+        await self.release.wait()
+        if self.error is not None:
+            raise self.error
+        return (self.result, call)
+
+def test_concurrent_identical_reads_share_one():
+    async def scenario():
+        flight, reads = SingleFlight("test"), Reads("rows")
+        waiters = [asyncio.ensure_future(flight.do("a", reads)) for _ in range(10)]
+        other = asyncio.ensure_future(flight.do("b", reads))
+        await asyncio.sleep(0)
+        assert len(flight) == 2
+        reads.release.set()
+        results = await asyncio.gather(*waiters)
+        assert reads.calls == 2 and await other in (("rows", 1), ("rows", 2))
+        assert len(set(results)) == 1
+        assert len(flight) == 0
+        # A read after completion is a new read
+        assert await flight.do("a", reads) == ("rows", 3)
+
+    asyncio.run(scenario())
+
+def test_exception_is_shared():
+    async def scenario():
+        flight, reads = SingleFlight("test"), Reads(error=ValueError("boom"))
+        waiters = [asyncio.ensure_future(flight.do("a", reads)) for _ in range(3)]
+        await asyncio.sleep(0)
+        reads.release.set()
+        outcomes = await asyncio.gather(*waiters, return_exceptions=True)
+        assert reads.calls == 1 and all(isinstance(outcome, ValueError) for outcome in outcomes)
+
+    asyncio.run(scenario())
+
+def test_cancelled_caller_does_not_cancel_the_read():
+    async def scenario():
+        flight, reads = SingleFlight("test"), Reads("rows")
+        first = asyncio.ensure_future(flight.do("a", reads))
+        await asyncio.sleep(0)
+        second = asyncio.ensure_future(flight.do("a", reads))
+        await asyncio.sleep(0)
+        first.cancel()
+        reads.release.set()
+        assert await second == ("rows", 1)
+        with pytest.raises(asyncio.CancelledError):
+            await first
+
+    asyncio.run(scenario())
+
+def test_forget_starts_a_new_read_for_later_callers():
+    async def scenario():
+        flight, reads = SingleFlight("test"), Reads("rows")
+        before = asyncio.ensure_future(flight.do("a", reads))
+        await asyncio.sleep(0)
+        flight.forget("a")
+        after = asyncio.ensure_future(flight.do("a", reads))
+        await asyncio.sleep(0)
+        reads.release.set()
+        assert (await before, await after) == (("rows", 1), ("rows", 2))
+        assert len(flight) == 0
+
+    asyncio.run(scenario())